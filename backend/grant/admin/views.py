@@ -18,6 +18,7 @@ from grant.proposal.models import (
     Proposal,
     ProposalArbiter,
     ProposalContribution,
+    ProposalFunding,
     proposals_schema,
     proposal_schema,
     user_proposal_contributions_schema,
@@ -25,6 +26,9 @@ from grant.proposal.models import (
     admin_proposal_contributions_schema,
 )
 from grant.rfp.models import RFP, admin_rfp_schema, admin_rfps_schema
+from grant.search.models import search_filter
+from grant.task.metrics import task_metrics
+from grant.task.models import Task, task_schema, tasks_schema
 from grant.user.models import User, admin_users_schema, admin_user_schema
 from grant.utils import pagination
 from grant.utils.enums import (
@@ -200,7 +204,7 @@ def delete_user(user_id):
 @blueprint.route("/users", methods=["GET"])
 @query(paginated_fields)
 @admin.admin_auth_required
-def get_users(page, filters, search, sort):
+def get_users(page, filters, search, sort, cursor, with_total, estimate_total):
     filters_workaround = request.args.getlist('filters[]')
     page = pagination.user(
         schema=admin_users_schema,
@@ -209,6 +213,9 @@ def get_users(page, filters, search, sort):
         filters=filters_workaround,
         search=search,
         sort=sort,
+        cursor=cursor,
+        with_total=with_total,
+        estimate_total=estimate_total,
     )
     return page
 
@@ -272,9 +279,7 @@ def get_arbiters(search):
     if len(search) < 3:
         error = 'search query must be at least 3 characters long'
     else:
-        users = User.query.filter(
-            User.email_address.ilike(f'%{search}%') | User.display_name.ilike(f'%{search}%')
-        ).order_by(User.display_name).all()
+        users = search_filter(User.query, 'user', User.id, search).order_by(User.display_name).all()
         results = admin_users_schema.dump(users)
 
     return {
@@ -333,7 +338,7 @@ def set_arbiter(proposal_id, user_id):
 @blueprint.route("/proposals", methods=["GET"])
 @query(paginated_fields)
 @admin.admin_auth_required
-def get_proposals(page, filters, search, sort):
+def get_proposals(page, filters, search, sort, cursor, with_total, estimate_total):
     filters_workaround = request.args.getlist('filters[]')
     page = pagination.proposal(
         schema=proposals_schema,
@@ -342,6 +347,9 @@ def get_proposals(page, filters, search, sort):
         filters=filters_workaround,
         search=search,
         sort=sort,
+        cursor=cursor,
+        with_total=with_total,
+        estimate_total=estimate_total,
     )
     return page
 
@@ -587,7 +595,7 @@ def get_email_example(type):
 @blueprint.route("/ccrs", methods=["GET"])
 @query(paginated_fields)
 @admin.admin_auth_required
-def get_ccrs(page, filters, search, sort):
+def get_ccrs(page, filters, search, sort, cursor, with_total, estimate_total):
     filters_workaround = request.args.getlist('filters[]')
     page = pagination.ccr(
         schema=ccrs_schema,
@@ -596,6 +604,9 @@ def get_ccrs(page, filters, search, sort):
         filters=filters_workaround,
         search=search,
         sort=sort,
+        cursor=cursor,
+        with_total=with_total,
+        estimate_total=estimate_total,
     )
     return page
 
@@ -769,7 +780,7 @@ def delete_rfp(rfp_id):
 @blueprint.route('/contributions', methods=['GET'])
 @query(paginated_fields)
 @admin.admin_auth_required
-def get_contributions(page, filters, search, sort):
+def get_contributions(page, filters, search, sort, cursor, with_total, estimate_total):
     filters_workaround = request.args.getlist('filters[]')
     page = pagination.contribution(
         page=page,
@@ -777,6 +788,9 @@ def get_contributions(page, filters, search, sort):
         filters=filters_workaround,
         search=search,
         sort=sort,
+        cursor=cursor,
+        with_total=with_total,
+        estimate_total=estimate_total,
     )
     return page
 
@@ -802,6 +816,7 @@ def create_contribution(proposal_id, user_id, status, amount, tx_id):
 
     db.session.add(contribution)
     db.session.flush()
+    ProposalFunding.refresh(contribution.proposal_id)
 
     # TODO: should this stay?
     contribution.proposal.set_pending_when_ready()
@@ -835,6 +850,7 @@ def edit_contribution(contribution_id, proposal_id, user_id, status, amount, tx_
     if not contribution:
         return {"message": "No contribution matching that id"}, 404
     had_refund = contribution.refund_tx_id
+    old_proposal_id = contribution.proposal_id
 
     # do not allow editing certain fields on contributions once a proposal has become funded
     if (proposal_id or user_id or status or amount or tx_id) and contribution.proposal.is_funded:
@@ -875,6 +891,9 @@ def edit_contribution(contribution_id, proposal_id, user_id, status, amount, tx_
 
     db.session.add(contribution)
     db.session.flush()
+    ProposalFunding.refresh(contribution.proposal_id)
+    if old_proposal_id != contribution.proposal_id:
+        ProposalFunding.refresh(old_proposal_id)
 
     # TODO: should this stay?
     contribution.proposal.set_pending_when_ready()
@@ -889,14 +908,17 @@ def edit_contribution(contribution_id, proposal_id, user_id, status, amount, tx_
 @blueprint.route('/comments', methods=['GET'])
 @body(paginated_fields)
 @admin.admin_auth_required
-def get_comments(page, filters, search, sort):
+def get_comments(page, filters, search, sort, cursor, with_total, estimate_total):
     filters_workaround = request.args.getlist('filters[]')
     page = pagination.comment(
         page=page,
         filters=filters_workaround,
         search=search,
         sort=sort,
-        schema=admin_comments_schema
+        schema=admin_comments_schema,
+        cursor=cursor,
+        with_total=with_total,
+        estimate_total=estimate_total,
     )
     return page
 
@@ -1042,7 +1064,8 @@ def financials():
     def add_str_dec(a: str, b: str):
         return str((Decimal(a) + Decimal(b)).quantize(Decimal('0.001'), rounding=ROUND_HALF_DOWN))
 
-    proposals = Proposal.query.filter_by(version='2')
+    proposals = Proposal.query.filter_by(version='2').all()
+    Proposal.load_funding(proposals)
 
     for p in proposals:
         # CANCELED proposals excluded, though they could have had milestones paid out with grant funds
@@ -1068,3 +1091,39 @@ def financials():
         'payouts': payouts,
         'payouts_by_quarter': payouts_by_quarter
     }
+
+
+# Tasks
+
+@blueprint.route("/tasks/dead", methods=["GET"])
+@admin.admin_auth_required
+def get_dead_tasks():
+    tasks = Task.query.filter_by(dead=True).order_by(Task.id.desc()).all()
+    return tasks_schema.dump(tasks)
+
+
+@blueprint.route("/tasks/metrics", methods=["GET"])
+@query({
+    "hours": fields.Int(required=False, missing=24, validate=validate.Range(min=1))
+})
+@admin.admin_auth_required
+def get_task_metrics(hours):
+    return {
+        "hours": hours,
+        "jobs": task_metrics(datetime.now(), hours),
+    }
+
+
+@blueprint.route("/tasks/<task_id>/requeue", methods=["PUT"])
+@admin.admin_auth_required
+def requeue_task(task_id):
+    task = Task.query.filter_by(id=task_id).first()
+    if not task:
+        return {"message": "No task matching that id"}, 404
+    if not task.dead:
+        return {"message": "Only dead tasks can be requeued"}, 400
+
+    task.requeue()
+    db.session.add(task)
+    db.session.commit()
+    return task_schema.dump(task)
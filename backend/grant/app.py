@@ -2,10 +2,11 @@
 """The app module, containing the app factory function."""
 import logging
 import traceback
+from threading import Thread
 
 import sentry_sdk
 from animal_case import animalify
-from flask import Flask, Response, jsonify, request, current_app, g
+from flask import Flask, Response, jsonify, request, current_app
 from flask_cors import CORS
 from flask_security import SQLAlchemyUserDatastore
 from flask_sslify import SSLify
@@ -24,12 +25,19 @@ from grant import (
     task,
     rfp,
     e2e,
-    home
+    home,
+    search
 )
-from grant.extensions import bcrypt, migrate, db, ma, security, limiter
-from grant.settings import SENTRY_RELEASE, ENV, E2E_TESTING, DEBUG, CORS_DOMAINS
+from grant.email.send import send_queued_emails
+from grant.email.templates import warm_up as warm_up_email_templates
+from grant.extensions import bcrypt, migrate, db, ma, security, limiter, cache
+from grant.settings import SENTRY_RELEASE, ENV, E2E_TESTING, DEBUG, CORS_DOMAINS, TASK_SCHEDULER, \
+    EMAIL_TEMPLATE_WARMUP
+from grant.task.scheduler import start_scheduler
 from grant.utils.auth import AuthException, handle_auth_error, get_authed_user
 from grant.utils.exceptions import ValidationException
+from grant.utils.pagination import PaginationException
+from grant.utils.viewer import clear_viewer_relations
 
 
 class JSONResponse(Response):
@@ -51,16 +59,22 @@ def create_app(config_objects=["grant.settings"]):
 
     @app.after_request
     def send_emails(response):
-        if 'email_sender' in g:
-            # starting email sender
-            g.email_sender.start()
+        send_queued_emails()
         return response
 
+    @app.teardown_request
+    def reset_viewer_relations(exc):
+        clear_viewer_relations()
+
     # Return validation errors
     @app.errorhandler(ValidationException)
     def handle_validation_error(err):
         return jsonify({"message": str(err)}), 400
 
+    @app.errorhandler(PaginationException)
+    def handle_pagination_error(err):
+        return jsonify({"message": str(err)}), 400
+
     @app.errorhandler(422)
     @app.errorhandler(400)
     def handle_error(err):
@@ -119,6 +133,18 @@ def create_app(config_objects=["grant.settings"]):
     # NOTE: testing mode does not honor this handler, and instead returns the generic 500 response
     app.register_error_handler(AuthException, handle_auth_error)
 
+    # started with the first request so CLI commands (migrations) never run tasks
+    if TASK_SCHEDULER and not app.config.get("TESTING"):
+        @app.before_first_request
+        def run_task_scheduler():
+            start_scheduler(app)
+
+    # compiled in the background so no request thread pays for a cold template
+    if EMAIL_TEMPLATE_WARMUP and not app.config.get("TESTING"):
+        @app.before_first_request
+        def warm_email_templates():
+            Thread(target=warm_up_email_templates, name="email-template-warmup", daemon=True).start()
+
     @app.after_request
     def grantio_authed(response):
         response.headers["X-Grantio-Authed"] = 'yes' if get_authed_user() else 'no'
@@ -134,6 +160,7 @@ def register_extensions(app):
     migrate.init_app(app, db)
     ma.init_app(app)
     limiter.init_app(app)
+    cache.init_app(app)
     user_datastore = SQLAlchemyUserDatastore(db, user.models.User, user.models.Role)
     security.init_app(app, datastore=user_datastore, register_blueprint=False)
 
@@ -178,9 +205,20 @@ def register_commands(app):
     app.cli.add_command(commands.clean)
     app.cli.add_command(commands.urls)
     app.cli.add_command(commands.reset_db_chain_data)
+    app.cli.add_command(commands.seed_bulk)
     app.cli.add_command(proposal.commands.create_proposal)
     app.cli.add_command(proposal.commands.create_proposals)
     app.cli.add_command(proposal.commands.retire_v1_proposals)
+    app.cli.add_command(proposal.commands.rebuild_proposal_funding)
     app.cli.add_command(user.commands.set_admin)
     app.cli.add_command(user.commands.mangle_users)
     app.cli.add_command(task.commands.create_task)
+    app.cli.add_command(task.commands.task_worker)
+    app.cli.add_command(task.commands.task_archive)
+    app.cli.add_command(task.commands.task_benchmark)
+    app.cli.add_command(email.commands.email_worker)
+    app.cli.add_command(email.commands.email_benchmark)
+    app.cli.add_command(email.commands.email_warmup)
+    app.cli.add_command(email.commands.email_render_benchmark)
+    app.cli.add_command(search.commands.search_backfill)
+    app.cli.add_command(search.commands.search_benchmark)
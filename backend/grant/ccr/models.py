@@ -4,7 +4,7 @@ from decimal import Decimal
 from sqlalchemy import or_
 from sqlalchemy.ext.hybrid import hybrid_property
 
-from grant.email.send import send_email
+from grant.email.send import send_email, send_fanout_email, get_subscription
 from grant.extensions import ma, db
 from grant.utils.enums import CCRStatus
 from grant.utils.exceptions import ValidationException
@@ -40,6 +40,8 @@ class CCR(db.Model):
     status = db.Column(db.String(255), nullable=False)
     _target = db.Column("target", db.String(255), nullable=True)
     reject_reason = db.Column(db.String())
+    # bumped whenever its detail response changes, see grant.utils.versioning
+    row_version = db.Column(db.Integer(), nullable=False, default=0, server_default=db.text("0"))
 
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
     author = db.relationship("User", back_populates="ccrs")
@@ -117,13 +119,11 @@ class CCR(db.Model):
 
     def send_admin_email(self, type: str):
         from grant.user.models import User
-        admins = User.get_admins()
-        for a in admins:
-            send_email(a.email_address, type, {
-                'user': a,
-                'ccr': self,
-                'ccr_url': make_admin_url(f'/ccrs/{self.id}'),
-            })
+        admins = User.get_admins(get_subscription(type, {'ccr': self}))
+        send_fanout_email(type, {
+            'ccr': self,
+            'ccr_url': make_admin_url(f'/ccrs/{self.id}'),
+        }, [a.email_address for a in admins])
 
     # state: status DRAFT -> PENDING
     def set_pending(self):
@@ -219,6 +219,11 @@ class CCRSchema(ma.Schema):
     author = ma.Nested("UserSchema")
     ccr_id = ma.Method("get_ccr_id")
 
+    LOAD_PLAN = {
+        "rfp": ("rfp", "joinedload"),
+        "author": ("author", "joinedload"),
+    }
+
     def get_date_created(self, obj):
         return dt_to_unix(obj.date_created)
 
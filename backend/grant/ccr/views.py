@@ -12,6 +12,7 @@ from grant.utils.auth import (
 from grant.utils.auth import requires_ccr_owner_auth
 from grant.utils.enums import CCRStatus
 from grant.utils.exceptions import ValidationException
+from grant.utils.versioning import make_etag, conditional
 from .models import CCR, ccr_schema, ccrs_schema, db
 
 blueprint = Blueprint("ccr", __name__, url_prefix="/api/v1/ccrs")
@@ -19,7 +20,7 @@ blueprint = Blueprint("ccr", __name__, url_prefix="/api/v1/ccrs")
 
 @blueprint.route("/<ccr_id>", methods=["GET"])
 def get_ccr(ccr_id):
-    ccr = CCR.query.filter_by(id=ccr_id).first()
+    ccr = CCR.query.options(db.joinedload(CCR.rfp)).filter_by(id=ccr_id).first()
     if ccr:
         if ccr.status != CCRStatus.LIVE:
             if CCR.status == CCRStatus.DELETED:
@@ -28,7 +29,8 @@ def get_ccr(ccr_id):
 
             if authed_user.id != ccr.author.id:
                 return {"message": "User cannot view this CCR"}, 404
-        return ccr_schema.dump(ccr)
+        etag = make_etag("ccr", ccr.id, ccr.row_version, ccr.rfp.is_past_close if ccr.rfp else None)
+        return conditional(etag, lambda: ccr_schema.dump(ccr))
     else:
         return {"message": "No CCR matching id"}, 404
 
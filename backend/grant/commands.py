@@ -181,3 +181,44 @@ def reset_db_chain_data():
     print(f'* Deleted {p_count} proposals and their linked entities')
     print(f'* Deleted {t_count} tasks')
     print(f'* Removed refund address from {s_count} user settings')
+
+
+@click.command()
+@click.option("--users", default=20000, help="Users to add")
+@click.option("--proposals", default=50000, help="LIVE proposals to add")
+@click.option("--stages", default="WIP:5,COMPLETED:3,FAILED:1,CANCELED:1",
+              help="Weighted proposal stages, STAGE:weight,...")
+@click.option("--contributions", default=20.0, help="Average contributions per proposal")
+@click.option("--comments", default=100.0, help="Average comments per proposal")
+@click.option("--comment-depth", default=4, help="Deepest reply level")
+@click.option("--reply-rate", default=0.5, help="Chance a comment replies to an earlier one")
+@click.option("--followers", default=10.0, help="Average followers per proposal")
+@click.option("--batch-size", default=1000, help="Proposals (or users) written per transaction")
+@click.option("--password", default="loadtest", help="Password of every added user")
+@click.option("--seed", default=None, type=int, help="Random seed, for a repeatable dataset")
+@with_appcontext
+def seed_bulk(users, proposals, stages, contributions, comments, comment_depth, reply_rate, followers, batch_size,
+              password, seed):
+    """Bulk load a load-test dataset with COPY (Postgres) or multi-row INSERTs."""
+    import random
+    import time
+    from grant.utils.enums import ProposalStage
+    from grant.utils.seed import BulkSeeder, parse_weights
+
+    weights = parse_weights(stages)
+    unknown = [s for s in weights if not ProposalStage.includes(s)]
+    if unknown:
+        raise click.BadParameter(f"Unknown stages {', '.join(unknown)}", param_hint="--stages")
+    if seed is not None:
+        random.seed(seed)
+
+    start = time.perf_counter()
+    seeder = BulkSeeder(users, proposals, weights, contributions, comments, comment_depth, reply_rate, followers,
+                        batch_size, password)
+    if not users and proposals:
+        from grant.user.models import User
+        if not User.query.first():
+            raise click.UsageError("Proposals need users, add some with --users")
+    totals = seeder.run(log=click.echo)
+    click.echo(", ".join(f"{count} {name}" for name, count in totals.items()) +
+               f" added in {time.perf_counter() - start:.1f}s")
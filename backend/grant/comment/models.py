@@ -4,9 +4,12 @@ from functools import reduce
 from grant.extensions import ma, db
 from grant.utils.ma_fields import UnixDate
 from grant.utils.misc import gen_random_id
+from grant.utils.viewer import get_viewer_relations, load_viewer_relations, update_viewer_relation, \
+    viewer_relation
 from sqlalchemy.orm import raiseload, column_property
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy import func, select
+from marshmallow import pre_dump
 
 HIDDEN_CONTENT = '~~comment removed by admin~~'
 
@@ -69,19 +72,7 @@ class Comment(db.Model):
 
     @hybrid_property
     def authed_liked(self):
-        from grant.utils.auth import get_authed_user
-
-        authed = get_authed_user()
-        if not authed:
-            return False
-        res = (
-            db.session.query(comment_liker)
-            .filter_by(user_id=authed.id, comment_id=self.id)
-            .count()
-        )
-        if res:
-            return True
-        return False
+        return viewer_relation(comment_liker, "comment_id", self.id)
 
     def like(self, user, is_liked):
         if is_liked:
@@ -89,6 +80,21 @@ class Comment(db.Model):
         else:
             self.likes.remove(user)
         db.session.flush()
+        update_viewer_relation(comment_liker, "comment_id", user, self.id, is_liked)
+
+    @staticmethod
+    def load_viewer_relations(comments):
+        # anonymous viewers like nothing, don't walk the thread for them
+        if not get_viewer_relations():
+            return
+        # resolve the whole thread, replies are dumped through nested schema calls
+        ids = []
+        pending = list(comments)
+        while pending:
+            comment = pending.pop()
+            ids.append(comment.id)
+            pending.extend(comment.replies)
+        load_viewer_relations(comment_liker, "comment_id", ids)
 
 # are all of the replies hidden?
 def all_hidden(replies):
@@ -124,9 +130,20 @@ class CommentSchema(ma.Schema):
     # custome handling of replies, was: replies = ma.Nested("CommentSchema", many=True)
     replies = ma.Method("get_replies")
 
+    LOAD_PLAN = {
+        "author": ("author", "joinedload"),
+        "replies": ("replies", "selectinload"),
+    }
+
     def get_content(self, obj):
         return HIDDEN_CONTENT if obj.hidden else obj.content
 
+    @pre_dump(pass_many=True)
+    def load_viewer_relations(self, data, many):
+        if "authed_liked" in self.fields:
+            Comment.load_viewer_relations(data if many else [data])
+        return data
+
     # filter out "dead" comments
     def get_replies(self, obj):
         return comments_schema.dump(filter_dead(obj.replies))
@@ -205,6 +222,11 @@ class AdminCommentSchema(ma.Schema):
     )
     date_created = UnixDate(attribute='date_created')
 
+    LOAD_PLAN = {
+        "proposal": ("proposal", "joinedload"),
+        "author": ("author", "joinedload"),
+    }
+
 
 admin_comment_schema = AdminCommentSchema()
 admin_comments_schema = AdminCommentSchema(many=True)
@@ -0,0 +1,105 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+
+from grant.extensions import db
+from grant.settings import EMAIL_SENDER_THREADS, EMAIL_BATCH_SIZE, EMAIL_POLL_SECONDS
+from .models import EmailOutbox
+from .outbox import SinkBackend, deliver_due
+from .send import UNSUBSCRIBE_URL_TAG, generate_email, get_info_lookup
+from .templates import reset_env, warm_up
+
+
+@click.command()
+@click.option('--threads', default=EMAIL_SENDER_THREADS, help='Emails sent concurrently')
+@click.option('--batch-size', default=EMAIL_BATCH_SIZE, help='Emails claimed at a time')
+@click.option('--once', is_flag=True, default=False, help='Send a single batch and exit')
+@with_appcontext
+def email_worker(threads, batch_size, once):
+    print(f'Email worker running with {threads} threads')
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='email-send') as pool:
+        while True:
+            sent, failed = deliver_due(limit=batch_size, pool=pool)
+            if sent or failed:
+                print(f'Sent {sent} emails, {failed} failed')
+            if once:
+                break
+            # keep going while the outbox is backed up
+            if sent + failed < batch_size:
+                time.sleep(EMAIL_POLL_SECONDS)
+
+
+@click.command()
+@click.option('--count', default=10000, help='Emails to queue')
+@click.option('--threads', default=EMAIL_SENDER_THREADS, help='Emails sent concurrently')
+@click.option('--batch-size', default=EMAIL_BATCH_SIZE, help='Emails claimed at a time')
+@click.option('--latency', default=0.05, help='Seconds the sink takes per send, like an API round trip')
+@click.option('--fanout', is_flag=True, default=False, help='Queue one fan-out email instead of separate ones')
+@with_appcontext
+def email_benchmark(count, threads, batch_size, latency, fanout):
+    """Drains `count` queued emails into a sink backend and reports throughput, then removes them."""
+    backend = SinkBackend(latency=latency)
+    marker = f'benchmark-{datetime.now():%Y%m%d%H%M%S}'
+    table = EmailOutbox.__table__
+    for start in range(0, count, 10000):
+        db.session.execute(table.insert(), [
+            EmailOutbox(f'{marker}-{i}@example.com', marker, 'Benchmark', 'text', '<p>html</p>',
+                        substitutions={UNSUBSCRIBE_URL_TAG: f'https://example.com/{i}'} if fanout else None).values()
+            for i in range(start, min(start + 10000, count))
+        ])
+        db.session.commit()
+    try:
+        sent = 0
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='email-send') as pool:
+            while True:
+                batch_sent, batch_failed = deliver_due(limit=batch_size, pool=pool, backend=backend, type=marker)
+                if not batch_sent + batch_failed:
+                    break
+                sent += batch_sent
+        elapsed = time.perf_counter() - start
+        print(f'Sent {sent} emails in {len(backend.sent)} requests in {elapsed:.2f}s with {threads} threads, '
+              f'{sent / elapsed:.0f} emails/s')
+    finally:
+        db.session.execute(table.delete().where(table.c.type == marker))
+        db.session.commit()
+
+
+@click.command()
+@with_appcontext
+def email_warmup():
+    """Compiles every email template into the bytecode cache."""
+    start = time.perf_counter()
+    count = warm_up()
+    print(f'Compiled {count} email templates in {time.perf_counter() - start:.2f}s')
+
+
+@click.command()
+@click.option('--runs', default=100, help='Timed renders per email type')
+@with_appcontext
+def email_render_benchmark(runs):
+    """Times generating each email type from the admin example args, slowest first."""
+    from grant.admin.example_emails import example_email_args
+    results = []
+    for type in sorted(get_info_lookup):
+        if type not in example_email_args:
+            print(f'{type}: no example args, skipped')
+            continue
+        try:
+            # the first render compiles, or loads bytecode if the cache has it
+            reset_env()
+            start = time.perf_counter()
+            generate_email(type, dict(example_email_args[type]))
+            first = time.perf_counter() - start
+            start = time.perf_counter()
+            for _ in range(runs):
+                generate_email(type, dict(example_email_args[type]))
+            results.append((type, first, (time.perf_counter() - start) / runs))
+        except Exception as e:
+            print(f'{type}: {e.__class__.__name__}: {e}, skipped')
+    print(f'{"type":<36} {"first ms":>10} {"avg ms":>10}')
+    for type, first, avg in sorted(results, key=lambda r: -r[2]):
+        print(f'{type:<36} {first * 1000:>10.2f} {avg * 1000:>10.3f}')
@@ -69,3 +69,58 @@ class EmailRecoverySchema(ma.Schema):
 
 
 email_recovery_schema = EmailRecoverySchema()
+
+
+# outbox
+class EmailOutbox(db.Model):
+    """A rendered email waiting to be sent, see grant.email.outbox."""
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        # only unsent emails are indexed, so the sender's sweep doesn't grow with history
+        db.Index(
+            'ix_email_outbox_pending_send_after',
+            'send_after',
+            postgresql_where=db.text('sent = false AND dead = false'),
+            sqlite_where=db.text('sent = 0 AND dead = 0'),
+        ),
+    )
+
+    id = db.Column(db.Integer(), primary_key=True)
+    date_created = db.Column(db.DateTime, nullable=False)
+    to = db.Column(db.String(255), nullable=False)
+    type = db.Column(db.String(255), nullable=False)
+    subject = db.Column(db.Text, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    # per recipient tags of a fan-out email rendered once, replaced by the backend
+    substitutions = db.Column(db.JSON, nullable=True)
+    # the same key is only ever queued once, e.g. "proposal_failed:<proposal_id>:<user_id>"
+    idempotency_key = db.Column(db.String(255), nullable=True, unique=True)
+    # failed sends back off until send_after, after EMAIL_MAX_ATTEMPTS the email is dead
+    send_after = db.Column(db.DateTime, nullable=False)
+    attempts = db.Column(db.Integer(), nullable=False, default=0, server_default=db.text("0"))
+    last_error = db.Column(db.Text, nullable=True)
+    sent = db.Column(db.Boolean, nullable=False, default=False, server_default=db.text("FALSE"))
+    date_sent = db.Column(db.DateTime, nullable=True)
+    dead = db.Column(db.Boolean, nullable=False, default=False, server_default=db.text("FALSE"))
+    # lease of the sender delivering it
+    claimed_by = db.Column(db.String(255), nullable=True)
+    claimed_until = db.Column(db.DateTime, nullable=True)
+
+    def __init__(self, to: str, type: str, subject: str, text: str, html: str, idempotency_key: str = None,
+                 substitutions: dict = None):
+        self.date_created = datetime.now()
+        self.to = to
+        self.type = type
+        self.subject = subject
+        self.text = text
+        self.html = html
+        self.idempotency_key = idempotency_key
+        self.substitutions = substitutions
+        self.send_after = self.date_created
+        self.attempts = 0
+        self.sent = False
+        self.dead = False
+
+    def values(self):
+        return {c.key: getattr(self, c.key) for c in self.__table__.columns if getattr(self, c.key) is not None}
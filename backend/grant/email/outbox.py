@@ -0,0 +1,362 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import sendgrid
+from flask import current_app, g, has_app_context
+from python_http_client import HTTPError
+from sendgrid.helpers.mail import Email, Mail, Content, Personalization, Substitution
+from sentry_sdk import capture_exception
+from sqlalchemy import event, func, inspect, or_
+from sqlalchemy.orm import Session
+
+from grant.extensions import db
+from grant.settings import (
+    SENDGRID_API_KEY,
+    SENDGRID_DEFAULT_FROM,
+    SENDGRID_DEFAULT_FROMNAME,
+    EMAIL_BACKEND,
+    EMAIL_BATCH_SIZE,
+    EMAIL_LEASE_SECONDS,
+    EMAIL_MAX_ATTEMPTS,
+    EMAIL_POLL_SECONDS,
+    EMAIL_RETRY_MAX_SECONDS,
+    EMAIL_RETRY_SECONDS,
+    EMAIL_SENDER_INLINE,
+    EMAIL_SENDER_THREADS,
+)
+from .models import EmailOutbox
+
+# recipients SendGrid takes in one request
+MAX_PERSONALIZATIONS = 1000
+
+
+class PermanentSendError(Exception):
+    """A send that won't succeed on retry, e.g. a rejected address."""
+
+
+class SendgridBackend:
+    def __init__(self):
+        # one client for the process, shared by the sender's threads
+        self.client = sendgrid.SendGridAPIClient(apikey=SENDGRID_API_KEY)
+
+    def send(self, mail):
+        try:
+            res = self.client.client.mail.send.post(request_body=mail.get())
+        except HTTPError as e:
+            # 4xx other than rate limiting means the message itself is bad
+            if 400 <= e.status_code < 500 and e.status_code != 429:
+                raise PermanentSendError(f"{e.status_code}: {e.body}")
+            raise
+        return res.status_code
+
+
+class SinkBackend:
+    """
+    Records mail instead of sending it, for benchmarking the outbox offline.
+    `latency` seconds of sleep per send stand in for the API round trip.
+    """
+
+    def __init__(self, latency: float = 0):
+        self.sent = []
+        self.latency = latency
+        self.lock = threading.Lock()
+
+    def send(self, mail):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.sent.append(mail.get())
+        return 202
+
+
+class E2EBackend:
+    def send(self, mail):
+        from grant.e2e import views
+        views.last_email = mail.get()
+        return 202
+
+
+BACKENDS = {
+    "sendgrid": SendgridBackend,
+    "sink": SinkBackend,
+    "e2e": E2EBackend,
+}
+
+_backend = None
+_pool = None
+_sender = None
+_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _lock:
+        if _backend is None:
+            _backend = BACKENDS[EMAIL_BACKEND]()
+        return _backend
+
+
+def get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=EMAIL_SENDER_THREADS, thread_name_prefix="email-send")
+        return _pool
+
+
+def queue_email(to: str, type: str, subject: str, text: str, html: str, idempotency_key: str = None):
+    """
+    Add a rendered email to the outbox in the current transaction, so it is
+    sent only if that commits. Returns None if `idempotency_key` was queued before.
+    """
+    return queue_emails([(to, type, subject, text, html, idempotency_key)])[0]
+
+
+def queue_emails(messages):
+    """
+    queue_email for many (to, type, subject, text, html, idempotency_key[,
+    substitutions]) messages, checking their idempotency keys with one query.
+    """
+    keys = {m[5] for m in messages if m[5]}
+    if keys:
+        taken = {k for (k,) in db.session.query(EmailOutbox.idempotency_key)
+                 .filter(EmailOutbox.idempotency_key.in_(keys))}
+    emails = []
+    for message in messages:
+        key = message[5]
+        if key and key in taken:
+            emails.append(None)
+            continue
+        if key:
+            taken.add(key)
+        email = EmailOutbox(*message)
+        db.session.add(email)
+        g.setdefault('email_outbox', []).append(email)
+        emails.append(email)
+    return emails
+
+
+def flush_queued_emails():
+    """
+    Save emails queued after the last commit, as views often send once they
+    have committed, and wake the sender. Emails of a rolled back transaction
+    are already gone from the list and stay unsent. Anything else left
+    uncommitted is rolled back, so only call this once the work is done.
+    """
+    queued = g.pop('email_outbox', None)
+    if not queued:
+        return
+    # a later query may have autoflushed some, their rows are in the session's
+    # transaction, which holds sqlite's write lock and would never commit
+    if any(inspect(e).persistent for e in queued):
+        db.session.rollback()
+    else:
+        for email in queued:
+            db.session.expunge(email)
+    # in a transaction of their own, whatever else is pending may never be committed
+    with db.engine.begin() as conn:
+        conn.execute(EmailOutbox.__table__.insert(), [e.values() for e in queued])
+    if EMAIL_BACKEND == "e2e":
+        # e2e tests read the email as soon as the request returns
+        deliver_due()
+    elif EMAIL_SENDER_INLINE and not current_app.config.get("TESTING"):
+        wake_sender(current_app._get_current_object())
+
+
+@event.listens_for(Session, "after_commit")
+def forget_committed_emails(session):
+    if has_app_context() and g.get('email_outbox'):
+        g.email_outbox = [e for e in g.email_outbox if e not in session]
+
+
+# after_rollback fires before the rolled back emails are expunged
+@event.listens_for(Session, "after_soft_rollback")
+def forget_rolled_back_emails(session, previous_transaction):
+    if has_app_context() and g.get('email_outbox'):
+        g.email_outbox = [e for e in g.email_outbox if inspect(e).session is not None]
+
+
+def sender_name():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def claim_emails(now: datetime, limit: int, sender: str, type: str = None):
+    """
+    Lease up to `limit` due emails, only of `type` if given, to `sender`,
+    the same way grant.task.worker claims tasks.
+    """
+    free = or_(EmailOutbox.claimed_until == None, EmailOutbox.claimed_until < now)
+    candidates = db.session.query(EmailOutbox.id) \
+        .filter(EmailOutbox.sent == False, EmailOutbox.dead == False, EmailOutbox.send_after <= now, free)
+    if type:
+        candidates = candidates.filter(EmailOutbox.type == type)
+    candidates = candidates \
+        .order_by(EmailOutbox.send_after, EmailOutbox.id) \
+        .limit(limit) \
+        .with_for_update(skip_locked=True) \
+        .all()
+    ids = [row[0] for row in candidates]
+    if not ids:
+        db.session.commit()
+        return []
+    EmailOutbox.query \
+        .filter(EmailOutbox.id.in_(ids), free) \
+        .update({
+            EmailOutbox.claimed_by: sender,
+            EmailOutbox.claimed_until: now + timedelta(seconds=EMAIL_LEASE_SECONDS),
+        }, synchronize_session=False)
+    db.session.commit()
+    return [row[0] for row in db.session.query(EmailOutbox.id)
+            .filter(EmailOutbox.id.in_(ids), EmailOutbox.claimed_by == sender)
+            .order_by(EmailOutbox.send_after, EmailOutbox.id)]
+
+
+def retry_delay(attempts: int):
+    return timedelta(seconds=min(EMAIL_RETRY_SECONDS * 2 ** (attempts - 1), EMAIL_RETRY_MAX_SECONDS))
+
+
+def make_mail(emails):
+    """One mail to `emails`, which share a body, with a personalization each."""
+    first = emails[0]
+    mail = Mail(from_email=Email(SENDGRID_DEFAULT_FROM, SENDGRID_DEFAULT_FROMNAME), subject=first.subject)
+    for email in emails:
+        personalization = Personalization()
+        personalization.add_to(Email(email.to))
+        for tag, value in (email.substitutions or {}).items():
+            personalization.add_substitution(Substitution(tag, value))
+        mail.add_personalization(personalization)
+    mail.add_content(Content('text/plain', first.text))
+    mail.add_content(Content('text/html', first.html))
+    return mail
+
+
+def group_emails(emails):
+    """
+    Split emails into sends. Fan-out emails with the same body go together,
+    MAX_PERSONALIZATIONS at a time, the rest alone. Retries go alone too, so
+    one rejected address can't keep failing the others.
+    """
+    groups = {}
+    for email in emails:
+        shared = email.substitutions and not email.attempts
+        key = (email.subject, email.text, email.html) if shared else email.id
+        groups.setdefault(key, []).append(email)
+    return [group[i:i + MAX_PERSONALIZATIONS]
+            for group in groups.values()
+            for i in range(0, len(group), MAX_PERSONALIZATIONS)]
+
+
+def send_mail(backend, mail):
+    """Send on a pool thread, returns the error or None. No database access here."""
+    try:
+        backend.send(mail)
+        return None
+    except Exception as e:
+        return e
+
+
+def deliver_due(now: datetime = None, limit: int = EMAIL_BATCH_SIZE, pool=None, backend=None, type: str = None):
+    """
+    Claim a batch of due emails and send them concurrently on `pool`, the
+    process' EMAIL_SENDER_THREADS pool by default, then record the outcome of
+    each. Returns (sent, failed) email counts.
+    """
+    sender = sender_name()
+    now = now or datetime.now()
+    ids = claim_emails(now, limit, sender, type)
+    if not ids:
+        return 0, 0
+    emails = EmailOutbox.query.filter(EmailOutbox.id.in_(ids)).order_by(EmailOutbox.id).all()
+    backend = backend or get_backend()
+    pool = pool or get_pool()
+    sends = group_emails(emails)
+    errors = list(pool.map(lambda mail: send_mail(backend, mail), [make_mail(group) for group in sends]))
+
+    sent = failed = 0
+    for group, error in zip(sends, errors):
+        for email in group:
+            email.claimed_by = None
+            email.claimed_until = None
+            if error is None:
+                email.sent = True
+                email.date_sent = datetime.now()
+                sent += 1
+                continue
+            failed += 1
+            email.attempts += 1
+            email.last_error = f"{error.__class__.__name__}: {error}"
+            rejected = isinstance(error, PermanentSendError) and len(group) == 1
+            if rejected or email.attempts >= EMAIL_MAX_ATTEMPTS:
+                email.dead = True
+            else:
+                email.send_after = datetime.now() + retry_delay(email.attempts)
+        if error is None:
+            current_app.logger.info(f'Just sent an email of type {group[0].type} to {len(group)} recipients')
+        else:
+            current_app.logger.info(f'Failed to send an email of type {group[0].type} to {len(group)} recipients: '
+                                    f'{group[0].last_error}')
+            capture_exception(error)
+    db.session.commit()
+    return sent, failed
+
+
+def next_send_after():
+    """When the next unsent email is due, None if there are none."""
+    return db.session.query(func.min(EmailOutbox.send_after)) \
+        .filter(EmailOutbox.sent == False, EmailOutbox.dead == False) \
+        .scalar()
+
+
+class OutboxSender(threading.Thread):
+    """
+    Drains the outbox on a background thread of a web or task process, waking
+    when this process queues mail and otherwise when the next retry is due,
+    at least every EMAIL_POLL_SECONDS to pick up mail other processes queued.
+    """
+
+    def __init__(self, app):
+        super().__init__(name="email-sender", daemon=True)
+        self.app = app
+        self.wakeup = threading.Event()
+
+    def wake(self):
+        self.wakeup.set()
+
+    def run_once(self):
+        """Deliver a batch, returns the seconds to sleep."""
+        try:
+            sent, failed = deliver_due()
+            if sent + failed >= EMAIL_BATCH_SIZE:
+                return 0
+            due = next_send_after()
+            if due is None:
+                return EMAIL_POLL_SECONDS
+            return min(max((due - datetime.now()).total_seconds(), 0), EMAIL_POLL_SECONDS)
+        except Exception as e:
+            current_app.logger.info("Email sender failed: {}".format(e))
+            capture_exception(e)
+            return EMAIL_POLL_SECONDS
+        finally:
+            db.session.remove()
+
+    def run(self):
+        with self.app.app_context():
+            while True:
+                # woken while sending means more mail, go again right away
+                self.wakeup.clear()
+                delay = self.run_once()
+                self.wakeup.wait(delay)
+
+
+def wake_sender(app):
+    global _sender
+    with _lock:
+        if _sender is None:
+            _sender = OutboxSender(app)
+            _sender.start()
+    _sender.wake()
@@ -1,15 +1,10 @@
-from threading import Thread
+from flask import Markup, current_app
 
-import sendgrid
-from flask import render_template, Markup, current_app, g
-from python_http_client import HTTPError
-from sendgrid.helpers.mail import Email, Mail, Content
-from sentry_sdk import capture_exception
-
-from grant.settings import SENDGRID_API_KEY, SENDGRID_DEFAULT_FROM, UI, E2E_TESTING
-from grant.settings import SENDGRID_DEFAULT_FROMNAME
+from grant.settings import UI
 from grant.utils.misc import make_url
-from .subscription_settings import EmailSubscription, is_subscribed
+from .outbox import queue_emails, flush_queued_emails
+from .subscription_settings import EmailSubscription
+from .templates import render
 
 default_template_args = {
     'home_url': make_url('/'),
@@ -488,25 +483,29 @@ get_info_lookup = {
 }
 
 
-def generate_email(type, email_args, user=None):
+# substituted per recipient when a fan-out email is sent
+UNSUBSCRIBE_URL_TAG = '%unsubscribe_url%'
+
+
+def user_unsubscribe_url(user=None):
+    if not user:
+        return default_template_args['unsubscribe_url']
+    return make_url('/email/unsubscribe?code={}'.format(user.email_verification.code))
+
+
+def generate_email(type, email_args, user=None, unsubscribe_url=None):
     info = get_info_lookup[type](email_args)
-    body_text = render_template(
-        'emails/%s.txt' % (type),
-        args=email_args,
-        UI=UI,
-    )
-    body_html = render_template(
-        'emails/%s.html' % (type),
-        args=email_args,
-        UI=UI,
-    )
+    body_text = render('%s.txt' % (type), args=email_args, UI=UI)
+    body_html = render('%s.html' % (type), args=email_args, UI=UI)
 
     template_args = {**default_template_args}
-    if user:
-        template_args['unsubscribe_url'] = make_url('/email/unsubscribe?code={}'.format(user.email_verification.code))
+    if unsubscribe_url:
+        template_args['unsubscribe_url'] = unsubscribe_url
+    elif user:
+        template_args['unsubscribe_url'] = user_unsubscribe_url(user)
 
-    html = render_template(
-        'emails/template.html',
+    html = render(
+        'template.html',
         args={
             **template_args,
             **info,
@@ -514,8 +513,8 @@ def generate_email(type, email_args, user=None):
         },
         UI=UI,
     )
-    text = render_template(
-        'emails/template.txt',
+    text = render(
+        'template.txt',
         args={
             **template_args,
             **info,
@@ -531,77 +530,100 @@ def generate_email(type, email_args, user=None):
     }
 
 
-def send_email(to, type, email_args):
-    if 'email_sender' not in g:
-        g.email_sender = EmailSender(current_app._get_current_object())
-    g.email_sender.add(to, type, email_args)
+def send_email(to, type, email_args, idempotency_key=None):
+    """
+    Render an email and queue it in the outbox. Emails queued with an
+    `idempotency_key` that was used before are dropped, so retried work
+    doesn't send twice.
+    """
+    send_bulk_email(type, [(to, email_args, idempotency_key)])
 
 
-def make_envelope(to, type, email_args):
+def send_bulk_email(type, recipients):
+    """
+    Queue an email of one `type` to many (to, email_args[, idempotency_key])
+    recipients, resolving all of them with a single query.
+    """
+    recipients = [r if len(r) == 3 else (*r, None) for r in recipients]
+    envelopes = make_envelopes(type, [(to, email_args) for to, email_args, _ in recipients])
+    queue_emails([
+        (to, type, email['info']['subject'], email['text'], email['html'], idempotency_key)
+        for (to, _, idempotency_key), email in zip(recipients, envelopes) if email
+    ])
+
+
+def send_fanout_email(type, email_args, recipients):
+    """
+    Queue an email of `type` with the same `email_args` to every address in
+    `recipients`. It's rendered once with a tag for the unsubscribe link, the
+    only part that differs, which is filled in per recipient when it's sent.
+    """
     if current_app and current_app.config.get("TESTING"):
-        return None
+        return
 
     from grant.user.models import User
-    user = User.get_by_email(to)
+    users = User.get_by_emails(recipients)
     info = get_info_lookup[type](email_args)
+    email = None
+    messages = []
+    for to in recipients:
+        user = users.get(to.lower())
+        if not wants_email(user, info):
+            continue
+        email = email or generate_email(type, email_args, unsubscribe_url=UNSUBSCRIBE_URL_TAG)
+        messages.append((to, type, info['subject'], email['text'], email['html'], None, {
+            UNSUBSCRIBE_URL_TAG: user_unsubscribe_url(user),
+        }))
+    queue_emails(messages)
+
+
+def send_emails(messages):
+    """Queue (to, type, email_args[, idempotency_key]) messages, one send_bulk_email per type."""
+    by_type = {}
+    for to, type, *rest in messages:
+        by_type.setdefault(type, []).append((to, *rest))
+    for type, recipients in by_type.items():
+        send_bulk_email(type, recipients)
 
+
+def send_queued_emails():
+    """Save emails queued after the last commit and wake the sender, for contexts without a request to do it after."""
+    flush_queued_emails()
+
+
+def get_subscription(type, email_args):
+    """The subscription an email of `type` needs, None if it's always sent."""
+    return get_info_lookup[type](email_args).get('subscription')
+
+
+def wants_email(user, info):
     if user and 'subscription' in info:
-        sub = info['subscription']
-        if user and not is_subscribed(user.settings.email_subscriptions, sub):
+        return user.settings.is_subscribed_to(info['subscription'])
+    return True
+
+
+def make_envelopes(type, recipients):
+    """
+    Render an email of `type` for each (to, email_args) of `recipients`, None
+    for users unsubscribed from it. Recipients' users, settings and
+    verification codes come from one query.
+    """
+    if current_app and current_app.config.get("TESTING"):
+        return [None] * len(recipients)
+
+    from grant.user.models import User
+    users = User.get_by_emails([to for to, _ in recipients])
+    envelopes = []
+    for to, email_args in recipients:
+        user = users.get(to.lower())
+        info = get_info_lookup[type](email_args)
+        if not wants_email(user, info):
             current_app.logger.debug(f'Ignoring send_email to {to} of type {type} because user is unsubscribed.')
-            return None
+            envelopes.append(None)
+            continue
+        envelopes.append(generate_email(type, email_args, user))
+    return envelopes
 
-    email = generate_email(type, email_args, user)
-    mail = Mail(
-        from_email=Email(SENDGRID_DEFAULT_FROM, SENDGRID_DEFAULT_FROMNAME),
-        to_email=Email(to),
-        subject=email['info']['subject'],
-    )
-    mail.add_content(Content('text/plain', email['text']))
-    mail.add_content(Content('text/html', email['html']))
-
-    mail.___type = type
-    mail.___to = to
-
-    return mail
-
-
-def sendgrid_send(mail, app=current_app):
-    to = mail.___to
-    type = mail.___type
-    try:
-        sg = sendgrid.SendGridAPIClient(apikey=SENDGRID_API_KEY)
-        if E2E_TESTING:
-            from grant.e2e import views
-            views.last_email = mail.get()
-            app.logger.info(f'Just set last_email for e2e to pickup, to: {to}, type: {type}')
-        else:
-            res = sg.client.mail.send.post(request_body=mail.get())
-            app.logger.info('Just sent an email to %s of type %s, response code: %s' %
-                            (to, type, res.status_code))
-    except HTTPError as e:
-        app.logger.info('An HTTP error occured while sending an email to %s - %s: %s' %
-                        (to, e.__class__.__name__, e))
-        app.logger.debug(e.body)
-        capture_exception(e)
-    except Exception as e:
-        app.logger.info('An unknown error occured while sending an email to %s - %s: %s' %
-                        (to, e.__class__.__name__, e))
-        app.logger.debug(e)
-        capture_exception(e)
-
-
-class EmailSender(Thread):
-    def __init__(self, app):
-        Thread.__init__(self)
-        self.envelopes = []
-        self.app = app
-
-    def add(self, to, type, email_args):
-        env = make_envelope(to, type, email_args)
-        if env:
-            self.envelopes.append(env)
-
-    def run(self):
-        for envelope in self.envelopes:
-            sendgrid_send(envelope, self.app)
+
+def make_envelope(to, type, email_args):
+    return make_envelopes(type, [(to, email_args)])[0]
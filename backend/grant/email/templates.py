@@ -0,0 +1,62 @@
+import os
+import threading
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+
+from grant.settings import DEBUG, EMAIL_TEMPLATE_CACHE, EMAIL_TEMPLATE_CACHE_DIR
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates', 'emails')
+
+_env = None
+_lock = threading.Lock()
+
+
+def make_env(cache: bool = EMAIL_TEMPLATE_CACHE, cache_dir: str = EMAIL_TEMPLATE_CACHE_DIR):
+    """
+    Environment for the templates under templates/emails, escaping .html ones
+    like Flask does. Compiled templates are kept on disk, so a new process
+    loads bytecode instead of parsing the templates again.
+    """
+    bytecode_cache = None
+    if cache:
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        bytecode_cache = FileSystemBytecodeCache(cache_dir or None)
+    return Environment(
+        loader=FileSystemLoader(TEMPLATE_DIR),
+        bytecode_cache=bytecode_cache,
+        autoescape=select_autoescape(['html']),
+        auto_reload=DEBUG,
+    )
+
+
+def get_env():
+    global _env
+    with _lock:
+        if _env is None:
+            _env = make_env()
+        return _env
+
+
+def reset_env():
+    """Drop the compiled templates held in memory, the bytecode cache stays."""
+    global _env
+    with _lock:
+        _env = None
+
+
+def render(name: str, **context):
+    return get_env().get_template(name).render(**context)
+
+
+def email_templates():
+    return get_env().list_templates(filter_func=lambda name: name.endswith(('.html', '.txt')))
+
+
+def warm_up():
+    """Compile every email template ahead of the first send, returns how many."""
+    env = get_env()
+    names = email_templates()
+    for name in names:
+        env.get_template(name)
+    return len(names)
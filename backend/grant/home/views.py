@@ -3,17 +3,21 @@ from datetime import datetime
 from flask import Blueprint
 from sqlalchemy import or_
 
-from grant.proposal.models import Proposal, proposals_schema
+from grant.proposal.models import Proposal, proposal_cards_schema
 from grant.rfp.models import RFP, rfps_schema
 from grant.utils.enums import ProposalStatus, ProposalStage, RFPStatus
+from grant.utils.loading import eager
+from grant.utils.response_cache import cached_public_response
 
 blueprint = Blueprint("home", __name__, url_prefix="/api/v1/home")
 
 
 @blueprint.route("/latest", methods=["GET"])
+@cached_public_response("home:latest", ["proposal", "rfp"])
 def get_home_content():
     latest_proposals = (
-        Proposal.query.filter_by(status=ProposalStatus.LIVE)
+        eager(Proposal.query, proposal_cards_schema, Proposal)
+        .filter_by(status=ProposalStatus.LIVE)
         .filter(Proposal.stage != ProposalStage.CANCELED)
         .filter(Proposal.stage != ProposalStage.FAILED)
         .order_by(Proposal.date_created.desc())
@@ -21,7 +25,8 @@ def get_home_content():
         .all()
     )
     latest_rfps = (
-        RFP.query.filter_by(status=RFPStatus.LIVE)
+        eager(RFP.query, rfps_schema, RFP)
+        .filter_by(status=RFPStatus.LIVE)
         .filter(or_(RFP.date_closes == None, RFP.date_closes > datetime.now()))
         .order_by(RFP.date_opened)
         .limit(3)
@@ -29,6 +34,6 @@ def get_home_content():
     )
 
     return {
-        "latest_proposals": proposals_schema.dump(latest_proposals),
+        "latest_proposals": proposal_cards_schema.dump(latest_proposals),
         "latest_rfps": rfps_schema.dump(latest_rfps),
     }
@@ -6,6 +6,7 @@ from grant.utils.exceptions import ValidationException
 from grant.utils.ma_fields import UnixDate
 from grant.utils.misc import gen_random_id
 from grant.task.jobs import MilestoneDeadline
+from grant.task.models import Task
 
 
 class MilestoneException(Exception):
@@ -190,6 +191,8 @@ class Milestone(db.Model):
         self.stage = MilestoneStage.PAID
         self.date_paid = datetime.datetime.now()
         self.paid_tx_id = tx_id
+        # a paid milestone can't miss its deadline
+        Task.cancel_for_proposal(self.proposal_id, [MilestoneDeadline.JOB_TYPE], milestone_id=self.id)
 
 
 class MilestoneSchema(ma.Schema):
@@ -87,5 +87,10 @@ paginated_fields = {
     "page": fields.Int(required=False, missing=None),
     "filters": fields.List(fields.Str(), required=False, missing=None),
     "search": fields.Str(required=False, missing=None),
-    "sort": fields.Str(required=False, missing=None)
+    "sort": fields.Str(required=False, missing=None),
+    # opt-in keyset pagination, pass an empty cursor for the first page
+    "cursor": fields.Str(required=False, missing=None),
+    "withTotal": fields.Bool(required=False, missing=False),
+    # planner estimate instead of COUNT(*) for large unfiltered listings
+    "estimateTotal": fields.Bool(required=False, missing=False)
 }
\ No newline at end of file
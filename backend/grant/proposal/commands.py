@@ -4,7 +4,7 @@ from random import randint
 from math import floor
 from flask.cli import with_appcontext
 
-from .models import Proposal, db
+from .models import Proposal, ProposalFunding, db
 from grant.milestone.models import Milestone
 from grant.comment.models import Comment
 from grant.utils.enums import ProposalStatus, Category, ProposalStage
@@ -194,3 +194,35 @@ def retire_v1_proposals(dry):
     print(f"Deleted {deleted_draft_count} stale 'DRAFT' proposals")
 
 
+@click.command()
+@click.option('--verify', is_flag=True, default=False, help='Only report ledger rows that disagree, change nothing')
+@click.option('--batch-size', type=int, default=500)
+@with_appcontext
+def rebuild_proposal_funding(verify, batch_size):
+    """Rebuild the proposal_funding ledger from proposal_contribution rows."""
+    proposal_ids = [pid for (pid,) in db.session.query(Proposal.id).order_by(Proposal.id)]
+    mismatched_count = 0
+
+    for i in range(0, len(proposal_ids), batch_size):
+        batch = proposal_ids[i:i + batch_size]
+        totals = ProposalFunding.calculate(batch)
+        ledger = {f.proposal_id: f for f in ProposalFunding.query.filter(ProposalFunding.proposal_id.in_(batch))}
+        for pid in batch:
+            funding = ledger.get(pid)
+            if funding and funding.matches(totals[pid]):
+                continue
+            mismatched_count += 1
+            if funding:
+                print(f"Proposal {pid}: ledger has {funding.contributed} contributed, {funding.staked} staked, "
+                      f"{funding.contributor_count} contributors but contributions have "
+                      f"{totals[pid]['contributed']}, {totals[pid]['staked']}, {totals[pid]['contributor_count']}")
+            else:
+                print(f"Proposal {pid}: no ledger row")
+            if not verify:
+                ProposalFunding.refresh(pid, totals[pid])
+        if not verify:
+            db.session.commit()
+
+    print(f"Checked {len(proposal_ids)} proposals, {mismatched_count} out of date")
+    if verify and mismatched_count:
+        exit(1)
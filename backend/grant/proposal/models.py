@@ -1,20 +1,23 @@
 import datetime
 import json
 from decimal import Decimal, ROUND_DOWN
-from functools import reduce
 from typing import Optional
 
-from marshmallow import post_dump
-from sqlalchemy import func, or_, select, ForeignKey
+from marshmallow import post_dump, pre_dump
+from sqlalchemy import case, cast, func, inspect, or_, select, ForeignKey
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import column_property
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.types import NullType
 
 from grant.comment.models import Comment
-from grant.email.send import send_email
+from grant.email.send import send_email, send_bulk_email, send_fanout_email, get_subscription
+from grant.email.subscription_settings import EmailSubscription
 from grant.extensions import ma, db
 from grant.milestone.models import Milestone
 from grant.settings import PROPOSAL_STAKING_AMOUNT, PROPOSAL_TARGET_MAX
-from grant.task.jobs import ContributionExpired
+from grant.task.jobs import ContributionExpired, MilestoneDeadline, ProposalDeadline, PruneDraft
+from grant.task.models import Task
 from grant.utils.enums import (
     ProposalStatus,
     ProposalStage,
@@ -23,11 +26,13 @@ from grant.utils.enums import (
     MilestoneStage,
     ProposalChange
 )
+from grant.utils.date import add_seconds
 from grant.utils.exceptions import ValidationException
 from grant.utils.misc import dt_to_unix, make_url, make_admin_url, gen_random_id
 from grant.utils.requests import blockchain_get
 from grant.utils.stubs import anonymous_user
 from grant.utils.validate import is_z_address_valid
+from grant.utils.viewer import load_viewer_relations, update_viewer_relation, viewer_relation
 
 proposal_team = db.Table(
     'proposal_team', db.Model.metadata,
@@ -187,15 +192,159 @@ class ProposalContribution(db.Model):
             raise ValidationException('Amount is required')
 
     def confirm(self, tx_id: str, amount: str):
+        was_confirmed = self.status == ContributionStatus.CONFIRMED
         self.status = ContributionStatus.CONFIRMED
         self.tx_id = tx_id
         self.amount = amount
+        if was_confirmed:
+            ProposalFunding.refresh(self.proposal_id)
+        else:
+            ProposalFunding.record_confirmation(self)
 
     @hybrid_property
     def refund_address(self):
         return self.user.settings.refund_address if self.user else None
 
 
+# Contribution amounts are stored as strings, so every aggregate casts them to
+# NUMERIC first. Postgres sums those exactly, matching Decimal arithmetic.
+def contribution_amount_sum(type_=db.Numeric):
+    return func.coalesce(func.sum(cast(ProposalContribution.amount, db.Numeric), type_=type_), 0)
+
+
+# smallest ZEC amount, a zatoshi
+ZATOSHI = Decimal('1e-8')
+
+
+def sum_to_decimal(value):
+    # Raw DBAPI value: Decimal from postgres, int or float from sqlite (which has no exact numeric)
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, float):
+        # rounding to zatoshis drops the float error, e.g. 184.36100000000002
+        amount = Decimal(repr(value)).quantize(ZATOSHI)
+        return amount.quantize(Decimal(1)) if amount == amount.to_integral_value() else amount.normalize()
+    return Decimal(value or 0)
+
+
+class ProposalFunding(db.Model):
+    """Running funding totals of a proposal, updated in the same transaction as its contributions."""
+    __tablename__ = "proposal_funding"
+
+    proposal_id = db.Column(db.Integer, db.ForeignKey("proposal.id"), primary_key=True)
+    contributed = db.Column(db.String(255), nullable=False, default='0')
+    staked = db.Column(db.String(255), nullable=False, default='0')
+    contributor_count = db.Column(db.Integer, nullable=False, default=0)
+    date_last_confirmed = db.Column(db.DateTime, nullable=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__(self, proposal_id: int = None):
+        self.proposal_id = proposal_id
+        self.contributed = '0'
+        self.staked = '0'
+        self.contributor_count = 0
+        self.version = 0
+
+    @staticmethod
+    def lock(proposal_id: int):
+        # row lock serializes concurrent confirmations for the same proposal
+        funding = ProposalFunding.query \
+            .populate_existing() \
+            .with_for_update() \
+            .filter_by(proposal_id=proposal_id) \
+            .first()
+        if not funding:
+            funding = ProposalFunding(proposal_id=proposal_id)
+            db.session.add(funding)
+            proposal = Proposal.query.get(proposal_id)
+            if proposal:
+                proposal.funding = funding
+        return funding
+
+    @staticmethod
+    def record_confirmation(contribution):
+        funding = ProposalFunding.lock(contribution.proposal_id)
+        amount = Decimal(contribution.amount)
+        if contribution.staking:
+            funding.staked = str(Decimal(funding.staked) + amount)
+        else:
+            funding.contributed = str(Decimal(funding.contributed) + amount)
+
+        if contribution.user_id:
+            if contribution.id is None:
+                db.session.flush()
+            existing = ProposalContribution.query \
+                .filter_by(proposal_id=contribution.proposal_id, user_id=contribution.user_id) \
+                .filter(ProposalContribution.status == ContributionStatus.CONFIRMED) \
+                .filter(ProposalContribution.id != contribution.id) \
+                .first()
+            if not existing:
+                funding.contributor_count += 1
+
+        funding.date_last_confirmed = datetime.datetime.now()
+        funding.version += 1
+        db.session.add(funding)
+        return funding
+
+    @staticmethod
+    def calculate(proposal_ids: list):
+        """Funding totals straight from proposal_contribution rows, keyed by proposal id."""
+        totals = {pid: {'contributed': Decimal(0), 'staked': Decimal(0), 'contributor_count': 0,
+                        'date_last_confirmed': None}
+                  for pid in proposal_ids}
+        if not totals:
+            return totals
+
+        confirmed = db.session.query(ProposalContribution.proposal_id) \
+            .filter(ProposalContribution.proposal_id.in_(totals.keys())) \
+            .filter(ProposalContribution.status == ContributionStatus.CONFIRMED)
+        sums = confirmed \
+            .add_columns(ProposalContribution.staking, contribution_amount_sum(type_=NullType)) \
+            .group_by(ProposalContribution.proposal_id, ProposalContribution.staking)
+        for proposal_id, staking, amount in sums:
+            totals[proposal_id]['staked' if staking else 'contributed'] = sum_to_decimal(amount)
+        # contributions have no confirmation timestamp, so creation date is the best approximation
+        counts = confirmed \
+            .add_columns(
+                func.count(ProposalContribution.user_id.distinct()),
+                func.max(ProposalContribution.date_created),
+            ) \
+            .group_by(ProposalContribution.proposal_id)
+        for proposal_id, count, last_date in counts:
+            totals[proposal_id]['contributor_count'] = count
+            totals[proposal_id]['date_last_confirmed'] = last_date
+        return totals
+
+    @staticmethod
+    def refresh(proposal_id: int, totals: dict = None):
+        """Recompute a proposal's ledger row from its contributions, e.g. after an admin edit."""
+        funding = ProposalFunding.lock(proposal_id)
+        totals = totals or ProposalFunding.calculate([proposal_id])[proposal_id]
+        funding.contributed = str(totals['contributed'])
+        funding.staked = str(totals['staked'])
+        funding.contributor_count = totals['contributor_count']
+        funding.date_last_confirmed = funding.date_last_confirmed or totals['date_last_confirmed']
+        funding.version += 1
+        db.session.add(funding)
+        return funding
+
+    def matches(self, totals: dict):
+        return Decimal(self.contributed) == totals['contributed'] \
+            and Decimal(self.staked) == totals['staked'] \
+            and self.contributor_count == totals['contributor_count']
+
+
+def ledger_amount(column, proposal_id):
+    # coalesced outside the subquery, a proposal without a ledger row has no row to coalesce
+    return func.coalesce(
+        select([cast(column, db.Numeric)])
+            .where(ProposalFunding.proposal_id == proposal_id)
+            .correlate_except(ProposalFunding)
+            .as_scalar(),
+        0,
+    )
+
+
 class ProposalArbiter(db.Model):
     __tablename__ = "proposal_arbiter"
 
@@ -413,6 +562,8 @@ class Proposal(db.Model):
     contributed = db.column_property()
     tip_jar_address = db.Column(db.String(255), nullable=True)
     tip_jar_view_key = db.Column(db.String(255), nullable=True)
+    # bumped whenever its detail response changes, see grant.utils.versioning
+    row_version = db.Column(db.Integer(), nullable=False, default=0, server_default=db.text("0"))
 
     # Relations
     team = db.relationship("User", secondary=proposal_team)
@@ -445,6 +596,7 @@ class Proposal(db.Model):
 
     revisions = db.relationship(ProposalRevision, foreign_keys=[ProposalRevision.proposal_id], lazy=True,
                                 cascade="all, delete-orphan")
+    funding = db.relationship(ProposalFunding, uselist=False, lazy=True, cascade="all, delete-orphan")
 
     def __init__(
             self,
@@ -575,6 +727,7 @@ class Proposal(db.Model):
 
         arbiter = ProposalArbiter(proposal_id=proposal.id)
         db.session.add(arbiter)
+        proposal.funding = ProposalFunding(proposal_id=proposal.id)
 
         return proposal
 
@@ -663,13 +816,11 @@ class Proposal(db.Model):
 
     def send_admin_email(self, type: str):
         from grant.user.models import User
-        admins = User.get_admins()
-        for a in admins:
-            send_email(a.email_address, type, {
-                'user': a,
-                'proposal': self,
-                'proposal_url': make_admin_url(f'/proposals/{self.id}'),
-            })
+        admins = User.get_admins(get_subscription(type, {'proposal': self}))
+        send_fanout_email(type, {
+            'proposal': self,
+            'proposal_url': make_admin_url(f'/proposals/{self.id}'),
+        }, [a.email_address for a in admins])
 
     # state: status (DRAFT || REJECTED) -> (PENDING)
     def submit_for_approval(self):
@@ -680,6 +831,7 @@ class Proposal(db.Model):
         if self.status not in allowed_statuses:
             raise ValidationException(f"Proposal status must be draft or rejected to submit for approval")
         self.set_pending()
+        Task.cancel_for_proposal(self.id, [PruneDraft.JOB_TYPE])
 
     def set_pending_when_ready(self):
         if self.status == ProposalStatus.STAKING and self.is_staked:
@@ -799,6 +951,7 @@ class Proposal(db.Model):
         self.date_published = datetime.datetime.now()
         self.status = ProposalStatus.LIVE
         self.stage = ProposalStage.WIP
+        Task.cancel_for_proposal(self.id, [PruneDraft.JOB_TYPE])
 
     def set_contribution_bounty(self, bounty: str):
         # do not allow changes on funded/WIP proposals
@@ -819,19 +972,20 @@ class Proposal(db.Model):
         self.stage = ProposalStage.CANCELED
         db.session.add(self)
         db.session.flush()
+        Task.cancel_for_proposal(self.id, [PruneDraft.JOB_TYPE, ProposalDeadline.JOB_TYPE, MilestoneDeadline.JOB_TYPE])
 
         # Send emails to team & contributors
-        for u in self.team:
-            send_email(u.email_address, 'proposal_canceled', {
-                'proposal': self,
-                'support_url': make_url('/contact'),
-            })
-        for u in self.contributors:
-            send_email(u.email_address, 'contribution_proposal_canceled', {
-                'proposal': self,
-                'refund_address': u.settings.refund_address,
-                'account_settings_url': make_url('/profile/settings?tab=account')
-            })
+        send_bulk_email('proposal_canceled', [(u.email_address, {
+            'proposal': self,
+            'support_url': make_url('/contact'),
+        }) for u in self.team])
+        send_bulk_email('contribution_proposal_canceled', [(u.email_address, {
+            'proposal': self,
+            'refund_address': u.settings.refund_address,
+            'account_settings_url': make_url('/profile/settings?tab=account')
+        }) for u in self.subscribed_contributors(
+            get_subscription('contribution_proposal_canceled', {'proposal': self})
+        )])
 
     def follow(self, user, is_follow):
         if is_follow:
@@ -839,6 +993,7 @@ class Proposal(db.Model):
         else:
             self.followers.remove(user)
         db.session.flush()
+        update_viewer_relation(proposal_follower, "proposal_id", user, self.id, is_follow)
 
     def like(self, user, is_liked):
         if is_liked:
@@ -846,35 +1001,58 @@ class Proposal(db.Model):
         else:
             self.likes.remove(user)
         db.session.flush()
+        update_viewer_relation(proposal_liker, "proposal_id", user, self.id, is_liked)
 
     def send_follower_email(self, type: str, email_args={}, url_suffix=""):
-        for u in self.followers:
-            send_email(
-                u.email_address,
-                type,
-                {
-                    "user": u,
-                    "proposal": self,
-                    "proposal_url": make_url(f"/proposals/{self.id}{url_suffix}"),
-                    **email_args,
-                },
-            )
+        args = {
+            "proposal": self,
+            "proposal_url": make_url(f"/proposals/{self.id}{url_suffix}"),
+            **email_args,
+        }
+        followers = self.subscribed_followers(get_subscription(type, args))
+        send_fanout_email(type, args, [u.email_address for u in followers])
+
+    def subscribed_followers(self, sub: Optional[EmailSubscription]):
+        from grant.user.models import User
+        return User.subscribed_to(sub) \
+            .join(proposal_follower, proposal_follower.c.user_id == User.id) \
+            .filter(proposal_follower.c.proposal_id == self.id) \
+            .all()
+
+    def subscribed_contributors(self, sub: Optional[EmailSubscription]):
+        """Users with confirmed contributions subscribed to `sub`, without loading the contributions."""
+        from grant.user.models import User
+        contributed = db.session.query(ProposalContribution.user_id) \
+            .filter(ProposalContribution.proposal_id == self.id,
+                    ProposalContribution.status == ContributionStatus.CONFIRMED)
+        return User.subscribed_to(sub).filter(User.id.in_(contributed)).all()
+
+    @staticmethod
+    def load_funding(proposals):
+        """Load the funding ledger rows of many proposals with a single query."""
+        unloaded = {p.id: p for p in proposals if p and 'funding' in inspect(p).unloaded}
+        if not unloaded:
+            return
+        rows = ProposalFunding.query.filter(ProposalFunding.proposal_id.in_(unloaded.keys())).all()
+        ledger = {f.proposal_id: f for f in rows}
+        for pid, p in unloaded.items():
+            set_committed_value(p, 'funding', ledger.get(pid))
 
     @hybrid_property
     def contributed(self):
-        contributions = ProposalContribution.query \
-            .filter_by(proposal_id=self.id, status=ContributionStatus.CONFIRMED, staking=False) \
-            .all()
-        funded = reduce(lambda prev, c: prev + Decimal(c.amount), contributions, 0)
-        return str(funded)
+        return self.funding.contributed if self.funding else '0'
+
+    @contributed.expression
+    def contributed(cls):
+        return ledger_amount(ProposalFunding.contributed, cls.id)
 
     @hybrid_property
     def amount_staked(self):
-        contributions = ProposalContribution.query \
-            .filter_by(proposal_id=self.id, status=ContributionStatus.CONFIRMED, staking=True) \
-            .all()
-        amount = reduce(lambda prev, c: prev + Decimal(c.amount), contributions, 0)
-        return str(amount)
+        return self.funding.staked if self.funding else '0'
+
+    @amount_staked.expression
+    def amount_staked(cls):
+        return ledger_amount(ProposalFunding.staked, cls.id)
 
     @hybrid_property
     def funded(self):
@@ -890,6 +1068,14 @@ class Proposal(db.Model):
 
         return str(funded.quantize(Decimal('.001'), rounding=ROUND_DOWN))
 
+    @funded.expression
+    def funded(cls):
+        # unlike the instance value this is not quantized to 3 decimals
+        target = cast(cls.target, db.Numeric)
+        funded = cls.contributed * (1 + cast(cls.contribution_matching, db.Numeric)) \
+            + cast(func.coalesce(cls.contribution_bounty, '0'), db.Numeric)
+        return case([(funded > target, target)], else_=funded)
+
     @hybrid_property
     def is_staked(self):
         return True
@@ -898,14 +1084,27 @@ class Proposal(db.Model):
     def is_funded(self):
         return self.is_staked and Decimal(self.funded) >= Decimal(self.target)
 
+    @is_funded.expression
+    def is_funded(cls):
+        return cls.funded >= cast(cls.target, db.Numeric)
+
+    @hybrid_property
+    def deadline(self):
+        if not self.date_published or self.deadline_duration is None:
+            return None
+        return self.date_published + datetime.timedelta(seconds=self.deadline_duration)
+
+    @deadline.expression
+    def deadline(cls):
+        return add_seconds(cls.date_published, cls.deadline_duration)
+
     @hybrid_property
     def is_failed(self):
         if not self.status == ProposalStatus.LIVE or not self.date_published:
             return False
         if self.stage == ProposalStage.FAILED or self.stage == ProposalStage.CANCELED:
             return True
-        deadline = self.date_published + datetime.timedelta(seconds=self.deadline_duration)
-        passed = deadline < datetime.datetime.now()
+        passed = self.deadline < datetime.datetime.now()
         return passed and not self.is_funded
 
     @hybrid_property
@@ -924,35 +1123,19 @@ class Proposal(db.Model):
 
     @hybrid_property
     def authed_follows(self):
-        from grant.utils.auth import get_authed_user
-
-        authed = get_authed_user()
-        if not authed:
-            return False
-        res = (
-            db.session.query(proposal_follower)
-                .filter_by(user_id=authed.id, proposal_id=self.id)
-                .count()
-        )
-        if res:
-            return True
-        return False
+        return viewer_relation(proposal_follower, "proposal_id", self.id)
 
     @hybrid_property
     def authed_liked(self):
-        from grant.utils.auth import get_authed_user
+        return viewer_relation(proposal_liker, "proposal_id", self.id)
 
-        authed = get_authed_user()
-        if not authed:
-            return False
-        res = (
-            db.session.query(proposal_liker)
-                .filter_by(user_id=authed.id, proposal_id=self.id)
-                .count()
-        )
-        if res:
-            return True
-        return False
+    @staticmethod
+    def load_viewer_relations(proposals, fields=("authed_follows", "authed_liked")):
+        ids = [p.id for p in proposals]
+        if "authed_follows" in fields:
+            load_viewer_relations(proposal_follower, "proposal_id", ids)
+        if "authed_liked" in fields:
+            load_viewer_relations(proposal_liker, "proposal_id", ids)
 
     @hybrid_property
     def get_tip_jar_view_key(self):
@@ -1128,6 +1311,33 @@ class ProposalSchema(ma.Schema):
     rfp = ma.Nested("RFPSchema", exclude=["accepted_proposals"])
     arbiter = ma.Nested("ProposalArbiterSchema", exclude=["proposal"])
 
+    # relationships read by each field, see grant.utils.loading
+    LOAD_PLAN = {
+        "team": ("team", "selectinload"),
+        "updates": ("updates", "selectinload"),
+        "milestones": ("milestones", "selectinload"),
+        "current_milestone": ("milestones", "selectinload"),
+        "invites": ("invites", "selectinload"),
+        "rfp": ("rfp", "joinedload"),
+        "arbiter": ("arbiter", "joinedload"),
+        "tip_jar_view_key": ("team", "selectinload"),
+        "live_draft_id": ("live_draft", "selectinload"),
+    }
+    # columns deferred unless their field is dumped
+    LARGE_COLUMNS = {
+        "content": "content",
+    }
+
+    @pre_dump(pass_many=True)
+    def load_funding(self, data, many):
+        Proposal.load_funding(data if many else [data])
+        return data
+
+    @pre_dump(pass_many=True)
+    def load_viewer_relations(self, data, many):
+        Proposal.load_viewer_relations(data if many else [data], self.fields)
+        return data
+
     def get_funded_by_zomg(self, obj):
         if obj.funded_by_zomg is None:
             return False
@@ -1182,6 +1392,29 @@ user_fields = [
 ]
 user_proposal_schema = ProposalSchema(only=user_fields)
 user_proposals_schema = ProposalSchema(many=True, only=user_fields)
+# what a proposal card needs, for the public list and home page
+card_fields = [
+    "proposal_id",
+    "status",
+    "stage",
+    "title",
+    "brief",
+    "target",
+    "funded",
+    "contribution_matching",
+    "contribution_bounty",
+    "date_created",
+    "date_published",
+    "accepted_with_funding",
+    "funded_by_zomg",
+    "is_version_two",
+    "authed_liked",
+    "likes_count",
+    "team.userid",
+    "team.display_name",
+    "team.avatar",
+]
+proposal_cards_schema = ProposalSchema(many=True, only=card_fields)
 
 
 class ProposalUpdateSchema(ma.Schema):
@@ -1309,6 +1542,11 @@ class ProposalContributionSchema(ma.Schema):
 
     proposal = ma.Nested("ProposalSchema")
     user = ma.Nested("UserSchema", default=anonymous_user)
+
+    LOAD_PLAN = {
+        "proposal": ("proposal", "joinedload"),
+        "user": ("user", "joinedload"),
+    }
     date_created = ma.Method("get_date_created")
     addresses = ma.Method("get_addresses")
     is_anonymous = ma.Method("get_is_anonymous")
@@ -1363,6 +1601,12 @@ class AdminProposalContributionSchema(ma.Schema):
 
     proposal = ma.Nested("ProposalSchema")
     user = ma.Nested("UserSchema")
+
+    LOAD_PLAN = {
+        "proposal": ("proposal", "joinedload"),
+        "user": ("user", "joinedload"),
+    }
+
     date_created = ma.Method("get_date_created")
     addresses = ma.Method("get_addresses")
 
@@ -1390,6 +1634,11 @@ class ProposalArbiterSchema(ma.Schema):
     user = ma.Nested("UserSchema")  # , exclude=['arbiter_proposals'] (if UserSchema ever includes it)
     proposal = ma.Nested("ProposalSchema", exclude=['arbiter'])
 
+    LOAD_PLAN = {
+        "user": ("user", "joinedload"),
+        "proposal": ("proposal", "joinedload"),
+    }
+
 
 user_proposal_arbiter_schema = ProposalArbiterSchema(exclude=['user'])
 user_proposal_arbiters_schema = ProposalArbiterSchema(many=True, exclude=['user'])
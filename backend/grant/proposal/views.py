@@ -9,7 +9,7 @@ from webargs import validate
 
 from grant.extensions import limiter
 from grant.comment.models import Comment, comment_schema, comments_schema
-from grant.email.send import send_email
+from grant.email.send import send_email, send_fanout_email, get_subscription
 from grant.milestone.models import Milestone
 from grant.parser import body, query, paginated_fields
 from grant.rfp.models import RFP
@@ -26,6 +26,7 @@ from grant.utils.auth import (
     internal_webhook
 )
 from grant.utils.validate import is_z_address_valid
+from grant.utils.versioning import make_etag, conditional
 from grant.utils.enums import Category
 from grant.utils.enums import ProposalStatus, ProposalStage, ContributionStatus, RFPStatus
 from grant.utils.exceptions import ValidationException
@@ -33,6 +34,7 @@ from grant.utils.misc import is_email, make_url, from_zat, make_explore_url
 from .models import (
     Proposal,
     proposals_schema,
+    proposal_cards_schema,
     proposal_schema,
     ProposalUpdate,
     proposal_update_schema,
@@ -52,18 +54,30 @@ blueprint = Blueprint("proposal", __name__, url_prefix="/api/v1/proposals")
 
 @blueprint.route("/<proposal_id>", methods=["GET"])
 def get_proposal(proposal_id):
-    proposal = Proposal.query.filter_by(id=proposal_id).first()
+    proposal = Proposal.query \
+        .options(db.joinedload(Proposal.funding), db.joinedload(Proposal.rfp)) \
+        .filter_by(id=proposal_id) \
+        .first()
     if proposal:
         if proposal.status == ProposalStatus.ARCHIVED:
             return {"message": "Proposal has been archived"}, 401
+        authed_user = get_authed_user()
         if proposal.status not in [ProposalStatus.LIVE, ProposalStatus.DISCUSSION]:
             if proposal.status == ProposalStatus.DELETED:
                 return {"message": "Proposal was deleted"}, 404
-            authed_user = get_authed_user()
             team_ids = list(x.id for x in proposal.team)
             if not authed_user or authed_user.id not in team_ids:
                 return {"message": "User cannot view this proposal"}, 404
-        return proposal_schema.dump(proposal)
+        etag = make_etag(
+            "proposal",
+            proposal.id,
+            proposal.row_version,
+            proposal.funding.version if proposal.funding else None,
+            proposal.rfp.is_past_close if proposal.rfp else None,
+            proposal.is_failed,
+            authed_user.id if authed_user else None,
+        )
+        return conditional(etag, lambda: proposal_schema.dump(proposal))
     else:
         return {"message": "No proposal matching id"}, 404
 
@@ -83,7 +97,7 @@ def get_archived_proposal(proposal_id):
 
 @blueprint.route("/<proposal_id>/comments", methods=["GET"])
 @query(paginated_fields)
-def get_proposal_comments(proposal_id, page, filters, search, sort):
+def get_proposal_comments(proposal_id, page, filters, search, sort, cursor, with_total, estimate_total):
     # only using page, currently
     filters_workaround = request.args.getlist('filters[]')
     page = pagination.comment(
@@ -93,6 +107,9 @@ def get_proposal_comments(proposal_id, page, filters, search, sort):
         filters=filters_workaround,
         search=search,
         sort=sort,
+        cursor=cursor,
+        with_total=with_total,
+        estimate_total=estimate_total,
     )
     return page
 
@@ -179,7 +196,7 @@ def post_proposal_comments(proposal_id, comment, parent_comment_id):
 
 @blueprint.route("/", methods=["GET"])
 @query(paginated_fields)
-def get_proposals(page, filters, search, sort):
+def get_proposals(page, filters, search, sort, cursor, with_total, estimate_total):
     filters_workaround = request.args.getlist('filters[]')
     query = Proposal.query.filter(or_(
             Proposal.status == ProposalStatus.LIVE,
@@ -188,12 +205,15 @@ def get_proposals(page, filters, search, sort):
         .filter(Proposal.stage != ProposalStage.CANCELED) \
         .filter(Proposal.stage != ProposalStage.FAILED)
     page = pagination.proposal(
-        schema=proposals_schema,
+        schema=proposal_cards_schema,
         query=query,
         page=page,
         filters=filters_workaround,
         search=search,
         sort=sort,
+        cursor=cursor,
+        with_total=with_total,
+        estimate_total=estimate_total,
     )
     return page
 
@@ -489,12 +509,13 @@ def post_proposal_update(proposal_id, title, content):
     db.session.commit()
 
     # Send email to all contributors
-    for u in g.current_proposal.contributors:
-        send_email(u.email_address, 'contribution_update', {
-            'proposal': g.current_proposal,
-            'proposal_update': update,
-            'update_url': make_url(f'/proposals/{proposal_id}?tab=updates&update={update.id}'),
-        })
+    args = {
+        'proposal': g.current_proposal,
+        'proposal_update': update,
+        'update_url': make_url(f'/proposals/{proposal_id}?tab=updates&update={update.id}'),
+    }
+    contributors = g.current_proposal.subscribed_contributors(get_subscription('contribution_update', args))
+    send_fanout_email('contribution_update', args, [u.email_address for u in contributors])
 
     # Send email to all followers
     g.current_proposal.send_follower_email(
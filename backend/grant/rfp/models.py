@@ -1,12 +1,14 @@
 from datetime import datetime
 from decimal import Decimal
 from grant.extensions import ma, db
+from marshmallow import pre_dump
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy import func, select
 from sqlalchemy.orm import column_property
 from grant.utils.enums import RFPStatus
 from grant.utils.misc import dt_to_unix, gen_random_id
 from grant.utils.enums import Category
+from grant.utils.viewer import load_viewer_relations, update_viewer_relation, viewer_relation
 
 rfp_liker = db.Table(
     "rfp_liker",
@@ -33,6 +35,8 @@ class RFP(db.Model):
     date_opened = db.Column(db.DateTime, nullable=True)
     date_closed = db.Column(db.DateTime, nullable=True)
     version = db.Column(db.String(255), nullable=True)
+    # bumped whenever its detail response changes, see grant.utils.versioning
+    row_version = db.Column(db.Integer(), nullable=False, default=0, server_default=db.text("0"))
 
     ccr = db.relationship("CCR", uselist=False, back_populates="rfp")
 
@@ -70,21 +74,14 @@ class RFP(db.Model):
         else:
             self._bounty = None
 
+    # RFPs read as closed once date_closes passes, whatever their status
+    @property
+    def is_past_close(self):
+        return bool(self.date_closes and self.date_closes <= datetime.today())
+
     @hybrid_property
     def authed_liked(self):
-        from grant.utils.auth import get_authed_user
-
-        authed = get_authed_user()
-        if not authed:
-            return False
-        res = (
-            db.session.query(rfp_liker)
-            .filter_by(user_id=authed.id, rfp_id=self.id)
-            .count()
-        )
-        if res:
-            return True
-        return False
+        return viewer_relation(rfp_liker, "rfp_id", self.id)
 
     def like(self, user, is_liked):
         if is_liked:
@@ -92,6 +89,11 @@ class RFP(db.Model):
         else:
             self.likes.remove(user)
         db.session.flush()
+        update_viewer_relation(rfp_liker, "rfp_id", user, self.id, is_liked)
+
+    @staticmethod
+    def load_viewer_relations(rfps):
+        load_viewer_relations(rfp_liker, "rfp_id", [r.id for r in rfps])
 
     def __init__(
         self,
@@ -147,9 +149,20 @@ class RFPSchema(ma.Schema):
     accepted_proposals = ma.Nested("ProposalSchema", many=True, exclude=["rfp"])
     is_version_two = ma.Method("get_is_version_two")
 
+    LOAD_PLAN = {
+        "ccr": ("ccr", "joinedload"),
+        "accepted_proposals": ("accepted_proposals", "selectinload"),
+    }
+
+    @pre_dump(pass_many=True)
+    def load_viewer_relations(self, data, many):
+        if "authed_liked" in self.fields:
+            RFP.load_viewer_relations(data if many else [data])
+        return data
+
     def get_status(self, obj):
         # Force it into closed state if date_closes is in the past
-        if obj.date_closes and obj.date_closes <= datetime.today():
+        if obj.is_past_close:
             return RFPStatus.CLOSED
         return obj.status
 
@@ -2,7 +2,10 @@ from flask import Blueprint, g
 from sqlalchemy import or_
 
 from grant.utils.enums import RFPStatus
-from grant.utils.auth import requires_auth
+from grant.utils.auth import requires_auth, get_authed_user
+from grant.utils.loading import eager
+from grant.utils.response_cache import cached_public_response
+from grant.utils.versioning import make_etag, conditional
 from grant.parser import body
 from .models import RFP, rfp_schema, rfps_schema, db
 from marshmallow import fields
@@ -11,8 +14,9 @@ blueprint = Blueprint("rfp", __name__, url_prefix="/api/v1/rfps")
 
 
 @blueprint.route("/", methods=["GET"])
+@cached_public_response("rfp:list", ["rfp", "proposal"])
 def get_rfps():
-    rfps = RFP.query \
+    rfps = eager(RFP.query, rfps_schema, RFP) \
         .filter(or_(
         RFP.status == RFPStatus.LIVE,
         RFP.status == RFPStatus.CLOSED,
@@ -27,7 +31,9 @@ def get_rfp(rfp_id):
     rfp = RFP.query.filter_by(id=rfp_id).first()
     if not rfp or rfp.status == RFPStatus.DRAFT:
         return {"message": "No RFP with that ID"}, 404
-    return rfp_schema.dump(rfp)
+    authed_user = get_authed_user()
+    etag = make_etag("rfp", rfp.id, rfp.row_version, rfp.is_past_close, authed_user.id if authed_user else None)
+    return conditional(etag, lambda: rfp_schema.dump(rfp))
 
 
 @blueprint.route("/<rfp_id>/like", methods=["PUT"])
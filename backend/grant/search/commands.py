@@ -0,0 +1,46 @@
+import time
+
+import click
+from flask.cli import with_appcontext
+
+from .models import db, searchables, search_filter, ilike_filter, write_documents
+
+
+@click.command()
+@click.option('--entity', type=click.Choice(['proposal', 'ccr', 'rfp', 'comment', 'user']), default=None,
+              help='Only rebuild documents for one entity type')
+@click.option('--batch-size', default=500, help='Rows written per transaction')
+@with_appcontext
+def search_backfill(entity, batch_size):
+    for entity_type, (model, fields) in searchables().items():
+        if entity and entity != entity_type:
+            continue
+        last_id = 0
+        written = 0
+        while True:
+            rows = model.query.filter(model.id > last_id).order_by(model.id).limit(batch_size).all()
+            if not rows:
+                break
+            write_documents(db.session, entity_type, rows, fields)
+            db.session.commit()
+            last_id = rows[-1].id
+            written += len(rows)
+        print(f'Indexed {written} {entity_type} documents')
+
+
+@click.command()
+@click.argument('term')
+@click.option('--runs', default=5, help='Timed runs per query')
+@with_appcontext
+def search_benchmark(term, runs):
+    def timed(query):
+        count = query.count()
+        start = time.perf_counter()
+        for _ in range(runs):
+            query.count()
+        return (time.perf_counter() - start) * 1000 / runs, count
+
+    for entity_type, (model, fields) in searchables().items():
+        ilike_ms, ilike_count = timed(model.query.filter(ilike_filter(model, fields, term)))
+        index_ms, index_count = timed(search_filter(model.query, entity_type, model.id, term))
+        print(f'{entity_type:<10} ilike {ilike_ms:8.2f}ms ({ilike_count})  index {index_ms:8.2f}ms ({index_count})')
@@ -0,0 +1,125 @@
+from sqlalchemy import and_, bindparam, event, func, inspect, or_
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import Session
+
+from grant.extensions import db
+
+
+class SearchDocument(db.Model):
+    """
+    Searchable text for one row of a searchable model (see `searchables`).
+    On Postgres `vector` holds a GIN indexed tsvector of `document`,
+    elsewhere searches fall back to matching `document` directly.
+    """
+    __tablename__ = "search_document"
+    __table_args__ = (
+        db.UniqueConstraint("entity_type", "entity_id"),
+        db.Index("ix_search_document_vector", "vector", postgresql_using="gin"),
+    )
+
+    id = db.Column(db.Integer(), primary_key=True)
+    entity_type = db.Column(db.String(255), nullable=False)
+    entity_id = db.Column(db.Integer(), nullable=False)
+    document = db.Column(db.Text, nullable=False)
+    vector = db.Column(TSVECTOR().with_variant(db.Text(), "sqlite"), nullable=True)
+
+
+# entity type -> (model, fields the document is built from)
+def searchables():
+    from grant.ccr.models import CCR
+    from grant.comment.models import Comment
+    from grant.proposal.models import Proposal
+    from grant.rfp.models import RFP
+    from grant.user.models import User
+
+    return {
+        "proposal": (Proposal, ["title"]),
+        "ccr": (CCR, ["title"]),
+        "rfp": (RFP, ["title", "brief"]),
+        "comment": (Comment, ["content"]),
+        "user": (User, ["display_name", "email_address"]),
+    }
+
+
+def is_postgres(session=None):
+    return (session or db.session).get_bind().dialect.name == "postgresql"
+
+
+def make_document(instance, fields):
+    return " ".join(getattr(instance, f) or "" for f in fields).lower()
+
+
+def write_documents(session, entity_type: str, instances, fields):
+    instances = list(instances)
+    if not instances:
+        return
+    table = SearchDocument.__table__
+    session.execute(table.delete().where(and_(
+        table.c.entity_type == entity_type,
+        table.c.entity_id.in_([i.id for i in instances]),
+    )))
+    values = {
+        "entity_type": bindparam("e_type"),
+        "entity_id": bindparam("e_id"),
+        "document": bindparam("e_document"),
+    }
+    if is_postgres(session):
+        values["vector"] = func.to_tsvector("simple", bindparam("e_document"))
+    rows = [{
+        "e_type": entity_type,
+        "e_id": i.id,
+        "e_document": make_document(i, fields),
+    } for i in instances]
+    session.execute(table.insert().values(**values), rows)
+
+
+def delete_documents(session, entity_type: str, ids):
+    table = SearchDocument.__table__
+    session.execute(table.delete().where(and_(
+        table.c.entity_type == entity_type,
+        table.c.entity_id.in_(ids),
+    )))
+
+
+@event.listens_for(Session, "after_flush")
+def sync_search_documents(session, flush_context):
+    if not (session.new or session.dirty or session.deleted):
+        return
+    for entity_type, (model, fields) in searchables().items():
+        changed = [i for i in session.new if isinstance(i, model)]
+        for i in session.dirty:
+            if isinstance(i, model):
+                attrs = inspect(i).attrs
+                if any(attrs[f].history.has_changes() for f in fields):
+                    changed.append(i)
+        write_documents(session, entity_type, changed, fields)
+        removed = [i.id for i in session.deleted if isinstance(i, model)]
+        if removed:
+            delete_documents(session, entity_type, removed)
+
+
+def prefix_tsquery(term: str):
+    """Every word in `term` as a quoted prefix match, ANDed together."""
+    words = [w.replace("\\", "\\\\").replace("'", "''") for w in term.lower().split()]
+    return " & ".join(f"'{w}':*" for w in words)
+
+
+def search_filter(query, entity_type: str, id_column, term: str):
+    query = query.join(SearchDocument, and_(
+        SearchDocument.entity_type == entity_type,
+        SearchDocument.entity_id == id_column,
+    ))
+    if is_postgres() and prefix_tsquery(term):
+        return query.filter(SearchDocument.vector.op("@@")(func.to_tsquery("simple", prefix_tsquery(term))))
+    return query.filter(SearchDocument.document.contains(term.lower()))
+
+
+# relevance of the joined document, None where the database can't rank
+def search_rank(term: str):
+    if not is_postgres() or not prefix_tsquery(term):
+        return None
+    return func.ts_rank(SearchDocument.vector, func.to_tsquery("simple", prefix_tsquery(term)))
+
+
+def ilike_filter(model, fields, term: str):
+    return or_(*[getattr(model, f).ilike(f"%{term}%") for f in fields])
@@ -25,7 +25,14 @@ SECRET_KEY = env.str("SECRET_KEY")
 BCRYPT_LOG_ROUNDS = env.int("BCRYPT_LOG_ROUNDS", default=13)
 DEBUG_TB_ENABLED = DEBUG
 DEBUG_TB_INTERCEPT_REDIRECTS = False
-CACHE_TYPE = "simple"  # Can be "memcached", "redis", etc.
+# "simple" (in-process), "filesystem" (needs CACHE_DIR) or "redis" (needs CACHE_REDIS_URL).
+# In-process caches are only invalidated by the worker that made the change,
+# use a shared backend when running several workers.
+CACHE_TYPE = env.str("CACHE_TYPE", default="simple")
+CACHE_DEFAULT_TIMEOUT = env.int("CACHE_DEFAULT_TIMEOUT", default=60)
+CACHE_THRESHOLD = env.int("CACHE_THRESHOLD", default=500)
+CACHE_DIR = env.str("CACHE_DIR", default=None)
+CACHE_REDIS_URL = env.str("CACHE_REDIS_URL", default=None)
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
 # so backend session cookies are first-party
@@ -37,6 +44,26 @@ SESSION_COOKIE_SECURE = True if SESSION_COOKIE_SAMESITE == 'None' else False
 SENDGRID_API_KEY = env.str("SENDGRID_API_KEY", default="")
 SENDGRID_DEFAULT_FROM = "noreply@grants.zfnd.org"
 SENDGRID_DEFAULT_FROMNAME = "ZF Grants"
+# emails are queued in email_outbox and delivered by a sender with
+# EMAIL_SENDER_THREADS concurrent sends, on a background thread of each web and
+# task process unless EMAIL_SENDER_INLINE is off and `flask email-worker` runs.
+# EMAIL_BACKEND "sendgrid" delivers, "sink" only records (for benchmarks)
+EMAIL_BACKEND = env.str("EMAIL_BACKEND", default="e2e" if E2E_TESTING else "sendgrid")
+EMAIL_SENDER_INLINE = env.bool("EMAIL_SENDER_INLINE", default=True)
+EMAIL_SENDER_THREADS = env.int("EMAIL_SENDER_THREADS", default=4)
+EMAIL_BATCH_SIZE = env.int("EMAIL_BATCH_SIZE", default=100)
+EMAIL_LEASE_SECONDS = env.int("EMAIL_LEASE_SECONDS", default=120)
+EMAIL_POLL_SECONDS = env.int("EMAIL_POLL_SECONDS", default=60)
+# failed sends are retried after EMAIL_RETRY_SECONDS, doubling each attempt up
+# to EMAIL_RETRY_MAX_SECONDS, and dead-lettered after EMAIL_MAX_ATTEMPTS
+EMAIL_MAX_ATTEMPTS = env.int("EMAIL_MAX_ATTEMPTS", default=5)
+EMAIL_RETRY_SECONDS = env.int("EMAIL_RETRY_SECONDS", default=60)
+EMAIL_RETRY_MAX_SECONDS = env.int("EMAIL_RETRY_MAX_SECONDS", default=60 * 60)
+# email templates are compiled to bytecode in EMAIL_TEMPLATE_CACHE_DIR (a temp
+# directory if blank), and all of them up front when EMAIL_TEMPLATE_WARMUP is on
+EMAIL_TEMPLATE_CACHE = env.bool("EMAIL_TEMPLATE_CACHE", default=True)
+EMAIL_TEMPLATE_CACHE_DIR = env.str("EMAIL_TEMPLATE_CACHE_DIR", default="")
+EMAIL_TEMPLATE_WARMUP = env.bool("EMAIL_TEMPLATE_WARMUP", default=True)
 
 SENTRY_DSN = env.str("SENTRY_DSN", default=None)
 SENTRY_RELEASE = env.str("SENTRY_RELEASE", default=None)
@@ -69,6 +96,34 @@ EXPLORER_URL = env.str("EXPLORER_URL", default="https://chain.so/tx/ZECTEST/<txi
 PROPOSAL_STAKING_AMOUNT = Decimal(env.str("PROPOSAL_STAKING_AMOUNT"))
 PROPOSAL_TARGET_MAX = Decimal(env.str("PROPOSAL_TARGET_MAX"))
 
+# seconds a paginated listing total is reused for, 0 disables caching
+PAGINATION_COUNT_TTL = env.int("PAGINATION_COUNT_TTL", default=30)
+# estimated totals are only used for tables the planner thinks are at least this big
+PAGINATION_ESTIMATE_MIN = env.int("PAGINATION_ESTIMATE_MIN", default=10000)
+
+# `flask task-worker`: threads running claimed tasks, tasks claimed per batch,
+# seconds a claim is held before another worker may take the task over, and
+# seconds to wait for new tasks once the queue is drained
+TASK_WORKER_THREADS = env.int("TASK_WORKER_THREADS", default=4)
+TASK_BATCH_SIZE = env.int("TASK_BATCH_SIZE", default=50)
+TASK_LEASE_SECONDS = env.int("TASK_LEASE_SECONDS", default=300)
+TASK_POLL_SECONDS = env.int("TASK_POLL_SECONDS", default=5)
+# completed tasks older than this are moved out by `flask task-archive`, which
+# also drops task run metrics (task_run) of the same age
+TASK_RETENTION_DAYS = env.int("TASK_RETENTION_DAYS", default=30)
+# failed tasks are retried after TASK_RETRY_SECONDS, doubling each attempt up to
+# TASK_RETRY_MAX_SECONDS, and dead-lettered after TASK_MAX_ATTEMPTS failures
+TASK_MAX_ATTEMPTS = env.int("TASK_MAX_ATTEMPTS", default=5)
+TASK_RETRY_SECONDS = env.int("TASK_RETRY_SECONDS", default=60)
+TASK_RETRY_MAX_SECONDS = env.int("TASK_RETRY_MAX_SECONDS", default=6 * 60 * 60)
+# run due tasks on a thread of the web process instead of `flask task-worker`
+# or a cron, for single node deployments. It wakes at least every
+# TASK_SCHEDULER_MAX_SLEEP seconds to see tasks added by other processes
+TASK_SCHEDULER = env.bool("TASK_SCHEDULER", default=False)
+TASK_SCHEDULER_MAX_SLEEP = env.int("TASK_SCHEDULER_MAX_SLEEP", default=60)
+# bearer token for the Prometheus endpoint at /api/v1/task/metrics, unset disables it
+TASK_METRICS_TOKEN = env.str("TASK_METRICS_TOKEN", default=None)
+
 
 UI = {
     'NAME': 'ZF Grants',
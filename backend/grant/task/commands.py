@@ -1,10 +1,16 @@
 import ast
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 
 import click
 from flask.cli import with_appcontext
 
+from grant.email.templates import warm_up as warm_up_email_templates
+from grant.settings import TASK_WORKER_THREADS, TASK_BATCH_SIZE, TASK_POLL_SECONDS, TASK_RETENTION_DAYS, \
+    EMAIL_TEMPLATE_WARMUP
 from .models import Task, db
+from .retention import archive_tasks, prune_runs
+from .worker import run_due_tasks, due_tasks
 
 
 @click.command()
@@ -15,3 +21,74 @@ def create_task(job_type, blob):
     task = Task(ast.literal_eval(job_type), ast.literal_eval(blob), datetime.now())
     db.session.add(task)
     db.session.commit()
+
+
+@click.command()
+@click.option('--threads', default=TASK_WORKER_THREADS, help='Tasks run concurrently')
+@click.option('--batch-size', default=TASK_BATCH_SIZE, help='Tasks claimed at a time')
+@click.option('--once', is_flag=True, default=False, help='Run a single batch and exit')
+@with_appcontext
+def task_worker(threads, batch_size, once):
+    # tasks send most of the email, compile the templates before the first one
+    if EMAIL_TEMPLATE_WARMUP:
+        warm_up_email_templates()
+    print(f'Task worker running with {threads} threads')
+    while True:
+        ids, results = run_due_tasks(limit=batch_size, threads=threads)
+        if ids:
+            print(f'Ran {len(ids)} tasks, {results.count(False)} failed')
+        if once:
+            break
+        # keep going while the queue is backed up
+        if len(ids) < batch_size:
+            time.sleep(TASK_POLL_SECONDS)
+
+
+@click.command()
+@click.option('--days', default=TASK_RETENTION_DAYS, help='Keep completed tasks due within this many days')
+@click.option('--delete', is_flag=True, default=False, help='Delete old tasks instead of archiving them')
+@click.option('--batch-size', default=1000, help='Tasks moved per transaction')
+@with_appcontext
+def task_archive(days, delete, batch_size):
+    before = datetime.now() - timedelta(days=days)
+    archived, removed = archive_tasks(before, delete, batch_size)
+    print(f'Removed {removed} completed tasks due before {before:%Y-%m-%d}, {archived} of them archived')
+    print(f'Removed {prune_runs(before)} task run metrics')
+
+
+# no job has this type, it marks the rows task-benchmark generates
+BENCHMARK_JOB_TYPE = 0
+
+
+@click.command()
+@click.option('--history', default=1000000, help='Completed tasks to add before the last measurement')
+@click.option('--runs', default=20, help='Timed sweeps per measurement')
+@with_appcontext
+def task_benchmark(history, runs):
+    """Times the due-task sweep as completed history grows, then removes the generated rows."""
+    task = Task.__table__
+    past = datetime.now() - timedelta(days=365)
+    added = 0
+    try:
+        for size in sorted({0, history // 100, history // 10, history}):
+            while added < size:
+                chunk = min(10000, size - added)
+                db.session.execute(task.insert(), [{
+                    'job_type': BENCHMARK_JOB_TYPE,
+                    'blob': {},
+                    'execute_after': past,
+                    'completed': True,
+                } for _ in range(chunk)])
+                db.session.commit()
+                added += chunk
+            if db.session.get_bind().dialect.name == 'postgresql':
+                db.session.execute('ANALYZE task')
+            start = time.perf_counter()
+            for _ in range(runs):
+                due_tasks(datetime.now()).limit(TASK_BATCH_SIZE).all()
+            ms = (time.perf_counter() - start) * 1000 / runs
+            print(f'{size:>9} historical tasks: {ms:.2f}ms per sweep')
+    finally:
+        db.session.rollback()
+        db.session.execute(task.delete().where(task.c.job_type == BENCHMARK_JOB_TYPE))
+        db.session.commit()
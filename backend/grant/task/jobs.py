@@ -1,9 +1,14 @@
 from datetime import datetime, timedelta
 
+from sqlalchemy import not_
+from sqlalchemy.orm import selectinload
+
 from grant.extensions import db
-from grant.email.send import send_email
+from grant.email.send import send_email, send_emails
 from grant.utils.enums import ProposalStage, ContributionStatus, ProposalStatus
 from grant.utils.misc import make_url
+from grant.utils.response_cache import tag_session
+from grant.utils.versioning import bump_proposal_relations
 from flask import current_app
 
 
@@ -39,6 +44,8 @@ class ProposalReminder:
 
 class ProposalDeadline:
     JOB_TYPE = 2
+    # v1 stage, proposals published since v2 start out WIP and never fail by deadline
+    FUNDING_REQUIRED = 'FUNDING_REQUIRED'
 
     def __init__(self, proposal):
         self.proposal = proposal
@@ -48,41 +55,83 @@ class ProposalDeadline:
             "proposal_id": self.proposal.id,
         }
 
+    def dedupe_key(self):
+        return f"proposal_deadline:{self.proposal.id}"
+
     def make_task(self):
         from .models import Task
-        task = Task(
+        Task.schedule(
             job_type=self.JOB_TYPE,
             blob=self.blobify(),
             execute_after=self.proposal.date_published + timedelta(seconds=self.proposal.deadline_duration),
+            dedupe_key=self.dedupe_key(),
         )
-        db.session.add(task)
         db.session.commit()
 
     @staticmethod
     def process_task(task):
-        from grant.proposal.models import Proposal
-        proposal = Proposal.query.filter_by(id=task.blob["proposal_id"]).first()
+        ProposalDeadline.process_tasks([task])
 
-        # If it was deleted, canceled, or successful, just noop out
-        if not proposal or proposal.is_funded or proposal.stage != ProposalStage.FUNDING_REQUIRED:
-            return
+    @staticmethod
+    def process_tasks(tasks):
+        ProposalDeadline.fail_expired(datetime.now(), [t.blob["proposal_id"] for t in tasks])
 
-        # Otherwise, mark it as failed and inform everyone
-        proposal.stage = ProposalStage.FAILED
-        db.session.add(proposal)
-        db.session.commit()
+    @staticmethod
+    def fail_expired(now, proposal_ids=None):
+        """
+        Fail every unfunded FUNDING_REQUIRED proposal whose deadline has passed
+        (only those in `proposal_ids` if given) with one UPDATE, and queue the
+        team and contributor emails. Deleted, canceled or successful proposals
+        are left alone. Returns the failed proposal ids, the caller commits.
+        """
+        from grant.proposal.models import Proposal, ProposalContribution
+        from grant.user.models import User
+
+        expired = db.session.query(Proposal.id).filter(
+            Proposal.stage == ProposalDeadline.FUNDING_REQUIRED,
+            Proposal.deadline <= now,
+            not_(Proposal.is_funded),
+        )
+        if proposal_ids is not None:
+            expired = expired.filter(Proposal.id.in_(proposal_ids))
+        failed = [row[0] for row in expired]
+        if not failed:
+            return []
+
+        Proposal.query.filter(Proposal.id.in_(failed)).update({
+            Proposal.stage: ProposalStage.FAILED,
+            Proposal.row_version: Proposal.row_version + 1,
+        }, synchronize_session=False)
+        bump_proposal_relations(failed)
+        tag_session(db.session, {"proposal"})
 
         # Send emails to team & contributors
-        for u in proposal.team:
-            send_email(u.email_address, 'proposal_failed', {
-                'proposal': proposal,
-            })
-        for u in proposal.contributors:
-            send_email(u.email_address, 'contribution_proposal_failed', {
-                'proposal': proposal,
-                'refund_address': u.settings.refund_address,
-                'account_settings_url': make_url('/profile/settings?tab=account')
-            })
+        proposals = Proposal.query \
+            .filter(Proposal.id.in_(failed)) \
+            .options(
+                selectinload(Proposal.team),
+                selectinload(Proposal.contributions)
+                    .joinedload(ProposalContribution.user)
+                    .joinedload(User.settings),
+            ) \
+            .populate_existing() \
+            .order_by(Proposal.id) \
+            .all()
+        # keyed so a retried batch doesn't email anyone twice
+        messages = []
+        for proposal in proposals:
+            for u in proposal.team:
+                messages.append((u.email_address, 'proposal_failed', {
+                    'proposal': proposal,
+                }, f'proposal_failed:{proposal.id}:{u.id}'))
+            for u in proposal.contributors:
+                messages.append((u.email_address, 'contribution_proposal_failed', {
+                    'proposal': proposal,
+                    'refund_address': u.settings.refund_address,
+                    'account_settings_url': make_url('/profile/settings?tab=account')
+                }, f'contribution_proposal_failed:{proposal.id}:{u.id}'))
+        send_emails(messages)
+        return failed
 
 
 class ContributionExpired:
@@ -96,14 +145,17 @@ class ContributionExpired:
             "contribution_id": self.contribution.id,
         }
 
+    def dedupe_key(self):
+        return f"contribution_expired:{self.contribution.id}"
+
     def make_task(self):
         from .models import Task
-        task = Task(
+        Task.schedule(
             job_type=self.JOB_TYPE,
             blob=self.blobify(),
             execute_after=self.contribution.date_created + timedelta(hours=24),
+            dedupe_key=self.dedupe_key(),
         )
-        db.session.add(task)
         db.session.commit()
 
     @staticmethod
@@ -123,7 +175,7 @@ class ContributionExpired:
                 'contact_url': make_url('/contact'),
                 'profile_url': make_url(f'/profile/{contribution.user.id}'),
                 'proposal_url': make_url(f'/proposals/{contribution.proposal.id}'),
-            })
+            }, idempotency_key=f'contribution_expired:{contribution.id}')
 
 
 class PruneDraft:
@@ -138,15 +190,18 @@ class PruneDraft:
             "proposal_id": self.proposal.id,
         }
 
+    def dedupe_key(self):
+        return f"prune_draft:{self.proposal.id}"
+
     def make_task(self):
         from .models import Task
 
-        task = Task(
+        Task.schedule(
             job_type=self.JOB_TYPE,
             blob=self.blobify(),
             execute_after=self.proposal.date_created + timedelta(seconds=self.PRUNE_TIME),
+            dedupe_key=self.dedupe_key(),
         )
-        db.session.add(task)
         db.session.commit()
 
     @staticmethod
@@ -191,14 +246,18 @@ class MilestoneDeadline:
             "update_count": update_count
         }
 
+    def dedupe_key(self):
+        # one per proposal, only the current milestone's deadline matters
+        return f"milestone_deadline:{self.proposal.id}"
+
     def make_task(self):
         from .models import Task
-        task = Task(
+        Task.schedule(
             job_type=self.JOB_TYPE,
             blob=self.blobify(),
             execute_after=self.milestone.date_estimated,
+            dedupe_key=self.dedupe_key(),
         )
-        db.session.add(task)
         db.session.commit()
 
     @staticmethod
@@ -240,3 +299,8 @@ JOBS = {
     4: PruneDraft.process_task,
     5: MilestoneDeadline.process_task
 }
+
+# job types whose due tasks are better processed together, in one transaction
+BATCH_JOBS = {
+    2: ProposalDeadline.process_tasks,
+}
@@ -0,0 +1,186 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, event, func
+from sqlalchemy.engine import Engine
+
+from grant.extensions import db
+from .jobs import JOBS
+from .models import Task, TaskRun
+
+# upper bounds in seconds of the handler duration histogram
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_local = threading.local()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def count_query(conn, cursor, statement, parameters, context, executemany):
+    # only counted on threads inside a RunMeasurement
+    if getattr(_local, "queries", None) is not None:
+        _local.queries += 1
+
+
+class RunMeasurement:
+    """Wall time and SQL statements run by the current thread from creation until `stop`."""
+
+    def __init__(self):
+        self.started_at = datetime.now()
+        self.duration = None
+        self.queries = None
+        self._start = time.perf_counter()
+        _local.queries = 0
+
+    def stop(self):
+        if self.duration is None:
+            self.duration = time.perf_counter() - self._start
+            self.queries = _local.queries
+            _local.queries = None
+        return self
+
+
+def job_name(job_type: int):
+    handler = JOBS.get(job_type)
+    return handler.__qualname__.split(".")[0] if handler else str(job_type)
+
+
+def record_runs(tasks, measurement: RunMeasurement, succeeded: bool):
+    """
+    Add a TaskRun for each of `tasks`, as (job_type, due) pairs, measured
+    together by `measurement`. Tasks run as a batch split its time and queries
+    evenly. The caller commits.
+    """
+    measurement.stop()
+    share = len(tasks) or 1
+    for job_type, due in tasks:
+        db.session.add(TaskRun(
+            job_type=job_type,
+            started_at=measurement.started_at,
+            lag_seconds=max((measurement.started_at - due).total_seconds(), 0),
+            duration_seconds=measurement.duration / share,
+            query_count=round(measurement.queries / share),
+            succeeded=succeeded,
+        ))
+
+
+def run_stats(since: datetime = None):
+    """
+    Per job type counts, lag, duration histogram and query counts of the runs
+    started since `since` (all recorded runs if None), keyed by job type.
+    """
+    columns = [
+        TaskRun.job_type,
+        func.count(TaskRun.id),
+        func.sum(case([(TaskRun.succeeded == True, 1)], else_=0)),
+        func.avg(TaskRun.lag_seconds),
+        func.max(TaskRun.lag_seconds),
+        func.sum(TaskRun.duration_seconds),
+        func.max(TaskRun.duration_seconds),
+        func.sum(TaskRun.query_count),
+        func.max(TaskRun.query_count),
+    ] + [func.sum(case([(TaskRun.duration_seconds <= b, 1)], else_=0)) for b in DURATION_BUCKETS]
+    q = db.session.query(*columns).group_by(TaskRun.job_type)
+    if since:
+        q = q.filter(TaskRun.started_at >= since)
+
+    stats = {}
+    for row in q:
+        job_type, runs, succeeded, lag_avg, lag_max, duration_sum, duration_max, queries_sum, queries_max = row[:9]
+        stats[job_type] = {
+            "job_type": job_type,
+            "name": job_name(job_type),
+            "runs": runs,
+            "succeeded": int(succeeded or 0),
+            "failed": runs - int(succeeded or 0),
+            "lag_avg": float(lag_avg or 0),
+            "lag_max": float(lag_max or 0),
+            "duration_sum": float(duration_sum or 0),
+            "duration_avg": float(duration_sum or 0) / runs,
+            "duration_max": float(duration_max or 0),
+            "queries_sum": int(queries_sum or 0),
+            "queries_avg": int(queries_sum or 0) / runs,
+            "queries_max": int(queries_max or 0),
+            # cumulative, like a Prometheus histogram
+            "duration_buckets": [[b, int(n or 0)] for b, n in zip(DURATION_BUCKETS, row[9:])],
+        }
+    return stats
+
+
+def queue_stats(now: datetime):
+    """Per job type pending and due task counts, and how late the oldest due one is."""
+    due = Task.execute_after <= now
+    q = db.session.query(
+        Task.job_type,
+        func.count(Task.id),
+        func.sum(case([(due, 1)], else_=0)),
+        func.min(case([(due, Task.execute_after)], else_=None)),
+    ) \
+        .filter(Task.completed == False, Task.dead == False) \
+        .group_by(Task.job_type)
+    return {
+        job_type: {
+            "pending": pending,
+            "due": int(due_count or 0),
+            "lag": (now - oldest).total_seconds() if oldest else 0,
+        }
+        for job_type, pending, due_count, oldest in q
+    }
+
+
+def task_metrics(now: datetime, hours: int = None):
+    """Run and queue stats per job type, slowest total handler time first."""
+    since = now - timedelta(hours=hours) if hours else None
+    runs = run_stats(since)
+    queue = queue_stats(now)
+    metrics = []
+    for job_type in sorted(set(JOBS) | set(runs) | set(queue)):
+        metrics.append({
+            "job_type": job_type,
+            "name": job_name(job_type),
+            "runs": runs.get(job_type),
+            "queue": queue.get(job_type, {"pending": 0, "due": 0, "lag": 0}),
+        })
+    metrics.sort(key=lambda m: -(m["runs"] or {}).get("duration_sum", 0))
+    return metrics
+
+
+def prometheus_metrics(now: datetime):
+    """Task metrics in the Prometheus text exposition format."""
+    metrics = task_metrics(now)
+    ran = [m for m in metrics if m["runs"]]
+    lines = []
+
+    def sample(name, m, value, **extra):
+        labels = dict(job_type=m["job_type"], name=m["name"], **extra)
+        label_str = ",".join(f'{k}="{v}"' for k, v in labels.items())
+        lines.append(f"{name}{{{label_str}}} {value}")
+
+    def family(name, kind, help):
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    family("grant_task_runs_total", "counter", "Task runs by result.")
+    for m in ran:
+        sample("grant_task_runs_total", m, m["runs"]["succeeded"], result="succeeded")
+        sample("grant_task_runs_total", m, m["runs"]["failed"], result="failed")
+    family("grant_task_duration_seconds", "histogram", "Task handler duration.")
+    for m in ran:
+        for bound, count in m["runs"]["duration_buckets"]:
+            sample("grant_task_duration_seconds_bucket", m, count, le=bound)
+        sample("grant_task_duration_seconds_bucket", m, m["runs"]["runs"], le="+Inf")
+        sample("grant_task_duration_seconds_sum", m, m["runs"]["duration_sum"])
+        sample("grant_task_duration_seconds_count", m, m["runs"]["runs"])
+    family("grant_task_queries_total", "counter", "SQL statements run by task handlers.")
+    for m in ran:
+        sample("grant_task_queries_total", m, m["runs"]["queries_sum"])
+    family("grant_task_pending", "gauge", "Tasks not yet completed or dead.")
+    for m in metrics:
+        sample("grant_task_pending", m, m["queue"]["pending"])
+    family("grant_task_due", "gauge", "Pending tasks past their execute_after.")
+    for m in metrics:
+        sample("grant_task_due", m, m["queue"]["due"])
+    family("grant_task_queue_lag_seconds", "gauge", "How late the oldest due task is.")
+    for m in metrics:
+        sample("grant_task_queue_lag_seconds", m, m["queue"]["lag"])
+    return "\n".join(lines) + "\n"
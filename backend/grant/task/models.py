@@ -1,7 +1,14 @@
 import json
+from datetime import datetime
 
 from grant.extensions import ma, db
+from sqlalchemy import and_, event, or_
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext import mutable
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.functions import FunctionElement
 
 from .jobs import JOBS
 
@@ -23,23 +30,196 @@ class JsonEncodedDict(db.TypeDecorator):
             return json.loads(value)
 
 
-mutable.MutableDict.associate_with(JsonEncodedDict)
+# JSONB on Postgres, a JSON encoded Text column on SQLite
+TaskBlob = mutable.MutableDict.as_mutable(
+    db.JSON().with_variant(JSONB(), "postgresql").with_variant(JsonEncodedDict(), "sqlite")
+)
+
+
+class blob_text(FunctionElement):
+    """A top level field of a JSON column as text, e.g. `blob_text(Task.blob, "proposal_id")`."""
+    type = db.Text()
+    name = "blob_text"
+
+    def __init__(self, column, field):
+        assert field.isidentifier(), "Not a valid blob field"
+        self.field = field
+        super(blob_text, self).__init__(column)
+
+
+@compiles(blob_text)
+def compile_blob_text(element, compiler, **kw):
+    return "(%s ->> '%s')" % (compiler.process(list(element.clauses)[0], **kw), element.field)
+
+
+@compiles(blob_text, "sqlite")
+def compile_blob_text_sqlite(element, compiler, **kw):
+    return "CAST(json_extract(%s, '$.%s') AS TEXT)" % (compiler.process(list(element.clauses)[0], **kw), element.field)
 
 
 class Task(db.Model):
     __tablename__ = 'task'
+    __table_args__ = (
+        # only pending tasks are indexed, so the due-task sweep doesn't grow with history
+        db.Index(
+            'ix_task_pending_execute_after',
+            'execute_after',
+            postgresql_where=db.text('completed = false AND dead = false'),
+            sqlite_where=db.text('completed = 0 AND dead = 0'),
+        ),
+        # at most one pending task per dedupe_key, finished ones keep theirs as history
+        db.Index(
+            'ix_task_pending_dedupe_key',
+            'dedupe_key',
+            unique=True,
+            postgresql_where=db.text('completed = false AND dead = false'),
+            sqlite_where=db.text('completed = 0 AND dead = 0'),
+        ),
+    )
 
     id = db.Column(db.Integer(), primary_key=True)
     job_type = db.Column(db.Integer(), nullable=False)
-    blob = db.Column(JsonEncodedDict, nullable=False)
+    blob = db.Column(TaskBlob, nullable=False)
     execute_after = db.Column(db.DateTime, nullable=False)
     completed = db.Column(db.Boolean, default=False)
-
-    def __init__(self, job_type, blob, execute_after):
+    # lease of the worker running it, see grant.task.worker
+    claimed_by = db.Column(db.String(255), nullable=True)
+    claimed_until = db.Column(db.DateTime, nullable=True)
+    # failed runs back off until next_attempt_at, after TASK_MAX_ATTEMPTS the task is dead
+    attempts = db.Column(db.Integer(), nullable=False, default=0, server_default=db.text("0"))
+    next_attempt_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    dead = db.Column(db.Boolean, nullable=False, default=False, server_default=db.text("FALSE"))
+    # e.g. "milestone_deadline:<proposal_id>", see Task.schedule
+    dedupe_key = db.Column(db.String(255), nullable=True)
+
+    def __init__(self, job_type, blob, execute_after, dedupe_key=None):
         assert job_type in list(JOBS.keys()), "Not a valid job"
         self.job_type = job_type
         self.blob = blob
         self.execute_after = execute_after
+        self.dedupe_key = dedupe_key
+        self.attempts = 0
+        self.dead = False
+
+    @staticmethod
+    def schedule(job_type, blob, execute_after, dedupe_key=None):
+        """
+        Add a task, or with a `dedupe_key`, reschedule the pending task that
+        has it instead. A task that is being run right now keeps running but
+        gives up its key, so the new schedule still gets a task of its own.
+        The caller commits.
+        """
+        if not dedupe_key:
+            task = Task(job_type=job_type, blob=blob, execute_after=execute_after)
+            db.session.add(task)
+            return task
+        for retry in (False, True):
+            pending = Task.pending_for_key(dedupe_key)
+            if pending and pending.claimed_until and pending.claimed_until >= datetime.now():
+                pending.dedupe_key = None
+                db.session.add(pending)
+                db.session.flush()
+            elif pending:
+                pending.job_type = job_type
+                pending.blob = blob
+                pending.execute_after = execute_after
+                pending.requeue()
+                db.session.add(pending)
+                return pending
+            task = Task(job_type=job_type, blob=blob, execute_after=execute_after, dedupe_key=dedupe_key)
+            try:
+                # a concurrent schedule can insert the key between the lookup and
+                # here, then the unique index rejects ours and the retry finds theirs
+                with db.session.begin_nested():
+                    db.session.add(task)
+                return task
+            except IntegrityError:
+                if retry:
+                    raise
+
+    @staticmethod
+    def pending_for_key(dedupe_key):
+        return Task.query \
+            .filter(Task.dedupe_key == dedupe_key, Task.completed == False, Task.dead == False) \
+            .with_for_update() \
+            .first()
+
+    @staticmethod
+    def pending():
+        return and_(Task.completed == False, Task.dead == False)
+
+    @staticmethod
+    def for_proposal(proposal_id):
+        # pending ones are served by the ix_task_pending_proposal_id expression index
+        return blob_text(Task.blob, "proposal_id") == str(proposal_id)
+
+    @staticmethod
+    def cancel_for_proposal(proposal_id, job_types=None, session=None, **blob):
+        """
+        Delete a proposal's pending tasks in one statement, only those of
+        `job_types` and with matching `blob` fields if given, and return how
+        many. Tasks being run right now are left to finish. The caller commits.
+        """
+        criteria = [
+            Task.pending(),
+            Task.for_proposal(proposal_id),
+            or_(Task.claimed_until == None, Task.claimed_until < datetime.now()),
+        ]
+        if job_types:
+            criteria.append(Task.job_type.in_(job_types))
+        for field, value in blob.items():
+            criteria.append(blob_text(Task.blob, field) == str(value))
+        return (session or db.session).execute(Task.__table__.delete().where(and_(*criteria))).rowcount
+
+    def requeue(self):
+        self.dead = False
+        self.attempts = 0
+        self.next_attempt_at = None
+        self.claimed_by = None
+        self.claimed_until = None
+
+
+db.Index(
+    'ix_task_pending_proposal_id',
+    blob_text(Task.blob, "proposal_id"),
+    postgresql_where=db.text('completed = false AND dead = false'),
+    sqlite_where=db.text('completed = 0 AND dead = 0'),
+)
+
+
+# however a proposal is deleted, none of its tasks can do anything anymore
+@event.listens_for(Session, "after_flush")
+def cancel_deleted_proposal_tasks(session, flush_context):
+    from grant.proposal.models import Proposal
+    for instance in session.deleted:
+        if isinstance(instance, Proposal):
+            Task.cancel_for_proposal(instance.id, session=session)
+
+
+class TaskArchive(db.Model):
+    """Completed tasks moved out of `task` by `flask task-archive`."""
+    __tablename__ = 'task_archive'
+
+    id = db.Column(db.Integer(), primary_key=True)
+    job_type = db.Column(db.Integer(), nullable=False)
+    blob = db.Column(db.Text, nullable=False)
+    execute_after = db.Column(db.DateTime, nullable=False)
+    date_archived = db.Column(db.DateTime, nullable=False)
+
+
+class TaskRun(db.Model):
+    """One run of a task, recorded by grant.task.worker for grant.task.metrics."""
+    __tablename__ = 'task_run'
+
+    id = db.Column(db.Integer(), primary_key=True)
+    job_type = db.Column(db.Integer(), nullable=False)
+    started_at = db.Column(db.DateTime, nullable=False, index=True)
+    # seconds between the task being due and starting
+    lag_seconds = db.Column(db.Float, nullable=False)
+    duration_seconds = db.Column(db.Float, nullable=False)
+    query_count = db.Column(db.Integer(), nullable=False)
+    succeeded = db.Column(db.Boolean, nullable=False)
 
 
 class TaskSchema(ma.Schema):
@@ -51,7 +231,12 @@ class TaskSchema(ma.Schema):
             "job_type",
             "blob",
             "execute_after",
-            "completed"
+            "completed",
+            "attempts",
+            "next_attempt_at",
+            "last_error",
+            "dead",
+            "dedupe_key",
         )
 
 
@@ -0,0 +1,42 @@
+from datetime import datetime
+
+from sqlalchemy import literal, select
+
+from grant.extensions import db
+from .models import Task, TaskArchive, TaskRun
+
+
+def archive_tasks(before: datetime, delete: bool = False, batch_size: int = 1000):
+    """
+    Move completed tasks due before `before` into task_archive, or just delete
+    them, in batches of `batch_size`. Tasks don't record when they finished, so
+    their due date stands in. Returns (archived, removed) counts.
+    """
+    task = Task.__table__
+    now = datetime.now()
+    archived = removed = 0
+    while True:
+        ids = [row[0] for row in db.session.query(Task.id)
+            .filter(Task.completed == True, Task.execute_after < before)
+            .order_by(Task.id)
+            .limit(batch_size)]
+        if not ids:
+            break
+        if not delete:
+            columns = [task.c.id, task.c.job_type, task.c.blob, task.c.execute_after, literal(now)]
+            db.session.execute(TaskArchive.__table__.insert().from_select(
+                ['id', 'job_type', 'blob', 'execute_after', 'date_archived'],
+                select(columns).where(task.c.id.in_(ids)),
+            ))
+            archived += len(ids)
+        db.session.execute(task.delete().where(task.c.id.in_(ids)))
+        removed += len(ids)
+        db.session.commit()
+    return archived, removed
+
+
+def prune_runs(before: datetime):
+    """Delete the TaskRun metrics of runs started before `before`, returns how many."""
+    removed = TaskRun.query.filter(TaskRun.started_at < before).delete(synchronize_session=False)
+    db.session.commit()
+    return removed
@@ -0,0 +1,124 @@
+import threading
+from datetime import datetime
+
+from flask import current_app, has_app_context
+from sentry_sdk import capture_exception
+from sqlalchemy import event, func, inspect, or_, select
+from sqlalchemy.orm import Session
+
+from grant.extensions import db
+from grant.settings import TASK_BATCH_SIZE, TASK_SCHEDULER_MAX_SLEEP
+from .models import Task
+from .worker import run_due_tasks
+
+# pg_try_advisory_lock key held by the process running the scheduler
+LOCK_KEY = 7301945246
+
+
+def next_due(now: datetime):
+    """
+    When the next pending task can run, None if there are none. Upcoming tasks
+    come from the ix_task_pending_execute_after index, due ones that are backing
+    off or held by a worker wait for their retry or lease instead.
+    """
+    upcoming = db.session.query(func.min(Task.execute_after)) \
+        .filter(Task.completed == False, Task.dead == False, Task.execute_after > now) \
+        .scalar()
+    blocked = db.session.query(func.min(func.coalesce(Task.next_attempt_at, Task.claimed_until))) \
+        .filter(Task.completed == False, Task.dead == False, Task.execute_after <= now) \
+        .filter(or_(Task.next_attempt_at > now, Task.claimed_until > now)) \
+        .scalar()
+    return min([d for d in (upcoming, blocked) if d], default=None)
+
+
+class TaskScheduler(threading.Thread):
+    """
+    Runs due tasks inside the web process, for single node deployments without
+    `flask task-worker` or a cron hitting /api/v1/task. It sleeps until the next
+    task is due, or TASK_SCHEDULER_MAX_SLEEP for tasks other processes add, and
+    `wake` cuts that short when this process adds one. On Postgres only the
+    process holding the advisory lock runs tasks, the rest stand by.
+    """
+
+    def __init__(self, app):
+        super().__init__(name="task-scheduler", daemon=True)
+        self.app = app
+        self.wakeup = threading.Event()
+        self.lock_conn = None
+
+    def wake(self):
+        self.wakeup.set()
+
+    def has_lock(self):
+        if db.engine.dialect.name != "postgresql":
+            return True
+        if self.lock_conn is None:
+            # the lock belongs to this connection, so it stays checked out
+            conn = db.engine.connect()
+            if conn.execute(select([func.pg_try_advisory_lock(LOCK_KEY)])).scalar():
+                self.lock_conn = conn
+            else:
+                conn.close()
+        return self.lock_conn is not None
+
+    def release_lock(self):
+        if self.lock_conn is not None:
+            self.lock_conn.invalidate()
+            self.lock_conn = None
+
+    def run_once(self, now: datetime):
+        """Run due tasks if this process is the leader, returns the seconds to sleep."""
+        try:
+            if not self.has_lock():
+                return TASK_SCHEDULER_MAX_SLEEP
+            ids, _ = run_due_tasks(now=now)
+            if len(ids) >= TASK_BATCH_SIZE:
+                return 0
+            due = next_due(datetime.now())
+            if due is None:
+                return TASK_SCHEDULER_MAX_SLEEP
+            return min(max((due - datetime.now()).total_seconds(), 0), TASK_SCHEDULER_MAX_SLEEP)
+        except Exception as e:
+            current_app.logger.info("Task scheduler failed: {}".format(e))
+            capture_exception(e)
+            # a broken connection may have lost the lock, take it again next time
+            self.release_lock()
+            return TASK_SCHEDULER_MAX_SLEEP
+        finally:
+            db.session.remove()
+
+    def run(self):
+        with self.app.app_context():
+            while True:
+                delay = self.run_once(datetime.now())
+                self.wakeup.wait(delay)
+                self.wakeup.clear()
+
+
+@event.listens_for(Session, "after_flush")
+def note_scheduled_tasks(session, flush_context):
+    for instance in list(session.new) + list(session.dirty):
+        if isinstance(instance, Task) and (instance in session.new or
+                                           inspect(instance).attrs.execute_after.history.has_changes()):
+            session.info["tasks_scheduled"] = True
+            return
+
+
+@event.listens_for(Session, "after_commit")
+def wake_scheduler(session):
+    if session.info.pop("tasks_scheduled", False) and has_app_context():
+        scheduler = current_app.extensions.get("task_scheduler")
+        if scheduler:
+            scheduler.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def drop_scheduled_tasks(session):
+    session.info.pop("tasks_scheduled", None)
+
+
+def start_scheduler(app):
+    scheduler = TaskScheduler(app)
+    app.extensions["task_scheduler"] = scheduler
+    scheduler.start()
+    return scheduler
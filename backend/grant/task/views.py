@@ -1,25 +1,36 @@
 from datetime import datetime
-from flask import Blueprint, jsonify, current_app
-from sentry_sdk import capture_exception
-from traceback import format_exc
+from flask import Blueprint, Response, jsonify, request
 
-from grant.task.jobs import JOBS
+from grant.settings import TASK_BATCH_SIZE, TASK_METRICS_TOKEN
+from grant.task.metrics import prometheus_metrics
 from grant.task.models import Task, tasks_schema
-from grant.extensions import db
+from grant.task.worker import run_due_tasks
 
 blueprint = Blueprint("task", __name__, url_prefix="/api/v1/task")
 
 
+# Runs the tasks due now, a batch at a time until a batch comes up short.
+# `flask task-worker` is the main runner, this is kept as a trigger for cron
+# setups and claims tasks the same way, so the two never run a task twice.
 @blueprint.route("/", methods=["GET"])
 def task():
-    tasks = Task.query.filter(Task.execute_after <= datetime.now()).filter_by(completed=False).all()
-    for each_task in tasks:
-        try:
-            JOBS[each_task.job_type](each_task)
-            each_task.completed = True
-            db.session.add(each_task)
-        except Exception as e:
-            current_app.logger.info("Task #{} failed: {}".format(each_task.id, e))
-            capture_exception(e)
-    db.session.commit()
+    now = datetime.now()
+    ids = []
+    while True:
+        batch, _ = run_due_tasks(now=now, limit=TASK_BATCH_SIZE)
+        ids.extend(batch)
+        if len(batch) < TASK_BATCH_SIZE:
+            break
+    tasks = Task.query.filter(Task.id.in_(ids)).all() if ids else []
     return jsonify(tasks_schema.dump(tasks))
+
+
+# Prometheus scrape target, only served when TASK_METRICS_TOKEN is set and
+# sent as a bearer token
+@blueprint.route("/metrics", methods=["GET"])
+def metrics():
+    if not TASK_METRICS_TOKEN:
+        return {"message": "Task metrics are disabled"}, 404
+    if request.headers.get("Authorization") != f"Bearer {TASK_METRICS_TOKEN}":
+        return {"message": "Invalid metrics token"}, 401
+    return Response(prometheus_metrics(datetime.now()), mimetype="text/plain; version=0.0.4")
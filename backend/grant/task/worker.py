@@ -0,0 +1,185 @@
+import os
+import socket
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sentry_sdk import capture_exception
+from sqlalchemy import or_
+
+from grant.extensions import db
+from grant.settings import TASK_BATCH_SIZE, TASK_LEASE_SECONDS, TASK_MAX_ATTEMPTS, TASK_RETRY_SECONDS, \
+    TASK_RETRY_MAX_SECONDS
+from grant.email.send import send_queued_emails
+from .jobs import BATCH_JOBS, JOBS
+from .metrics import RunMeasurement, record_runs
+from .models import Task
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def unclaimed(now: datetime):
+    return or_(Task.claimed_until == None, Task.claimed_until < now)
+
+
+def due_at(task: Task):
+    return task.next_attempt_at or task.execute_after
+
+
+# served by the partial ix_task_pending_execute_after index
+def due_tasks(now: datetime):
+    return db.session.query(Task.id) \
+        .filter(Task.execute_after <= now, Task.completed == False, Task.dead == False, unclaimed(now)) \
+        .filter(or_(Task.next_attempt_at == None, Task.next_attempt_at <= now)) \
+        .order_by(Task.execute_after, Task.id)
+
+
+def claim_tasks(now: datetime, limit: int, worker: str):
+    """
+    Lease up to `limit` due tasks to `worker` and return their ids. Candidates
+    are locked FOR UPDATE SKIP LOCKED so concurrent workers pick disjoint rows,
+    and the claim itself is a conditional UPDATE, which keeps it exclusive on
+    databases without row locks (SQLite). Tasks whose lease ran out, e.g. from
+    a crashed worker, can be claimed again.
+    """
+    free = unclaimed(now)
+    candidates = due_tasks(now) \
+        .limit(limit) \
+        .with_for_update(skip_locked=True) \
+        .all()
+    ids = [row[0] for row in candidates]
+    if not ids:
+        db.session.commit()
+        return []
+    Task.query \
+        .filter(Task.id.in_(ids), free) \
+        .update({
+            Task.claimed_by: worker,
+            Task.claimed_until: now + timedelta(seconds=TASK_LEASE_SECONDS),
+        }, synchronize_session=False)
+    db.session.commit()
+    claimed = db.session.query(Task.id) \
+        .filter(Task.id.in_(ids), Task.claimed_by == worker) \
+        .order_by(Task.execute_after, Task.id) \
+        .all()
+    return [row[0] for row in claimed]
+
+
+def retry_delay(attempts: int):
+    return timedelta(seconds=min(TASK_RETRY_SECONDS * 2 ** (attempts - 1), TASK_RETRY_MAX_SECONDS))
+
+
+def fail_task(task_id: int, worker: str, error: Exception):
+    """Release a failed task with its retry scheduled, or dead-letter it once it's out of attempts."""
+    task = Task.query.get(task_id)
+    if not task or task.claimed_by != worker:
+        return
+    task.attempts = (task.attempts or 0) + 1
+    task.last_error = f"{type(error).__name__}: {error}"
+    if task.attempts >= TASK_MAX_ATTEMPTS:
+        task.dead = True
+        task.next_attempt_at = None
+    else:
+        task.next_attempt_at = datetime.now() + retry_delay(task.attempts)
+    task.claimed_by = None
+    task.claimed_until = None
+    db.session.add(task)
+    db.session.commit()
+
+
+def run_task(task_id: int, worker: str):
+    """Run one claimed task in its own transaction, returns whether it succeeded."""
+    task = Task.query.get(task_id)
+    if not task or task.completed or task.claimed_by != worker:
+        return False
+    runs = [(task.job_type, due_at(task))]
+    measurement = RunMeasurement()
+    try:
+        JOBS[task.job_type](task)
+        task.completed = True
+        task.claimed_until = None
+        db.session.add(task)
+        record_runs(runs, measurement, True)
+        db.session.commit()
+        send_queued_emails()
+        return True
+    except Exception as e:
+        measurement.stop()
+        db.session.rollback()
+        current_app.logger.info("Task #{} failed: {}".format(task_id, e))
+        capture_exception(e)
+        fail_task(task_id, worker, e)
+        record_runs(runs, measurement, False)
+        db.session.commit()
+        return False
+
+
+def run_batch(job_type: int, task_ids: list, worker: str):
+    """
+    Run claimed tasks of a BATCH_JOBS type together in one transaction,
+    returns the ids that succeeded. If the batch fails every task is failed.
+    """
+    tasks = Task.query \
+        .filter(Task.id.in_(task_ids), Task.completed == False, Task.claimed_by == worker) \
+        .all()
+    if not tasks:
+        return set()
+    runs = [(task.job_type, due_at(task)) for task in tasks]
+    measurement = RunMeasurement()
+    try:
+        BATCH_JOBS[job_type](tasks)
+        for task in tasks:
+            task.completed = True
+            task.claimed_until = None
+            db.session.add(task)
+        record_runs(runs, measurement, True)
+        db.session.commit()
+        send_queued_emails()
+        return {task.id for task in tasks}
+    except Exception as e:
+        measurement.stop()
+        db.session.rollback()
+        current_app.logger.info("Tasks {} failed: {}".format(task_ids, e))
+        capture_exception(e)
+        for task_id in task_ids:
+            fail_task(task_id, worker, e)
+        record_runs(runs, measurement, False)
+        db.session.commit()
+        return set()
+
+
+def run_due_tasks(now: datetime = None, limit: int = TASK_BATCH_SIZE, threads: int = 1):
+    """
+    Claim a batch of due tasks and run them, on a thread pool when `threads`
+    is more than one. BATCH_JOBS types are run together first. Returns the
+    claimed ids and whether each succeeded.
+    """
+    worker = worker_name()
+    ids = claim_tasks(now or datetime.now(), limit, worker)
+    job_types = dict(db.session.query(Task.id, Task.job_type).filter(Task.id.in_(ids))) if ids else {}
+    done = set()
+    batches = defaultdict(list)
+    for i in ids:
+        if job_types.get(i) in BATCH_JOBS:
+            batches[job_types[i]].append(i)
+    for job_type, batch in batches.items():
+        done.update(run_batch(job_type, batch, worker))
+    single = [i for i in ids if job_types.get(i) not in BATCH_JOBS]
+
+    if threads <= 1 or len(single) <= 1:
+        done.update(i for i in single if run_task(i, worker))
+    else:
+        app = current_app._get_current_object()
+
+        def run(task_id):
+            # each thread gets its own app context, and with it its own session
+            with app.app_context():
+                return run_task(task_id, worker)
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            done.update(i for i, ok in zip(single, pool.map(run, single)) if ok)
+    return ids, [i in done for i in ids]
@@ -1,12 +1,18 @@
+from typing import Optional
+
 from flask_security import UserMixin, RoleMixin
 from flask_security.core import current_user
 from flask_security.utils import hash_password, verify_and_update_password, login_user
-from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy import func
+from sqlalchemy.ext.hybrid import hybrid_method, hybrid_property
+from sqlalchemy.orm import contains_eager, joinedload
 from grant.comment.models import Comment
 from grant.ccr.models import CCR
 from grant.email.models import EmailVerification, EmailRecovery
 from grant.email.send import send_email
 from grant.email.subscription_settings import (
+    EmailSubscription,
+    get_bitmap_state,
     get_default_email_subscriptions,
     email_subscriptions_to_bits,
     email_subscriptions_to_dict
@@ -54,6 +60,10 @@ class SocialMedia(db.Model):
 
 class UserSettings(db.Model):
     __tablename__ = "user_settings"
+    __table_args__ = (
+        # fan-outs join settings by user and test the bitmask without touching the table
+        db.Index("ix_user_settings_user_id_email_subscriptions", "user_id", "email_subscriptions"),
+    )
 
     id = db.Column(db.Integer(), primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
@@ -72,6 +82,14 @@ class UserSettings(db.Model):
     def email_subscriptions(self, subs):
         self._email_subscriptions = email_subscriptions_to_bits(subs)
 
+    @hybrid_method
+    def is_subscribed_to(self, sub: EmailSubscription):
+        return get_bitmap_state(self._email_subscriptions or 0, sub.value['bit'])
+
+    @is_subscribed_to.expression
+    def is_subscribed_to(cls, sub: EmailSubscription):
+        return cls._email_subscriptions.op('&')(1 << sub.value['bit']) != 0
+
     def __init__(self, user_id):
         self.email_subscriptions = get_default_email_subscriptions()
         self.user_id = user_id
@@ -122,6 +140,8 @@ class User(db.Model, UserMixin):
     silenced = db.Column(db.Boolean, default=False)
     banned = db.Column(db.Boolean, default=False)
     banned_reason = db.Column(db.String(), nullable=True)
+    # bumped whenever its detail response changes, see grant.utils.versioning
+    row_version = db.Column(db.Integer(), nullable=False, default=0, server_default=db.text("0"))
 
     # relations
     social_medias = db.relationship(SocialMedia, backref="user", lazy=True, cascade="all, delete-orphan")
@@ -215,8 +235,33 @@ class User(db.Model, UserMixin):
         return security.datastore.get_user(email_address)
 
     @staticmethod
-    def get_admins():
-        return User.query.filter(User.is_admin == True).all()
+    def get_by_emails(email_addresses):
+        """
+        Users with any of `email_addresses` keyed by lowercased address, with
+        their settings and email verification loaded, in one query.
+        """
+        addresses = {e.lower() for e in email_addresses if e}
+        if not addresses:
+            return {}
+        users = User.query \
+            .filter(func.lower(User.email_address).in_(addresses)) \
+            .options(joinedload(User.settings), joinedload(User.email_verification)) \
+            .all()
+        return {u.email_address.lower(): u for u in users}
+
+    @staticmethod
+    def subscribed_to(sub: Optional[EmailSubscription]):
+        """Query of users subscribed to `sub`, tested on the settings bitmask in SQL. None for every user."""
+        if sub is None:
+            return User.query
+        return User.query \
+            .join(User.settings) \
+            .filter(UserSettings.is_subscribed_to(sub)) \
+            .options(contains_eager(User.settings))
+
+    @staticmethod
+    def get_admins(subscription: EmailSubscription = None):
+        return User.subscribed_to(subscription).filter(User.is_admin == True).all()
 
     def check_password(self, password: str):
         return verify_and_update_password(password, self)
@@ -334,6 +379,13 @@ class SelfUserSchema(ma.Schema):
     userid = ma.Method("get_userid")
     email_verified = ma.Method("get_email_verified")
 
+    LOAD_PLAN = {
+        "social_medias": ("social_medias", "selectinload"),
+        "avatar": ("avatar", "joinedload"),
+        "arbiter_proposals": ("arbiter_proposals", "selectinload"),
+        "email_verified": ("email_verification", "joinedload"),
+    }
+
     def get_userid(self, obj):
         return obj.id
 
@@ -369,6 +421,13 @@ class UserSchema(ma.Schema):
     email_verified = ma.Method("get_email_verified")
     tip_jar_address = ma.Method("get_tip_jar_address")
 
+    LOAD_PLAN = {
+        "social_medias": ("social_medias", "selectinload"),
+        "avatar": ("avatar", "joinedload"),
+        "email_verified": ("email_verification", "joinedload"),
+        "tip_jar_address": ("settings", "joinedload"),
+    }
+
     def get_userid(self, obj):
         return obj.id
 
@@ -36,6 +36,7 @@ from .models import (
     db
 )
 from grant.utils.validate import is_z_address_valid
+from grant.utils.versioning import make_etag, conditional
 
 blueprint = Blueprint('user', __name__, url_prefix='/api/v1/users')
 
@@ -61,6 +62,12 @@ def get_me():
 def get_user(user_id, with_proposals, with_comments, with_funded, with_pending, with_arbitrated, with_requests, with_rejected_permanently):
     user = User.get_by_id(user_id)
     if user:
+        expanded = any([with_proposals, with_comments, with_funded, with_pending, with_arbitrated, with_requests,
+                        with_rejected_permanently])
+        if not expanded:
+            # the expansions aggregate rows from several tables, only the bare profile is versioned
+            etag = make_etag("user", user.id, user.row_version)
+            return conditional(etag, lambda: user_schema.dump(user))
         result = user_schema.dump(user)
         authed_user = auth.get_authed_user()
         is_self = authed_user and authed_user.id == user.id
@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import defaultdict
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.util import find_tables
+
+from grant.extensions import db
+from grant.settings import PAGINATION_COUNT_TTL, PAGINATION_ESTIMATE_MIN
+
+
+class CountCache:
+    """
+    Short lived cache of listing totals. Each entry remembers the generation
+    of every table its query reads, and flushes that touch a table bump its
+    generation, so totals are dropped as soon as this process changes the
+    data. Other processes' writes are only picked up once the TTL runs out.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.generations = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def get(self, key, tables):
+        with self.lock:
+            entry = self.entries.get(key)
+            if not entry:
+                return None
+            total, expires, generations = entry
+            if expires < time.monotonic() or any(self.generations[t] != g for t, g in generations.items()):
+                del self.entries[key]
+                return None
+            return total
+
+    def set(self, key, tables, total, ttl):
+        with self.lock:
+            generations = {t: self.generations[t] for t in tables}
+            self.entries[key] = (total, time.monotonic() + ttl, generations)
+
+    def invalidate(self, tables):
+        with self.lock:
+            for t in tables:
+                self.generations[t] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+count_cache = CountCache()
+
+
+# eager loads never reach a count, so they don't decide its tables either
+def query_tables(query):
+    return {t.name for t in find_tables(query.enable_eagerloads(False).statement)}
+
+
+def cached_count(name: str, query, filters: list = None, search: str = None, ttl: int = None):
+    ttl = PAGINATION_COUNT_TTL if ttl is None else ttl
+    query = query.order_by(None)
+    if not ttl:
+        return query.count()
+    statement = query.statement.compile()
+    key = (name, tuple(sorted(filters or [])), search, str(statement), repr(sorted(statement.params.items())))
+    tables = query_tables(query)
+    total = count_cache.get(key, tables)
+    if total is None:
+        total = query.count()
+        count_cache.set(key, tables, total, ttl)
+    return total
+
+
+def estimable_table(query):
+    """
+    Name of the single table an unfiltered query selects from, ignoring its
+    eager loads, or None if it has filters or joins.
+    """
+    statement = query.enable_eagerloads(False).statement
+    if query.whereclause is not None or len(statement.froms) != 1:
+        return None
+    return getattr(statement.froms[0], 'name', None)
+
+
+def estimated_count(query):
+    """
+    Planner row estimate for a query over a single, unfiltered table, from
+    pg_class.reltuples. Returns None when no usable estimate exists (other
+    databases, filtered queries, never analyzed or small tables).
+    """
+    if db.session.get_bind().dialect.name != 'postgresql':
+        return None
+    table = estimable_table(query)
+    if table is None:
+        return None
+    estimate = db.session.execute(
+        text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:name)"),
+        {'name': table},
+    ).scalar()
+    if estimate is None or estimate < PAGINATION_ESTIMATE_MIN:
+        return None
+    return estimate
+
+
+@event.listens_for(Session, 'after_flush')
+def invalidate_flushed_tables(session, flush_context):
+    tables = set()
+    for instance in list(session.new) + list(session.dirty) + list(session.deleted):
+        mapper = getattr(instance, '__mapper__', None)
+        if mapper is None:
+            continue
+        tables.add(mapper.local_table.name)
+        # association rows (follows, likes, team) have no instance of their own
+        tables.update(p.secondary.name for p in mapper.relationships if p.secondary is not None)
+    if tables:
+        count_cache.invalidate(tables)
+
+
+@event.listens_for(Session, 'after_bulk_update')
+@event.listens_for(Session, 'after_bulk_delete')
+def invalidate_bulk_table(context):
+    count_cache.invalidate([context.mapper.local_table.name])
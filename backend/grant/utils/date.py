@@ -1,5 +1,28 @@
 import math
 
+from sqlalchemy import DateTime
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
 
 def get_quarter_formatted(date):
     return "Q" + str(math.ceil(date.date_created.month / 3.)) + " " + str(date.date_created.year)
+
+
+class add_seconds(FunctionElement):
+    """SQL `timestamp + seconds`, for durations stored as integer columns."""
+    type = DateTime()
+    name = "add_seconds"
+
+
+@compiles(add_seconds)
+def compile_add_seconds(element, compiler, **kw):
+    timestamp, seconds = list(element.clauses)
+    return "(%s + %s * interval '1 second')" % (compiler.process(timestamp, **kw), compiler.process(seconds, **kw))
+
+
+@compiles(add_seconds, "sqlite")
+def compile_add_seconds_sqlite(element, compiler, **kw):
+    timestamp, seconds = list(element.clauses)
+    return "datetime(%s, '+' || %s || ' seconds')" % (
+        compiler.process(timestamp, **kw), compiler.process(seconds, **kw))
@@ -0,0 +1,34 @@
+from marshmallow import fields
+from sqlalchemy import orm
+
+
+def load_options(schema, model, parent=None):
+    """
+    Build the eager loading options needed to dump `model` rows with `schema`.
+
+    Schemas declare a LOAD_PLAN mapping a field name to the relationship it
+    reads and the loader to use, e.g. {"team": ("team", "selectinload")}.
+    Only fields the schema instance actually dumps are loaded, and nested
+    schemas contribute their own plan chained onto the parent relationship.
+    LARGE_COLUMNS maps field names to columns that are deferred when the
+    field is not dumped.
+    """
+    options = []
+    for name, attr in getattr(schema, 'LARGE_COLUMNS', {}).items():
+        if name not in schema.fields:
+            options.append((parent or orm).defer(getattr(model, attr)))
+    for name, (attr, loader) in getattr(schema, 'LOAD_PLAN', {}).items():
+        if name not in schema.fields:
+            continue
+        relationship = getattr(model, attr)
+        option = getattr(parent or orm, loader)(relationship)
+        options.append(option)
+        field = schema.fields[name]
+        if isinstance(field, fields.Nested):
+            nested_model = relationship.property.mapper.class_
+            options.extend(load_options(field.schema, nested_model, option))
+    return options
+
+
+def eager(query, schema, model):
+    return query.options(*load_options(schema, model))
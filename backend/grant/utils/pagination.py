@@ -1,12 +1,21 @@
 import abc
+import base64
+import binascii
+import json
+from datetime import datetime
 
-from sqlalchemy import or_
+from sqlalchemy import and_, case, or_
+from sqlalchemy.sql.elements import UnaryExpression
+from sqlalchemy.sql.operators import desc_op
 
 from grant.ccr.models import CCR
 from grant.comment.models import Comment, comments_schema
 from grant.milestone.models import Milestone
 from grant.proposal.models import db, ma, Proposal, ProposalContribution, ProposalArbiter, proposal_contributions_schema
+from grant.search.models import search_filter, search_rank
 from grant.user.models import User, UserSettings, users_schema
+from .counts import cached_count, estimated_count
+from .loading import eager
 from .enums import CCRStatus, ProposalStatus, ProposalStage, Category, ContributionStatus, ProposalArbiterStatus, \
     MilestoneStage
 
@@ -21,6 +30,60 @@ class PaginationException(Exception):
     pass
 
 
+# always with microseconds, isoformat drops them when they're zero
+CURSOR_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+def encode_cursor(value, id: int, direction: str):
+    if isinstance(value, datetime):
+        value = {'dt': value.strftime(CURSOR_DATE_FORMAT)}
+    raw = json.dumps({'v': value, 'id': id, 'd': direction}).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        value, id, direction = data['v'], data['id'], data['d']
+        if isinstance(value, dict):
+            value = datetime.strptime(value['dt'], CURSOR_DATE_FORMAT)
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise PaginationException(f'invalid cursor: {cursor}')
+    if direction not in ('next', 'prev'):
+        raise PaginationException(f'invalid cursor: {cursor}')
+    return value, id, direction
+
+
+def sort_key(expression):
+    """Split a SORT_MAP entry into its column and whether it sorts descending."""
+    if isinstance(expression, UnaryExpression):
+        return expression.element, expression.modifier is desc_op
+    return expression.expression, False
+
+
+def keyset_order(column, id_column, desc: bool, nulls_last: bool):
+    nulls = case([(column == None, 1 if nulls_last else 0)], else_=0 if nulls_last else 1)
+    if desc:
+        return [nulls, column.desc(), id_column.desc()]
+    return [nulls, column, id_column]
+
+
+def keyset_after(column, id_column, value, id: int, desc: bool, nulls_last: bool):
+    """Rows that come after (value, id) in keyset_order."""
+    id_after = id_column < id if desc else id_column > id
+    if value is None:
+        if nulls_last:
+            return and_(column == None, id_after)
+        return or_(column != None, and_(column == None, id_after))
+    after = or_(
+        column < value if desc else column > value,
+        and_(column == value, id_after),
+    )
+    if nulls_last:
+        return or_(column == None, after)
+    return and_(column != None, after)
+
+
 class Pagination(abc.ABC):
     def validate_filters(self, filters: list):
         if self.FILTERS:
@@ -33,10 +96,106 @@ class Pagination(abc.ABC):
             if sort not in self.SORT_MAP:
                 self._raise(f'unsupported sort: {sort}')
 
+    # searches are ranked by relevance unless the client picked a sort
+    def relevance(self, search: str, sort: str):
+        rank = search_rank(search) if search and not sort else None
+        return [rank.desc()] if rank is not None else []
+
     def _raise(self, desc: str):
         name = self.__class__.__name__
         raise PaginationException(f'{name} {desc}')
 
+    def results(
+            self,
+            schema: ma.Schema,
+            query: db.Query,
+            page: int,
+            filters: list,
+            search: str,
+            sort: str,
+            cursor: str = None,
+            with_total: bool = False,
+            estimate_total: bool = False,
+    ):
+        if cursor is None:
+            page = page if page and page > 0 else 1
+            items = query.limit(self.PAGE_SIZE).offset((page - 1) * self.PAGE_SIZE).all()
+            # no need to count when the first page isn't full
+            if page == 1 and len(items) < self.PAGE_SIZE:
+                total, estimated = len(items), False
+            else:
+                total, estimated = self.count(query, filters, search, estimate_total)
+            return {
+                'page': page,
+                'total': total,
+                'total_estimated': estimated,
+                'page_size': self.PAGE_SIZE,
+                'items': schema.dump(items),
+                'filters': filters,
+                'search': search,
+                'sort': sort
+            }
+
+        items, next_cursor, prev_cursor = self.keyset(query, sort, cursor)
+        total, estimated = None, False
+        if with_total or estimate_total:
+            total, estimated = self.count(query, filters, search, estimate_total)
+        return {
+            'page': None,
+            'total': total,
+            'total_estimated': estimated,
+            'page_size': self.PAGE_SIZE,
+            'items': schema.dump(items),
+            'filters': filters,
+            'search': search,
+            'sort': sort,
+            'cursor': cursor,
+            'next_cursor': next_cursor,
+            'prev_cursor': prev_cursor,
+        }
+
+    # totals are cached briefly, or estimated from planner statistics for
+    # unfiltered listings when the client asks for it
+    def count(self, query: db.Query, filters: list, search: str, estimate: bool = False):
+        if estimate and not filters and not search:
+            total = estimated_count(query)
+            if total is not None:
+                return total, True
+        return cached_count(self.__class__.__name__, query, filters, search), False
+
+    # cursor mode: seek past the (sort key, id) of the last row seen instead of
+    # using OFFSET. An empty cursor starts at the first page.
+    def keyset(self, query: db.Query, sort: str, cursor: str):
+        column, desc = sort_key(self.SORT_MAP[sort])
+        id_column = column.table.c.id
+        value, id, direction = decode_cursor(cursor) if cursor else (None, None, 'next')
+        backwards = direction == 'prev'
+        # walking backwards is walking forwards through the reversed order
+        order_desc = desc != backwards
+        nulls_last = not backwards
+
+        query = query.order_by(None).order_by(*keyset_order(column, id_column, order_desc, nulls_last))
+        if cursor:
+            query = query.filter(keyset_after(column, id_column, value, id, order_desc, nulls_last))
+        rows = query.limit(self.PAGE_SIZE + 1).all()
+        has_more = len(rows) > self.PAGE_SIZE
+        items = rows[:self.PAGE_SIZE]
+        if backwards:
+            items.reverse()
+        if not items:
+            return items, None, None
+
+        def make(item, d):
+            return encode_cursor(getattr(item, column.key), item.id, d)
+
+        has_next = has_more if not backwards else True
+        has_prev = has_more if backwards else bool(cursor)
+        return (
+            items,
+            make(items[-1], 'next') if has_next else None,
+            make(items[0], 'prev') if has_prev else None,
+        )
+
     # if we ever want to do more interacting from outside
     # consider moving these args into __init__ and attaching to self
     @abc.abstractmethod
@@ -48,6 +207,9 @@ class Pagination(abc.ABC):
             filters: list,
             search: str,
             sort: str,
+            cursor: str = None,
+            with_total: bool = False,
+            estimate_total: bool = False,
     ):
         pass
 
@@ -77,9 +239,14 @@ class ProposalPagination(Pagination):
             filters: list = None,
             search: str = None,
             sort: str = 'PUBLISHED:DESC',
+            cursor: str = None,
+            with_total: bool = False,
+            estimate_total: bool = False,
     ):
         query = query or Proposal.query
+        relevance = self.relevance(search, sort)
         sort = sort or 'PUBLISHED:DESC'
+        query = eager(query, schema, Proposal)
 
         # FILTER
         if filters:
@@ -113,22 +280,13 @@ class ProposalPagination(Pagination):
         # SORT (see self.SORT_MAP)
         if sort:
             self.validate_sort(sort)
-            query = query.order_by(self.SORT_MAP[sort])
+            query = query.order_by(*relevance, self.SORT_MAP[sort])
 
         # SEARCH
         if search:
-            query = query.filter(Proposal.title.ilike(f'%{search}%'))
+            query = search_filter(query, 'proposal', Proposal.id, search)
 
-        res = query.paginate(page, self.PAGE_SIZE, False)
-        return {
-            'page': res.page,
-            'total': res.total,
-            'page_size': self.PAGE_SIZE,
-            'items': schema.dump(res.items),
-            'filters': filters,
-            'search': search,
-            'sort': sort
-        }
+        return self.results(schema, query, page, filters, search, sort, cursor, with_total, estimate_total)
 
 
 class ContributionPagination(Pagination):
@@ -151,9 +309,13 @@ class ContributionPagination(Pagination):
             filters: list = None,
             search: str = None,
             sort: str = 'PUBLISHED:DESC',
+            cursor: str = None,
+            with_total: bool = False,
+            estimate_total: bool = False,
     ):
         query = query or ProposalContribution.query
         sort = sort or 'CREATED:DESC'
+        query = eager(query, schema, ProposalContribution)
 
         # FILTER
         if filters:
@@ -200,16 +362,7 @@ class ContributionPagination(Pagination):
                 ProposalContribution.tx_id.ilike(f'%{search}%'),
             ))
 
-        res = query.paginate(page, self.PAGE_SIZE, False)
-        return {
-            'page': res.page,
-            'total': res.total,
-            'page_size': self.PAGE_SIZE,
-            'items': schema.dump(res.items),
-            'filters': filters,
-            'search': search,
-            'sort': sort
-        }
+        return self.results(schema, query, page, filters, search, sort, cursor, with_total, estimate_total)
 
 
 class UserPagination(Pagination):
@@ -231,9 +384,14 @@ class UserPagination(Pagination):
             filters: list = None,
             search: str = None,
             sort: str = 'EMAIL:DESC',
+            cursor: str = None,
+            with_total: bool = False,
+            estimate_total: bool = False,
     ):
-        query = query or Proposal.query
+        query = query or User.query
+        relevance = self.relevance(search, sort)
         sort = sort or 'EMAIL:DESC'
+        query = eager(query, schema, User)
 
         # FILTER
         if filters:
@@ -249,25 +407,13 @@ class UserPagination(Pagination):
         # SORT (see self.SORT_MAP)
         if sort:
             self.validate_sort(sort)
-            query = query.order_by(self.SORT_MAP[sort])
+            query = query.order_by(*relevance, self.SORT_MAP[sort])
 
         # SEARCH
         if search:
-            query = query.filter(
-                User.email_address.ilike(f'%{search}%') |
-                User.display_name.ilike(f'%{search}%')
-            )
+            query = search_filter(query, 'user', User.id, search)
 
-        res = query.paginate(page, self.PAGE_SIZE, False)
-        return {
-            'page': res.page,
-            'total': res.total,
-            'page_size': self.PAGE_SIZE,
-            'items': schema.dump(res.items),
-            'filters': filters,
-            'search': search,
-            'sort': sort
-        }
+        return self.results(schema, query, page, filters, search, sort, cursor, with_total, estimate_total)
 
 
 class CommentPagination(Pagination):
@@ -287,9 +433,14 @@ class CommentPagination(Pagination):
             filters: list = None,
             search: str = None,
             sort: str = 'CREATED:DESC',
+            cursor: str = None,
+            with_total: bool = False,
+            estimate_total: bool = False,
     ):
         query = query or Comment.query
+        relevance = self.relevance(search, sort)
         sort = sort or 'CREATED:DESC'
+        query = eager(query, schema, Comment)
 
         # FILTER
         if filters:
@@ -302,24 +453,13 @@ class CommentPagination(Pagination):
         # SORT (see self.SORT_MAP)
         if sort:
             self.validate_sort(sort)
-            query = query.order_by(self.SORT_MAP[sort])
+            query = query.order_by(*relevance, self.SORT_MAP[sort])
 
         # SEARCH
         if search:
-            query = query.filter(
-                Comment.content.ilike(f'%{search}%')
-            )
+            query = search_filter(query, 'comment', Comment.id, search)
 
-        res = query.paginate(page, self.PAGE_SIZE, False)
-        return {
-            'page': res.page,
-            'total': res.total,
-            'page_size': self.PAGE_SIZE,
-            'items': schema.dump(res.items),
-            'filters': filters,
-            'search': search,
-            'sort': sort
-        }
+        return self.results(schema, query, page, filters, search, sort, cursor, with_total, estimate_total)
 
 
 class CCRPagination(Pagination):
@@ -339,9 +479,14 @@ class CCRPagination(Pagination):
             filters: list = None,
             search: str = None,
             sort: str = 'CREATED:DESC',
+            cursor: str = None,
+            with_total: bool = False,
+            estimate_total: bool = False,
     ):
         query = query or CCR.query
+        relevance = self.relevance(search, sort)
         sort = sort or 'CREATED:DESC'
+        query = eager(query, schema, CCR)
 
         # FILTER
         if filters:
@@ -354,22 +499,13 @@ class CCRPagination(Pagination):
         # SORT (see self.SORT_MAP)
         if sort:
             self.validate_sort(sort)
-            query = query.order_by(self.SORT_MAP[sort])
+            query = query.order_by(*relevance, self.SORT_MAP[sort])
 
         # SEARCH
         if search:
-            query = query.filter(CCR.title.ilike(f'%{search}%'))
+            query = search_filter(query, 'ccr', CCR.id, search)
 
-        res = query.paginate(page, self.PAGE_SIZE, False)
-        return {
-            'page': res.page,
-            'total': res.total,
-            'page_size': self.PAGE_SIZE,
-            'items': schema.dump(res.items),
-            'filters': filters,
-            'search': search,
-            'sort': sort
-        }
+        return self.results(schema, query, page, filters, search, sort, cursor, with_total, estimate_total)
 
 
 # expose pagination methods here
@@ -0,0 +1,111 @@
+from collections import defaultdict
+from functools import wraps
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from grant.extensions import cache
+from grant.utils.auth import get_authed_user
+
+# cache keys of the responses that show each kind of data
+TAGGED_KEYS = defaultdict(set)
+
+
+def cached_public_response(key: str, tags: list):
+    """
+    Cache a public GET view's response body for anonymous visitors. Authed
+    users always get a fresh response since they see authed_* fields. Entries
+    expire after CACHE_DEFAULT_TIMEOUT and are deleted as soon as a commit
+    changes data under one of `tags` (see `changed_tags`).
+    """
+    cache_key = f"response:{key}"
+    for tag in tags:
+        TAGGED_KEYS[tag].add(cache_key)
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if get_authed_user():
+                return f(*args, **kwargs)
+            rv = cache.get(cache_key)
+            if rv is None:
+                rv = f(*args, **kwargs)
+                # error responses come back as (body, status) tuples
+                if not isinstance(rv, tuple):
+                    cache.set(cache_key, rv)
+            return rv
+
+        return wrapper
+
+    return decorator
+
+
+def invalidate_tags(tags):
+    keys = set()
+    for tag in tags:
+        keys.update(TAGGED_KEYS[tag])
+    # one at a time, delete_many stops at the first key that isn't cached
+    for key in keys:
+        cache.delete(key)
+
+
+def tag_session(session, tags):
+    """Invalidate `tags` when `session` commits, for changes made with bulk statements."""
+    session.info.setdefault("response_tags", set()).update(tags)
+
+
+def _changed(instance, *fields):
+    attrs = inspect(instance).attrs
+    return any(attrs[f].history.has_changes() for f in fields)
+
+
+def changed_tags(instance, is_dirty: bool):
+    from grant.ccr.models import CCR
+    from grant.proposal.models import Proposal, ProposalContribution, ProposalFunding
+    from grant.rfp.models import RFP
+    from grant.user.models import User, Avatar
+    from grant.utils.enums import ProposalStatus
+
+    if isinstance(instance, Proposal):
+        # publish, approve_discussion and cancel move status/stage, everything
+        # else only matters once the proposal is listed
+        if instance.status == ProposalStatus.LIVE or (is_dirty and _changed(instance, "status", "stage")):
+            return {"proposal"}
+    elif isinstance(instance, ProposalFunding):
+        return {"proposal"}
+    elif isinstance(instance, ProposalContribution):
+        if not is_dirty or _changed(instance, "status"):
+            return {"proposal"}
+    elif isinstance(instance, (RFP, CCR)):
+        return {"rfp"}
+    elif isinstance(instance, User):
+        # team members are shown on proposal cards
+        if not is_dirty or _changed(instance, "display_name"):
+            return {"proposal"}
+    elif isinstance(instance, Avatar):
+        return {"proposal"}
+    return set()
+
+
+@event.listens_for(Session, "after_flush")
+def collect_response_tags(session, flush_context):
+    tags = session.info.setdefault("response_tags", set())
+    for instance in session.new:
+        tags.update(changed_tags(instance, False))
+    for instance in session.dirty:
+        tags.update(changed_tags(instance, True))
+    for instance in session.deleted:
+        tags.update(changed_tags(instance, False))
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_committed_responses(session):
+    tags = session.info.pop("response_tags", None)
+    if tags and has_app_context() and current_app.extensions.get("cache"):
+        invalidate_tags(tags)
+
+
+@event.listens_for(Session, "after_rollback")
+def drop_response_tags(session):
+    session.info.pop("response_tags", None)
@@ -0,0 +1,273 @@
+import csv
+import datetime
+import io
+import random
+from decimal import Decimal
+
+from sqlalchemy import func, select
+
+from grant.email.models import EmailVerification
+from grant.email.subscription_settings import email_subscriptions_to_bits, get_default_email_subscriptions
+from grant.extensions import cache, db
+from grant.milestone.models import Milestone
+from grant.comment.models import Comment
+from grant.proposal.models import (
+    Proposal,
+    ProposalArbiter,
+    ProposalContribution,
+    ProposalFunding,
+    proposal_follower,
+    proposal_team,
+)
+from grant.search.models import SearchDocument
+from grant.user.models import User, UserSettings
+from grant.utils.counts import count_cache
+from grant.utils.enums import ContributionStatus, MilestoneStage, ProposalArbiterStatus, ProposalStage, \
+    ProposalStatus, Category
+
+MIN_ID = 100000
+MAX_ID = pow(2, 31) - 1
+
+
+def parse_weights(spec: str):
+    """"WIP:5,COMPLETED:3" -> {"WIP": 5.0, "COMPLETED": 3.0}"""
+    weights = {}
+    for part in spec.split(","):
+        key, _, weight = part.partition(":")
+        weights[key.strip()] = float(weight or 1)
+    return weights
+
+
+def id_block(table, count: int):
+    """
+    First id of a free run of `count` ids in `table`, so rows can be given ids
+    up front instead of one gen_random_id SELECT each. Usually that's right
+    after the highest id, otherwise the first gap big enough.
+    """
+    highest = db.session.query(func.max(table.c.id)).scalar()
+    if highest is None or highest < MIN_ID:
+        return MIN_ID
+    if highest + count < MAX_ID:
+        return highest + 1
+    start = MIN_ID
+    for (taken,) in db.session.execute(select([table.c.id]).where(table.c.id >= MIN_ID).order_by(table.c.id)):
+        if taken - start >= count:
+            break
+        start = max(start, taken + 1)
+    if start + count > MAX_ID:
+        raise ValueError(f"No room for {count} more {table.name} ids")
+    return start
+
+
+def insert_rows(table, columns, rows):
+    """COPY `rows` into `table` on Postgres, a multi-row INSERT elsewhere."""
+    if not rows:
+        return
+    conn = db.session.connection()
+    if conn.dialect.name == "postgresql":
+        # unquoted empty CSV fields are NULL
+        buf = io.StringIO()
+        csv.writer(buf).writerows(rows)
+        buf.seek(0)
+        column_list = ", ".join(f'"{c}"' for c in columns)
+        conn.connection.cursor().copy_expert(f'COPY "{table.name}" ({column_list}) FROM STDIN WITH (FORMAT csv)', buf)
+    else:
+        conn.execute(table.insert(), [dict(zip(columns, row)) for row in rows])
+
+
+def around(mean: float):
+    """A count averaging `mean`, anywhere from none to twice as many."""
+    return random.randint(0, int(round(mean * 2)))
+
+
+class BulkSeeder:
+    """
+    Generates a load-test dataset of users and LIVE proposals with milestones,
+    contributions, comment trees and followers. Rows bypass the ORM, so the
+    funding ledger and search documents are written alongside them and the
+    count caches are cleared at the end.
+    """
+
+    def __init__(self, users: int, proposals: int, stages: dict, contributions: float, comments: float,
+                 comment_depth: int, reply_rate: float, followers: float, batch_size: int, password: str):
+        self.user_count = users
+        self.proposal_count = proposals
+        self.stages = stages
+        self.contributions = contributions
+        self.comments = comments
+        self.comment_depth = comment_depth
+        self.reply_rate = reply_rate
+        self.followers = followers
+        self.batch_size = batch_size
+        self.password = password
+        self.now = datetime.datetime.now()
+        self.totals = dict(users=0, proposals=0, milestones=0, contributions=0, comments=0, followers=0)
+
+    def run(self, log=print):
+        self.seed_users()
+        log(f"Added {self.totals['users']} users")
+        self.user_ids = [uid for (uid,) in db.session.query(User.id)]
+        for start in range(0, self.proposal_count, self.batch_size):
+            self.seed_proposals(min(self.batch_size, self.proposal_count - start))
+            log(f"Added {self.totals['proposals']} / {self.proposal_count} proposals")
+        self.finish()
+        return self.totals
+
+    def seed_users(self):
+        if not self.user_count:
+            return
+        from flask_security.utils import hash_password
+        # hashing is deliberately slow, every seeded user shares one
+        password = hash_password(self.password)
+        subscriptions = email_subscriptions_to_bits(get_default_email_subscriptions())
+        first_user = id_block(User.__table__, self.user_count)
+        first_settings = id_block(UserSettings.__table__, self.user_count)
+        for offset in range(0, self.user_count, self.batch_size):
+            ids = range(first_user + offset, first_user + min(offset + self.batch_size, self.user_count))
+            insert_rows(User.__table__, ["id", "email_address", "password", "display_name", "title", "active"], [
+                (uid, f"seed-{uid}@example.com", password, f"Seed User {uid}", "Load tester", True) for uid in ids
+            ])
+            insert_rows(UserSettings.__table__, ["id", "user_id", "email_subscriptions"], [
+                (first_settings + uid - first_user, uid, subscriptions) for uid in ids
+            ])
+            insert_rows(EmailVerification.__table__, ["user_id", "code", "has_verified"], [
+                (uid, f"seed{uid}", True) for uid in ids
+            ])
+            self.write_documents("user", [(uid, f"seed user {uid} seed-{uid}@example.com") for uid in ids])
+            db.session.commit()
+        self.totals["users"] += self.user_count
+
+    def seed_proposals(self, count: int):
+        stages = list(self.stages.keys())
+        weights = list(self.stages.values())
+        first_proposal = id_block(Proposal.__table__, count)
+        proposals, arbiters, team, milestones, funding, contributions, comments, followers, documents = \
+            [], [], [], [], [], [], [], [], []
+
+        comment_counts = [around(self.comments) for _ in range(count)]
+        contribution_counts = [around(self.contributions) for _ in range(count)]
+        next_comment = id_block(Comment.__table__, sum(comment_counts))
+        next_contribution = id_block(ProposalContribution.__table__, sum(contribution_counts))
+        next_arbiter = id_block(ProposalArbiter.__table__, count)
+        next_milestone = id_block(Milestone.__table__, count * 5)
+
+        for i in range(count):
+            pid = first_proposal + i
+            stage = random.choices(stages, weights)[0]
+            published = self.now - datetime.timedelta(days=random.randint(1, 720))
+            title = f"Seed proposal {pid}"
+            target = str(random.randint(10, 5000))
+            proposals.append((
+                pid, published, "2", ProposalStatus.LIVE, title, f"Brief of seed proposal {pid}", stage,
+                f"# Seed proposal {pid}\n\nGenerated by flask seed-bulk.", Category.DEV_TOOL, published, published,
+                True, target, "seed-payout-address", 5184000, target,
+            ))
+            arbiters.append((next_arbiter + i, pid, None, ProposalArbiterStatus.MISSING))
+            owner = random.choice(self.user_ids)
+            team.append((owner, pid))
+            documents.append(("proposal", pid, title.lower()))
+
+            num_ms = random.randint(1, 5)
+            for j in range(num_ms):
+                paid = stage == ProposalStage.COMPLETED or (stage == ProposalStage.WIP and j == 0)
+                milestones.append((
+                    next_milestone, j, published, f"Seed milestone {j}", f"Milestone {j} of seed proposal {pid}",
+                    str(100 // num_ms + (100 % num_ms if j == 0 else 0)), j == 0,
+                    published + datetime.timedelta(days=30 * (j + 1)), "30",
+                    MilestoneStage.PAID if paid else MilestoneStage.IDLE, pid,
+                ))
+                next_milestone += 1
+
+            confirmed = []
+            for _ in range(contribution_counts[i]):
+                uid = random.choice(self.user_ids) if random.random() < 0.9 else None
+                amount = str(Decimal(random.randint(1, 100000)) / 1000)
+                status = ContributionStatus.CONFIRMED if random.random() < 0.9 else ContributionStatus.PENDING
+                created = published + datetime.timedelta(minutes=random.randint(0, 60 * 24 * 30))
+                contributions.append((
+                    next_contribution, created, pid, uid, status, amount, f"seed-tx-{next_contribution}", False, True,
+                ))
+                if status == ContributionStatus.CONFIRMED:
+                    confirmed.append((uid, Decimal(amount), created))
+                next_contribution += 1
+            funding.append((
+                pid, str(sum((c[1] for c in confirmed), Decimal(0))), "0",
+                len({c[0] for c in confirmed if c[0] is not None}),
+                max((c[2] for c in confirmed), default=None), 1,
+            ))
+
+            depths = []
+            first_comment = next_comment
+            for _ in range(comment_counts[i]):
+                parent, depth = None, 0
+                if depths and random.random() < self.reply_rate:
+                    k = random.randrange(len(depths))
+                    if depths[k] < self.comment_depth:
+                        parent, depth = first_comment + k, depths[k] + 1
+                content = f"Seed comment {next_comment} at depth {depth}"
+                comments.append((
+                    next_comment, published + datetime.timedelta(minutes=len(depths)), content, False, False,
+                    parent, pid, random.choice(self.user_ids),
+                ))
+                documents.append(("comment", next_comment, content.lower()))
+                depths.append(depth)
+                next_comment += 1
+
+            for uid in random.sample(self.user_ids, min(around(self.followers), len(self.user_ids))):
+                followers.append((uid, pid))
+
+        insert_rows(Proposal.__table__, [
+            "id", "date_created", "version", "status", "title", "brief", "stage", "content", "category",
+            "date_approved", "date_published", "accepted_with_funding", "target", "payout_address",
+            "deadline_duration", "contribution_bounty",
+        ], proposals)
+        insert_rows(ProposalArbiter.__table__, ["id", "proposal_id", "user_id", "status"], arbiters)
+        insert_rows(proposal_team, ["user_id", "proposal_id"], team)
+        insert_rows(Milestone.__table__, [
+            "id", "index", "date_created", "title", "content", "payout_percent", "immediate_payout",
+            "date_estimated", "days_estimated", "stage", "proposal_id",
+        ], milestones)
+        insert_rows(ProposalContribution.__table__, [
+            "id", "date_created", "proposal_id", "user_id", "status", "amount", "tx_id", "staking", "private",
+        ], contributions)
+        insert_rows(ProposalFunding.__table__, [
+            "proposal_id", "contributed", "staked", "contributor_count", "date_last_confirmed", "version",
+        ], funding)
+        # parents always come first, so one COPY satisfies the self reference
+        insert_rows(Comment.__table__, [
+            "id", "date_created", "content", "hidden", "reported", "parent_comment_id", "proposal_id", "user_id",
+        ], comments)
+        insert_rows(proposal_follower, ["user_id", "proposal_id"], followers)
+        for entity_type in ("proposal", "comment"):
+            self.write_documents(entity_type, [(d[1], d[2]) for d in documents if d[0] == entity_type])
+        db.session.commit()
+
+        self.totals["proposals"] += count
+        self.totals["milestones"] += len(milestones)
+        self.totals["contributions"] += len(contributions)
+        self.totals["comments"] += len(comments)
+        self.totals["followers"] += len(followers)
+
+    def write_documents(self, entity_type: str, documents):
+        insert_rows(SearchDocument.__table__, ["entity_type", "entity_id", "document"], [
+            (entity_type, entity_id, document) for entity_id, document in documents
+        ])
+
+    def finish(self):
+        if db.session.get_bind().dialect.name == "postgresql":
+            # COPY can't call to_tsvector, and explicit ids leave serial sequences behind
+            db.session.execute(
+                "UPDATE search_document SET vector = to_tsvector('simple', document) WHERE vector IS NULL"
+            )
+            for table in ("user", "user_settings", "proposal", "proposal_arbiter", "milestone",
+                          "proposal_contribution", "comment"):
+                db.session.execute(
+                    f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+                    f"(SELECT COALESCE(MAX(id), 1) FROM \"{table}\"))"
+                )
+            db.session.commit()
+            for table in ("user", "proposal", "comment", "proposal_contribution", "search_document"):
+                db.session.execute(f'ANALYZE "{table}"')
+            db.session.commit()
+        count_cache.clear()
+        cache.clear()
@@ -0,0 +1,157 @@
+import hashlib
+
+from flask import current_app, request
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+
+from grant.settings import SENTRY_RELEASE
+
+
+# Proposal, RFP, CCR and User carry a `row_version` that is bumped whenever
+# their detail response could change, including through nested rows (team
+# members, milestones, the RFP a proposal belongs to, ...). Detail views turn
+# it into an ETag, so unchanged pages are answered with a 304 straight after
+# the lookup, without dumping the schema.
+
+def _related(instance, attr: str):
+    """Current and, if it was replaced in this flush, previous related rows."""
+    values = list(inspect(instance).attrs[attr].history.deleted or ())
+    current = getattr(instance, attr)
+    values.extend(current if isinstance(current, list) else [current])
+    return [v for v in values if v is not None]
+
+
+def _rfps(instance):
+    # by id as well, rfp_id is sometimes set without touching the relationship
+    from grant.rfp.models import RFP
+
+    history = inspect(instance).attrs["rfp_id"].history
+    ids = set(history.sum()) | {instance.rfp_id}
+    return [r for r in (RFP.query.get(i) for i in ids if i is not None) if r]
+
+
+def _proposal(p, found):
+    # an RFP lists its accepted proposals, and a CCR nests its whole RFP
+    found.add(p)
+    for rfp in _rfps(p):
+        found.add(rfp)
+        found.update(_related(rfp, "ccr"))
+
+
+def _rfp(r, found):
+    # proposals and the CCR show the RFP they belong to
+    found.add(r)
+    found.update(_related(r, "ccr"))
+    found.update(_related(r, "proposals"))
+
+
+def _ccr(c, found):
+    found.add(c)
+    for rfp in _rfps(c):
+        _rfp(rfp, found)
+
+
+def _user(u, found):
+    # the user's public profile is nested in team lists, arbiters and CCR authors
+    from grant.proposal.models import Proposal
+
+    found.add(u)
+    for p in Proposal.query.filter(Proposal.team.any(id=u.id)):
+        _proposal(p, found)
+    for arbiter in _related(u, "arbiter_proposals"):
+        for p in _related(arbiter, "proposal"):
+            _proposal(p, found)
+    for c in _related(u, "ccrs"):
+        _ccr(c, found)
+
+
+USER_FIELDS = ["display_name", "title"]
+
+
+def changed_entities(instance, found):
+    from grant.ccr.models import CCR
+    from grant.email.models import EmailVerification
+    from grant.milestone.models import Milestone
+    from grant.proposal.models import Proposal, ProposalArbiter, ProposalFunding, ProposalTeamInvite, \
+        ProposalUpdate
+    from grant.rfp.models import RFP
+    from grant.user.models import User, Avatar, SocialMedia, UserSettings
+
+    if isinstance(instance, Proposal):
+        _proposal(instance, found)
+    elif isinstance(instance, (Milestone, ProposalArbiter, ProposalTeamInvite, ProposalUpdate)):
+        for p in _related(instance, "proposal"):
+            _proposal(p, found)
+    elif isinstance(instance, ProposalFunding):
+        # a proposal's own ETag includes the ledger version, but RFPs list
+        # funding of their accepted proposals
+        p = Proposal.query.get(instance.proposal_id)
+        for rfp in _rfps(p) if p else []:
+            found.add(rfp)
+            found.update(_related(rfp, "ccr"))
+    elif isinstance(instance, RFP):
+        _rfp(instance, found)
+    elif isinstance(instance, CCR):
+        _ccr(instance, found)
+    elif isinstance(instance, User):
+        # new users aren't shown anywhere yet
+        state = inspect(instance)
+        if not state.pending and any(state.attrs[f].history.has_changes() for f in USER_FIELDS):
+            _user(instance, found)
+    elif isinstance(instance, (Avatar, SocialMedia, UserSettings, EmailVerification)):
+        for u in _related(instance, "user"):
+            _user(u, found)
+
+
+@event.listens_for(Session, "before_flush")
+def bump_row_versions(session, flush_context, instances):
+    if not (session.new or session.dirty or session.deleted):
+        return
+    found = set()
+    with session.no_autoflush:
+        for instance in session.new:
+            changed_entities(instance, found)
+        for instance in session.dirty:
+            if session.is_modified(instance):
+                changed_entities(instance, found)
+        for instance in session.deleted:
+            changed_entities(instance, found)
+    for entity in found:
+        if entity in session.deleted:
+            continue
+        entity.row_version = (entity.row_version or 0) + 1
+
+
+def bump_proposal_relations(proposal_ids):
+    """
+    Bulk UPDATEs of proposals skip `bump_row_versions`, so bump the RFPs and
+    CCRs that show them. The proposals' own row_version is left to the UPDATE.
+    """
+    from grant.ccr.models import CCR
+    from grant.proposal.models import Proposal
+    from grant.rfp.models import RFP
+
+    rfp_ids = select([Proposal.rfp_id]).where(Proposal.id.in_(proposal_ids))
+    RFP.query.filter(RFP.id.in_(rfp_ids)) \
+        .update({RFP.row_version: RFP.row_version + 1}, synchronize_session=False)
+    CCR.query.filter(CCR.rfp_id.in_(rfp_ids)) \
+        .update({CCR.row_version: CCR.row_version + 1}, synchronize_session=False)
+
+
+def make_etag(*parts):
+    # the release is included so a deploy that changes a schema invalidates old tags
+    key = repr((SENTRY_RELEASE,) + parts).encode()
+    return hashlib.sha1(key).hexdigest()
+
+
+def conditional(etag: str, dump):
+    """
+    Answer with a bodyless 304 if the client already holds `etag`, otherwise
+    return dump()'s body with the ETag attached.
+    """
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.make_response(dump())
+    response.set_etag(etag)
+    return response
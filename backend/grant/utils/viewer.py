@@ -0,0 +1,80 @@
+from flask import g, has_app_context
+
+from grant.extensions import db
+
+
+class ViewerRelations:
+    """
+    Remembers which rows of a user association table (follows, likes) belong
+    to the authed user. Schemas call `load` with every id on the page before
+    dumping, so the per-object `authed_*` properties are answered from memory
+    with one query per table instead of one per object.
+    """
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.resolved = {}
+
+    def _known(self, table, column: str):
+        return self.resolved.setdefault((table.name, column), {})
+
+    def load(self, table, column: str, ids):
+        known = self._known(table, column)
+        missing = {i for i in ids if i is not None and i not in known}
+        if not missing:
+            return
+        col = table.c[column]
+        rows = (
+            db.session.query(col)
+                .filter(table.c.user_id == self.user_id, col.in_(missing))
+                .all()
+        )
+        found = {row[0] for row in rows}
+        for i in missing:
+            known[i] = i in found
+
+    def includes(self, table, column: str, id: int):
+        self.load(table, column, [id])
+        return self._known(table, column)[id]
+
+    def set(self, table, column: str, id: int, value: bool):
+        self._known(table, column)[id] = value
+
+
+def get_viewer_relations():
+    from grant.utils.auth import get_authed_user
+
+    authed = get_authed_user()
+    if not authed:
+        return None
+    relations = g.get('viewer_relations')
+    if not relations or relations.user_id != authed.id:
+        relations = ViewerRelations(authed.id)
+        g.viewer_relations = relations
+    return relations
+
+
+def load_viewer_relations(table, column: str, ids):
+    relations = get_viewer_relations()
+    if relations:
+        relations.load(table, column, ids)
+
+
+def viewer_relation(table, column: str, id: int):
+    relations = get_viewer_relations()
+    if not relations:
+        return False
+    return relations.includes(table, column, id)
+
+
+# keep already resolved answers in step with follow/like changes made mid-request
+def update_viewer_relation(table, column: str, user, id: int, value: bool):
+    if not has_app_context():
+        return
+    relations = g.get('viewer_relations')
+    if relations and relations.user_id == user.id:
+        relations.set(table, column, id, value)
+
+
+def clear_viewer_relations():
+    g.pop('viewer_relations', None)
@@ -1,10 +1,14 @@
 import json
+from datetime import datetime
 from grant.utils.enums import ProposalStatus, CCRStatus
 import grant.utils.admin as admin
 from grant.utils import totp_2fa
 from grant.user.models import admin_user_schema
 from grant.proposal.models import proposal_schema, db, Proposal
 from grant.ccr.models import CCR
+from grant.task.jobs import ProposalReminder
+from grant.task.models import Task
+from grant.task.worker import run_due_tasks
 from mock import patch
 
 from ..config import BaseProposalCreatorConfig, BaseCCRCreatorConfig
@@ -788,6 +792,54 @@ class TestAdminAPI(BaseProposalCreatorConfig):
         self.assertEqual(resp.json["status"], CCRStatus.REJECTED_PERMANENTLY)
         self.assertEqual(resp.json["rejectReason"], rejected["rejectReason"])
 
+    def test_requeue_dead_task(self):
+        dead = Task(ProposalReminder.JOB_TYPE, {}, datetime.now())
+        dead.dead = True
+        dead.attempts = 5
+        dead.last_error = "KeyError: 'proposal_id'"
+        pending = Task(ProposalReminder.JOB_TYPE, {}, datetime.now())
+        db.session.add_all([dead, pending])
+        db.session.commit()
+        dead_id, pending_id = dead.id, pending.id
+
+        self.assert401(self.app.get("/api/v1/admin/tasks/dead"))
+        self.login_admin()
+
+        resp = self.app.get("/api/v1/admin/tasks/dead")
+        self.assert200(resp)
+        self.assertEqual([t["id"] for t in resp.json], [dead_id])
+        self.assertEqual(resp.json[0]["lastError"], "KeyError: 'proposal_id'")
+
+        self.assert400(self.app.put(f"/api/v1/admin/tasks/{pending_id}/requeue"))
+        self.assert404(self.app.put("/api/v1/admin/tasks/111111111/requeue"))
+
+        resp = self.app.put(f"/api/v1/admin/tasks/{dead_id}/requeue")
+        self.assert200(resp)
+        self.assertFalse(resp.json["dead"])
+        self.assertEqual(resp.json["attempts"], 0)
+        self.assertEqual(self.app.get("/api/v1/admin/tasks/dead").json, [])
+
+    def test_task_metrics(self):
+        db.session.add_all([
+            Task(ProposalReminder.JOB_TYPE, {"proposal_id": self.proposal.id}, datetime.now()),
+            Task(ProposalReminder.JOB_TYPE, {}, datetime.now()),
+        ])
+        db.session.commit()
+        run_due_tasks()
+
+        self.assert401(self.app.get("/api/v1/admin/tasks/metrics"))
+        self.login_admin()
+
+        resp = self.app.get("/api/v1/admin/tasks/metrics?hours=1")
+        self.assert200(resp)
+        jobs = {j["jobType"]: j for j in resp.json["jobs"]}
+        runs = jobs[ProposalReminder.JOB_TYPE]["runs"]
+        self.assertEqual((runs["runs"], runs["succeeded"], runs["failed"]), (2, 1, 1))
+        self.assertGreater(runs["queriesSum"], 0)
+        self.assertEqual(jobs[ProposalReminder.JOB_TYPE]["name"], "ProposalReminder")
+        # the failed one is backing off
+        self.assertEqual(jobs[ProposalReminder.JOB_TYPE]["queue"]["pending"], 1)
+
 
 def create_ccr(self):
     # create CCR draft
@@ -1,9 +1,12 @@
 import json
+from contextlib import contextmanager
 from datetime import datetime
 from datetime import timedelta
 
 from flask_testing import TestCase
 from mock import patch
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 from grant.app import create_app
 from grant.ccr.models import CCR
@@ -45,6 +48,23 @@ class BaseTestConfig(TestCase):
 
     assert_status = assertStatus
 
+    @contextmanager
+    def record_statements(self):
+        """
+        Collects the SQL statements run inside the block. Connections opened
+        before the block are not instrumented, so commit first.
+        """
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(Engine, "before_cursor_execute", record)
+        try:
+            yield statements
+        finally:
+            event.remove(Engine, "before_cursor_execute", record)
+
 
 class BaseUserConfig(BaseTestConfig):
     def setUp(self):
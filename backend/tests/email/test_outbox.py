@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta
+
+from grant.email.models import EmailOutbox
+from grant.email.outbox import SinkBackend, PermanentSendError, queue_email, flush_queued_emails, deliver_due, \
+    claim_emails, next_send_after
+from grant.extensions import db
+from grant.settings import EMAIL_MAX_ATTEMPTS, EMAIL_RETRY_SECONDS
+
+from ..config import BaseTestConfig
+
+
+class FailingBackend:
+    def __init__(self, error):
+        self.error = error
+
+    def send(self, mail):
+        raise self.error
+
+
+class TestEmailOutbox(BaseTestConfig):
+    def queue(self, to="outbox@example.com", idempotency_key=None):
+        return queue_email(to, "signup", "Subject", "Text", "<p>Html</p>", idempotency_key)
+
+    def test_queued_email_commits_with_the_transaction(self):
+        self.queue()
+        db.session.rollback()
+        flush_queued_emails()
+        self.assertEqual(EmailOutbox.query.count(), 0)
+
+        self.queue()
+        db.session.commit()
+        flush_queued_emails()
+        self.assertEqual(EmailOutbox.query.count(), 1)
+
+    def test_email_queued_after_commit_is_saved_on_flush(self):
+        self.queue()
+        flush_queued_emails()
+        db.session.rollback()
+        self.assertEqual(EmailOutbox.query.count(), 1)
+
+    def test_autoflushed_email_queued_after_commit_is_saved_on_flush(self):
+        db.session.commit()
+        self.queue()
+        # the idempotency key lookup autoflushes the first email
+        self.queue(to="second@example.com", idempotency_key="proposal_failed:1:1")
+        EmailOutbox.query.all()
+        flush_queued_emails()
+        db.session.rollback()
+        self.assertEqual(sorted(e.to for e in EmailOutbox.query), ["outbox@example.com", "second@example.com"])
+
+    def test_committed_emails_are_not_saved_twice(self):
+        self.queue()
+        db.session.commit()
+        self.queue(to="second@example.com")
+        EmailOutbox.query.all()
+        db.session.commit()
+        flush_queued_emails()
+        self.assertEqual(EmailOutbox.query.count(), 2)
+
+    def test_idempotency_key_queues_once(self):
+        self.assertIsNotNone(self.queue(idempotency_key="proposal_failed:1:1"))
+        db.session.commit()
+        self.assertIsNone(self.queue(idempotency_key="proposal_failed:1:1"))
+        self.assertIsNotNone(self.queue(idempotency_key="proposal_failed:1:2"))
+        db.session.commit()
+        self.assertEqual(EmailOutbox.query.count(), 2)
+
+    def test_deliver_due_sends_and_marks_sent(self):
+        for i in range(3):
+            self.queue(to=f"outbox{i}@example.com")
+        db.session.commit()
+        backend = SinkBackend()
+
+        self.assertEqual(deliver_due(backend=backend), (3, 0))
+        self.assertEqual(sorted(m["personalizations"][0]["to"][0]["email"] for m in backend.sent),
+                         [f"outbox{i}@example.com" for i in range(3)])
+        self.assertEqual(EmailOutbox.query.filter_by(sent=True).count(), 3)
+        self.assertIsNone(next_send_after())
+        self.assertEqual(deliver_due(backend=backend), (0, 0))
+
+    def test_claimed_emails_are_skipped(self):
+        self.queue()
+        db.session.commit()
+        now = datetime.now()
+        self.assertEqual(len(claim_emails(now, 10, "other")), 1)
+        self.assertEqual(claim_emails(now, 10, "me"), [])
+        # until the lease runs out
+        self.assertEqual(len(claim_emails(now + timedelta(hours=1), 10, "me")), 1)
+
+    def test_failed_send_backs_off_then_dies(self):
+        email = self.queue()
+        db.session.commit()
+        backend = FailingBackend(Exception("unavailable"))
+
+        self.assertEqual(deliver_due(backend=backend), (0, 1))
+        db.session.refresh(email)
+        self.assertEqual(email.attempts, 1)
+        self.assertFalse(email.dead)
+        self.assertIsNone(email.claimed_by)
+        self.assertGreaterEqual(email.send_after, datetime.now() + timedelta(seconds=EMAIL_RETRY_SECONDS - 5))
+        self.assertEqual(deliver_due(backend=backend), (0, 0))
+
+        for _ in range(EMAIL_MAX_ATTEMPTS - 1):
+            deliver_due(now=datetime.now() + timedelta(days=1), backend=backend)
+        db.session.refresh(email)
+        self.assertEqual(email.attempts, EMAIL_MAX_ATTEMPTS)
+        self.assertTrue(email.dead)
+        self.assertEqual(email.last_error, "Exception: unavailable")
+
+    def test_permanent_failure_dies_at_once(self):
+        email = self.queue()
+        db.session.commit()
+        deliver_due(backend=FailingBackend(PermanentSendError("400: bad address")))
+        db.session.refresh(email)
+        self.assertTrue(email.dead)
+        self.assertEqual(email.attempts, 1)
@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+from mock import patch
+
+from grant.email.models import EmailOutbox
+from grant.email.outbox import SinkBackend, PermanentSendError, deliver_due, queue_emails
+from grant.email.send import make_envelopes, send_bulk_email, generate_email, user_unsubscribe_url, \
+    UNSUBSCRIBE_URL_TAG
+from grant.email.subscription_settings import EmailSubscription
+from grant.extensions import db
+from grant.user.models import User
+
+from ..config import BaseProposalCreatorConfig
+from .test_outbox import FailingBackend
+
+
+class TestBulkEnvelopes(BaseProposalCreatorConfig):
+    def recipients(self):
+        return [(u.email_address.upper(), {
+            'user': u,
+            'proposal': self.proposal,
+            'proposal_url': 'https://example.com',
+        }) for u in (self.user, self.other_user)]
+
+    def test_get_by_emails(self):
+        users = User.get_by_emails([self.user.email_address.upper(), self.other_user.email_address, "nobody@x.com"])
+        self.assertEqual(set(users.keys()), {self.user.email_address.lower(), self.other_user.email_address.lower()})
+
+    def test_recipients_resolve_in_one_query(self):
+        recipients = self.recipients()
+        db.session.commit()
+        db.session.expire_all()
+        with patch.dict(current_app.config, {"TESTING": False}):
+            with self.record_statements() as statements:
+                envelopes = make_envelopes('followed_proposal_update', recipients)
+        self.assertEqual(len([e for e in envelopes if e]), 2)
+        # settings and verification codes are joined in, not lazy loaded per user
+        user_selects = [s for s in statements if s.startswith("SELECT") and "user_settings" in s]
+        self.assertEqual(len(user_selects), 1)
+        self.assertIn("email_verification", user_selects[0])
+
+    def test_unsubscribed_recipients_are_skipped(self):
+        subs = self.other_user.settings.email_subscriptions
+        subs[EmailSubscription.FOLLOWED_PROPOSAL.value['key']] = False
+        self.other_user.settings.email_subscriptions = subs
+        db.session.commit()
+        with patch.dict(current_app.config, {"TESTING": False}):
+            send_bulk_email('followed_proposal_update', self.recipients())
+        db.session.commit()
+        self.assertEqual([e.to for e in EmailOutbox.query], [self.user.email_address.upper()])
+
+
+class TestSubscribedRecipients(BaseProposalCreatorConfig):
+    def unsubscribe(self, user, sub):
+        subs = user.settings.email_subscriptions
+        subs[sub.value['key']] = False
+        user.settings.email_subscriptions = subs
+        db.session.commit()
+
+    def test_subscribed_to_matches_is_subscribed(self):
+        self.unsubscribe(self.other_user, EmailSubscription.ADMIN_APPROVAL)
+        for sub in EmailSubscription:
+            users = {u.id for u in User.subscribed_to(sub)}
+            expected = {u.id for u in User.query if u.settings.is_subscribed_to(sub)}
+            self.assertEqual(users, expected, sub)
+        self.assertNotIn(self.other_user.id, {u.id for u in User.subscribed_to(EmailSubscription.ADMIN_APPROVAL)})
+
+    def test_get_admins_filters_unsubscribed(self):
+        self.user.set_admin(True)
+        self.other_user.set_admin(True)
+        db.session.commit()
+        self.unsubscribe(self.other_user, EmailSubscription.ADMIN_APPROVAL)
+        self.assertEqual(len(User.get_admins()), 2)
+        self.assertEqual([u.id for u in User.get_admins(EmailSubscription.ADMIN_APPROVAL)], [self.user.id])
+
+    def test_subscribed_followers(self):
+        self.proposal.follow(self.user, True)
+        self.proposal.follow(self.other_user, True)
+        db.session.commit()
+        self.unsubscribe(self.user, EmailSubscription.FOLLOWED_PROPOSAL)
+        followers = self.proposal.subscribed_followers(EmailSubscription.FOLLOWED_PROPOSAL)
+        self.assertEqual([u.id for u in followers], [self.other_user.id])
+
+
+class TestFanoutEmail(BaseProposalCreatorConfig):
+    def test_fanout_renders_once(self):
+        self.proposal.follow(self.user, True)
+        self.proposal.follow(self.other_user, True)
+        db.session.commit()
+        with patch.dict(current_app.config, {"TESTING": False}), \
+                patch("grant.email.send.generate_email", wraps=generate_email) as mock_generate:
+            self.proposal.send_follower_email("followed_proposal_revised")
+        db.session.commit()
+        self.assertEqual(mock_generate.call_count, 1)
+
+        emails = EmailOutbox.query.order_by(EmailOutbox.id).all()
+        self.assertEqual(len(emails), 2)
+        self.assertIn(UNSUBSCRIBE_URL_TAG, emails[0].html)
+        self.assertEqual(emails[0].html, emails[1].html)
+        self.assertEqual(
+            [e.substitutions[UNSUBSCRIBE_URL_TAG] for e in emails],
+            [user_unsubscribe_url(u) for u in (self.user, self.other_user)],
+        )
+
+        # both go out in one request
+        backend = SinkBackend()
+        self.assertEqual(deliver_due(backend=backend), (2, 0))
+        self.assertEqual(len(backend.sent), 1)
+        personalizations = backend.sent[0]["personalizations"]
+        self.assertEqual(sorted(p["to"][0]["email"] for p in personalizations),
+                         sorted([self.user.email_address, self.other_user.email_address]))
+        self.assertEqual({p["substitutions"][UNSUBSCRIBE_URL_TAG] for p in personalizations},
+                         {user_unsubscribe_url(u) for u in (self.user, self.other_user)})
+
+    def test_failed_fanout_retries_alone(self):
+        for i in range(3):
+            queue_emails([(f"fanout{i}@example.com", "signup", "Subject", "Text", "Html", None,
+                           {UNSUBSCRIBE_URL_TAG: str(i)})])
+        db.session.commit()
+        deliver_due(backend=FailingBackend(PermanentSendError("400: bad address")))
+        self.assertEqual(EmailOutbox.query.filter_by(dead=True).count(), 0)
+
+        backend = SinkBackend()
+        self.assertEqual(deliver_due(now=datetime.now() + timedelta(days=1), backend=backend), (3, 0))
+        self.assertEqual(len(backend.sent), 3)
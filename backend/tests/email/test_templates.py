@@ -0,0 +1,44 @@
+import os
+import tempfile
+
+from flask import render_template
+
+from grant.admin.example_emails import example_email_args
+from grant.email import templates
+from grant.email.send import generate_email, get_info_lookup
+from grant.settings import UI
+
+from ..config import BaseTestConfig
+
+
+class TestEmailTemplates(BaseTestConfig):
+    def test_renders_like_flask(self):
+        args = example_email_args['signup']
+        for ext in ('txt', 'html'):
+            self.assertEqual(
+                templates.render(f'signup.{ext}', args=args, UI=UI),
+                render_template(f'emails/signup.{ext}', args=args, UI=UI),
+            )
+
+    def test_html_is_escaped(self):
+        args = {**example_email_args['signup'], 'confirm_url': '<b>x</b>'}
+        self.assertNotIn('<b>x</b>', templates.render('signup.html', args=args, UI=UI))
+        self.assertIn('<b>x</b>', templates.render('signup.txt', args=args, UI=UI))
+
+    def test_warm_up_compiles_every_type(self):
+        names = set(templates.email_templates())
+        for type in get_info_lookup:
+            self.assertIn(f'{type}.txt', names)
+            self.assertIn(f'{type}.html', names)
+        self.assertEqual(templates.warm_up(), len(names))
+
+    def test_bytecode_cache_on_disk(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            env = templates.make_env(cache=True, cache_dir=cache_dir)
+            env.get_template('template.html')
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+    def test_generate_email_after_reset(self):
+        templates.reset_env()
+        email = generate_email('signup', example_email_args['signup'])
+        self.assertIn(example_email_args['signup']['confirm_url'], email['text'])
@@ -2,6 +2,7 @@ import json
 
 from mock import patch
 
+from grant.milestone.models import Milestone
 from grant.proposal.models import Proposal, db
 from grant.settings import PROPOSAL_STAKING_AMOUNT
 from grant.utils.enums import ProposalStatus
@@ -242,6 +243,80 @@ class TestProposalAPI(BaseProposalCreatorConfig):
         self.assertEqual(len(self.proposal.followers), 0)
         self.assertEqual(len(self.user.followed_proposals), 0)
 
+    def test_get_proposals_resolves_authed_relations_per_page(self):
+        proposal = self.proposal
+        other_proposal = self.other_proposal
+        proposal.status = ProposalStatus.LIVE
+        other_proposal.status = ProposalStatus.LIVE
+        proposal.follow(self.user, True)
+        other_proposal.like(self.user, True)
+        db.session.commit()
+
+        with self.record_statements() as statements:
+            self.login_default_user()
+            del statements[:]
+            resp = self.app.get("/api/v1/proposals/")
+        self.assert200(resp)
+
+        items = {p["proposalId"]: p for p in resp.json["items"]}
+        self.assertFalse(items[self._proposal_id]["authedLiked"])
+        self.assertTrue(items[self._other_proposal_id]["authedLiked"])
+        # list cards don't include authedFollows, so follows aren't queried at all
+        self.assertNotIn("authedFollows", items[self._proposal_id])
+        self.assertEqual(len([s for s in statements if "proposal_follower.user_id" in s]), 0)
+        self.assertEqual(len([s for s in statements if "proposal_liker.user_id" in s]), 1)
+
+    def test_get_proposals_dumps_cards(self):
+        proposal = self.proposal
+        proposal.status = ProposalStatus.LIVE
+        db.session.commit()
+
+        with self.record_statements() as statements:
+            resp = self.app.get("/api/v1/proposals/")
+        self.assert200(resp)
+
+        card = resp.json["items"][0]
+        self.assertEqual(card["title"], test_proposal["title"])
+        self.assertEqual(card["brief"], test_proposal["brief"])
+        self.assertEqual(card["funded"], "0.000")
+        # formatProposalFromGet converts it for every card
+        self.assertEqual(card["contributionBounty"], "0")
+        for field in ["content", "milestones", "updates", "invites", "payoutAddress"]:
+            self.assertNotIn(field, card)
+        self.assertEqual(set(card["team"][0].keys()), {"userid", "displayName", "avatar"})
+        self.assertFalse([s for s in statements if "proposal.content" in s])
+
+    def test_get_proposals_query_count_is_bounded(self):
+        def add_live_proposals(count):
+            for i in range(count):
+                proposal = Proposal.create(status=ProposalStatus.LIVE, title=f"Proposal {i}")
+                proposal.team.append(self.user if i % 2 else self.other_user)
+                Milestone.make([{
+                    "title": "Milestone",
+                    "content": "Content",
+                    "days_estimated": "30",
+                    "payout_percent": 100,
+                    "immediate_payout": True
+                }], proposal)
+                db.session.add(proposal)
+            db.session.commit()
+
+        def count_selects():
+            with self.record_statements() as statements:
+                resp = self.app.get("/api/v1/proposals/")
+            self.assert200(resp)
+            # paginate() only counts the total once a page fills up
+            selects = [s for s in statements if s.startswith("SELECT") and not s.startswith("SELECT count(*)")]
+            return len(resp.json["items"]), len(selects)
+
+        add_live_proposals(2)
+        few_items, few_selects = count_selects()
+        add_live_proposals(7)
+        many_items, many_selects = count_selects()
+
+        self.assertEqual((few_items, many_items), (2, 9))
+        self.assertEqual(few_selects, many_selects)
+
     def test_like_proposal(self):
         # not logged in
         resp = self.app.put(
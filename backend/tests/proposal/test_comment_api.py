@@ -204,3 +204,48 @@ class TestProposalCommentAPI(BaseUserConfig):
         self.assertEqual(resp.json["likesCount"], 0)
         comment = Comment.query.get(comment_id)
         self.assertTrue(self.user not in comment.likes)
+
+    def test_get_comments_resolves_authed_liked_per_thread(self):
+        proposal = Proposal(status=ProposalStatus.LIVE)
+        db.session.add(proposal)
+        db.session.commit()
+        comment = Comment(proposal_id=proposal.id, user_id=self.user.id, parent_comment_id=None, content="parent")
+        db.session.add(comment)
+        db.session.flush()
+        replies = [
+            Comment(proposal_id=proposal.id, user_id=self.user.id, parent_comment_id=comment.id, content=str(i))
+            for i in range(3)
+        ]
+        db.session.add_all(replies)
+        db.session.flush()
+        replies[1].like(self.user, True)
+        db.session.commit()
+        proposal_id = proposal.id
+        liked_id = replies[1].id
+
+        with self.record_statements() as statements:
+            self.login_default_user()
+            del statements[:]
+            resp = self.app.get(f"/api/v1/proposals/{proposal_id}/comments")
+        self.assert200(resp)
+
+        thread = resp.json["items"][0]
+        self.assertFalse(thread["authedLiked"])
+        for reply in thread["replies"]:
+            self.assertEqual(reply["authedLiked"], reply["id"] == liked_id)
+        self.assertEqual(len([s for s in statements if "comment_liker.user_id" in s]), 1)
+
+    def test_get_comments_anonymous_skips_authed_liked(self):
+        proposal = Proposal(status=ProposalStatus.LIVE)
+        db.session.add(proposal)
+        db.session.commit()
+        comment = Comment(proposal_id=proposal.id, user_id=self.user.id, parent_comment_id=None, content="parent")
+        db.session.add(comment)
+        db.session.commit()
+        proposal_id = proposal.id
+
+        with self.record_statements() as statements:
+            resp = self.app.get(f"/api/v1/proposals/{proposal_id}/comments")
+        self.assert200(resp)
+        self.assertFalse(resp.json["items"][0]["authedLiked"])
+        self.assertFalse([s for s in statements if "comment_liker.user_id" in s])
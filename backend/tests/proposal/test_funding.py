@@ -0,0 +1,96 @@
+from grant.proposal.models import Proposal, ProposalContribution, ProposalFunding, db
+from ..config import BaseProposalCreatorConfig
+
+
+class TestProposalFunding(BaseProposalCreatorConfig):
+    def add_contribution(self, amount, staking=False, proposal=None, user_id=None, confirm=True):
+        contribution = ProposalContribution(
+            proposal_id=(proposal or self.proposal).id,
+            amount=amount,
+            user_id=user_id,
+            staking=staking,
+        )
+        db.session.add(contribution)
+        db.session.flush()
+        if confirm:
+            contribution.confirm(tx_id="tx", amount=amount)
+        db.session.commit()
+        return contribution
+
+    def test_contributed_sums_confirmed_contributions(self):
+        self.add_contribution("1.5", user_id=self.user.id)
+        self.add_contribution("0.25", user_id=self.user.id)
+        self.add_contribution("100", confirm=False)
+        self.add_contribution("0.025", staking=True)
+
+        proposal = self.proposal
+        self.assertEqual(proposal.contributed, "1.75")
+        self.assertEqual(proposal.amount_staked, "0.025")
+        self.assertEqual(proposal.funding.contributor_count, 1)
+        self.assertIsNotNone(proposal.funding.date_last_confirmed)
+
+    def test_contributed_defaults_to_zero(self):
+        self.assertEqual(self.proposal.contributed, "0")
+        self.assertEqual(self.proposal.amount_staked, "0")
+        self.assertEqual(self.proposal.funded, "0.000")
+        self.assertFalse(self.proposal.is_funded)
+
+    def test_confirm_updates_ledger_before_commit(self):
+        proposal = self.proposal
+        self.assertEqual(proposal.contributed, "0")
+
+        contribution = ProposalContribution(proposal_id=proposal.id, amount="3")
+        db.session.add(contribution)
+        db.session.flush()
+        self.assertEqual(proposal.contributed, "0")
+
+        contribution.confirm(tx_id="tx", amount="3")
+        self.assertEqual(proposal.contributed, "3")
+
+    def test_load_funding_for_many_proposals(self):
+        self.add_contribution("2")
+        self.add_contribution("5", proposal=self.other_proposal)
+
+        proposals = Proposal.query.all()
+        Proposal.load_funding(proposals)
+
+        by_id = {p.id: p.contributed for p in proposals}
+        self.assertEqual(by_id[self._proposal_id], "2")
+        self.assertEqual(by_id[self._other_proposal_id], "5")
+
+    def test_is_funded_expression(self):
+        self.add_contribution(self.proposal.target)
+        self.add_contribution("1", proposal=self.other_proposal)
+        other = self.other_proposal
+        other.target = "10"
+        db.session.commit()
+
+        funded_ids = [p.id for p in Proposal.query.filter(Proposal.is_funded).all()]
+        self.assertEqual(funded_ids, [self._proposal_id])
+        self.assertTrue(self.proposal.is_funded)
+        self.assertFalse(self.other_proposal.is_funded)
+
+    def test_refresh_rebuilds_out_of_date_ledger(self):
+        self.add_contribution("4", user_id=self.user.id)
+        self.add_contribution("1", user_id=self.other_user.id)
+        funding = self.proposal.funding
+        funding.contributed = "0"
+        funding.contributor_count = 0
+        db.session.commit()
+
+        totals = ProposalFunding.calculate([self._proposal_id])[self._proposal_id]
+        self.assertFalse(self.proposal.funding.matches(totals))
+
+        ProposalFunding.refresh(self._proposal_id)
+        db.session.commit()
+        self.assertEqual(self.proposal.contributed, "5")
+        self.assertEqual(self.proposal.funding.contributor_count, 2)
+        self.assertTrue(self.proposal.funding.matches(totals))
+
+    def test_calculate_is_exact_for_float_sums(self):
+        # 184.361 as a float sum in sqlite is 184.36100000000002
+        for amount in ("100.1", "84.2", "0.061"):
+            self.add_contribution(amount, user_id=self.user.id)
+        totals = ProposalFunding.calculate([self._proposal_id])[self._proposal_id]
+        self.assertEqual(str(totals["contributed"]), "184.361")
+        self.assertTrue(self.proposal.funding.matches(totals))
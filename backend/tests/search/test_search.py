@@ -0,0 +1,53 @@
+from flask import current_app
+
+from grant.comment.models import Comment
+from grant.proposal.models import Proposal, proposals_schema, db
+from grant.search.models import SearchDocument
+from grant.utils import pagination
+from grant.utils.enums import ProposalStatus
+from ..config import BaseProposalCreatorConfig
+
+
+class TestSearch(BaseProposalCreatorConfig):
+    def document(self, entity_type, entity_id):
+        return SearchDocument.query.filter_by(entity_type=entity_type, entity_id=entity_id).first()
+
+    def test_documents_follow_model_changes(self):
+        proposal = Proposal.create(status=ProposalStatus.LIVE, title="Shielded Wallet Audit")
+        db.session.add(proposal)
+        db.session.commit()
+        proposal_id = proposal.id
+        self.assertEqual(self.document("proposal", proposal_id).document, "shielded wallet audit")
+
+        proposal.title = "Light Client"
+        db.session.commit()
+        self.assertEqual(self.document("proposal", proposal_id).document, "light client")
+
+        db.session.delete(proposal)
+        db.session.commit()
+        self.assertIsNone(self.document("proposal", proposal_id))
+
+        self.assertIn(self.user.email_address.lower(), self.document("user", self.user.id).document)
+
+    def test_paginated_search_uses_documents(self):
+        for title in ["Shielded Wallet Audit", "Light Client", "Wallet Docs"]:
+            db.session.add(Proposal.create(status=ProposalStatus.LIVE, title=title))
+        db.session.commit()
+
+        with current_app.test_request_context():
+            page = pagination.proposal(schema=proposals_schema, search="wallet")
+            titles = sorted(p["title"] for p in page["items"])
+            self.assertEqual(titles, ["Shielded Wallet Audit", "Wallet Docs"])
+            self.assertEqual(page["total"], 2)
+
+    def test_comment_search(self):
+        for content in ["viewing keys please", "great idea", "what about viewing keys?"]:
+            db.session.add(Comment(proposal_id=self._proposal_id, user_id=self.user.id, parent_comment_id=None,
+                                   content=content))
+        db.session.commit()
+
+        resp = self.app.get(f"/api/v1/proposals/{self._proposal_id}/comments", query_string={"search": "Viewing Keys"})
+        self.assert200(resp)
+        self.assertEqual(resp.json["total"], 2)
+        self.assertEqual(sorted(c["content"] for c in resp.json["items"]),
+                         ["viewing keys please", "what about viewing keys?"])
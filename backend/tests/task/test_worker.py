@@ -0,0 +1,352 @@
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from grant.settings import TASK_LEASE_SECONDS, TASK_MAX_ATTEMPTS, TASK_RETRY_SECONDS, TASK_RETRY_MAX_SECONDS, \
+    TASK_SCHEDULER_MAX_SLEEP
+from grant.proposal.models import Proposal, ProposalContribution
+from grant.task.jobs import MilestoneDeadline, ProposalDeadline, ProposalReminder, PruneDraft
+from grant.task.metrics import prometheus_metrics
+from grant.task.models import Task, TaskArchive, TaskRun, db
+from grant.task.retention import archive_tasks, prune_runs
+from grant.task.scheduler import TaskScheduler, next_due
+from grant.task.worker import claim_tasks, run_due_tasks, retry_delay
+from grant.utils.enums import MilestoneStage, ProposalStage, ProposalStatus
+
+from ..config import BaseProposalCreatorConfig
+
+
+class TestTaskWorker(BaseProposalCreatorConfig):
+    def make_tasks(self, count, blob=None):
+        now = datetime.now()
+        for i in range(count):
+            db.session.add(Task(
+                job_type=ProposalReminder.JOB_TYPE,
+                blob=blob if blob is not None else {"proposal_id": self._proposal_id},
+                execute_after=now - timedelta(minutes=1),
+            ))
+        db.session.commit()
+
+    def test_claims_are_exclusive_until_the_lease_runs_out(self):
+        self.make_tasks(3)
+        now = datetime.now()
+
+        first = claim_tasks(now, 2, "worker-a")
+        second = claim_tasks(now, 5, "worker-b")
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse(set(first) & set(second))
+        self.assertEqual(claim_tasks(now, 5, "worker-c"), [])
+
+        # worker-a died, its tasks are free again once the lease expires
+        later = now + timedelta(seconds=TASK_LEASE_SECONDS + 1)
+        self.assertEqual(sorted(claim_tasks(later, 5, "worker-c")), sorted(first + second))
+
+    def test_run_due_tasks_on_a_thread_pool(self):
+        self.make_tasks(6)
+
+        ids, results = run_due_tasks(threads=3)
+        self.assertEqual(len(ids), 6)
+        self.assertEqual(results, [True] * 6)
+        db.session.expire_all()
+        self.assertEqual(Task.query.filter_by(completed=False).count(), 0)
+        self.assertEqual(run_due_tasks(threads=3), ([], []))
+
+    @patch('grant.task.views.TASK_BATCH_SIZE', 2)
+    def test_cron_trigger_runs_every_due_batch(self):
+        self.make_tasks(5)
+
+        resp = self.app.get("/api/v1/task/")
+        self.assert200(resp)
+        self.assertEqual(len(resp.json), 5)
+        db.session.expire_all()
+        self.assertEqual(Task.query.filter_by(completed=False).count(), 0)
+
+    def test_failed_task_backs_off_then_dies(self):
+        self.make_tasks(1, blob={})
+
+        ids, results = run_due_tasks()
+        self.assertEqual(results, [False])
+        task = Task.query.get(ids[0])
+        self.assertEqual(task.attempts, 1)
+        self.assertIn("KeyError", task.last_error)
+        self.assertIsNone(task.claimed_by)
+        self.assertFalse(task.dead)
+
+        # not picked up again until the backoff window has passed
+        self.assertEqual(run_due_tasks(), ([], []))
+        for attempt in range(2, TASK_MAX_ATTEMPTS + 1):
+            task = Task.query.get(ids[0])
+            self.assertEqual(run_due_tasks(now=task.next_attempt_at), (ids, [False]))
+        task = Task.query.get(ids[0])
+        self.assertEqual(task.attempts, TASK_MAX_ATTEMPTS)
+        self.assertTrue(task.dead)
+        self.assertIsNone(task.next_attempt_at)
+        self.assertEqual(run_due_tasks(now=datetime.now() + timedelta(days=365)), ([], []))
+
+    def test_retry_delay_doubles_up_to_the_cap(self):
+        self.assertEqual(retry_delay(1), timedelta(seconds=TASK_RETRY_SECONDS))
+        self.assertEqual(retry_delay(3), timedelta(seconds=TASK_RETRY_SECONDS * 4))
+        self.assertEqual(retry_delay(50), timedelta(seconds=TASK_RETRY_MAX_SECONDS))
+
+
+class TestTaskRetention(BaseProposalCreatorConfig):
+    def test_archives_old_completed_tasks(self):
+        now = datetime.now()
+        for days, completed in [(60, True), (45, True), (45, False), (5, True)]:
+            task = Task(ProposalReminder.JOB_TYPE, {"proposal_id": days}, now - timedelta(days=days))
+            task.completed = completed
+            db.session.add(task)
+        db.session.commit()
+
+        archived, removed = archive_tasks(now - timedelta(days=30), batch_size=1)
+        self.assertEqual((archived, removed), (2, 2))
+        self.assertEqual(sorted(a.blob for a in TaskArchive.query.all()),
+                         ['{"proposal_id": 45}', '{"proposal_id": 60}'])
+        remaining = sorted((t.blob["proposal_id"], t.completed) for t in Task.query.all())
+        self.assertEqual(remaining, [(5, True), (45, False)])
+
+        archived, removed = archive_tasks(now, delete=True)
+        self.assertEqual((archived, removed), (0, 1))
+        self.assertEqual(TaskArchive.query.count(), 2)
+
+
+class TestProposalDeadlines(BaseProposalCreatorConfig):
+    def make_live_proposal(self, days_left, contributed=None, stage=ProposalDeadline.FUNDING_REQUIRED):
+        proposal = Proposal.create(status=ProposalStatus.LIVE, title="Deadline", target="10", deadline_duration=86400)
+        proposal.stage = stage
+        proposal.date_published = datetime.now() - timedelta(days=1 - days_left)
+        proposal.team.append(self.user)
+        db.session.add(proposal)
+        db.session.flush()
+        if contributed:
+            contribution = ProposalContribution(proposal_id=proposal.id, amount=contributed,
+                                                user_id=self.other_user.id)
+            db.session.add(contribution)
+            db.session.flush()
+            contribution.confirm(tx_id="tx", amount=contributed)
+        # make_task commits
+        ProposalDeadline(proposal).make_task()
+        return proposal.id
+
+    @patch("grant.email.send.send_bulk_email")
+    def test_expired_proposals_fail_in_one_batch(self, mock_send_bulk_email):
+        unfunded = [self.make_live_proposal(0), self.make_live_proposal(0, contributed="2")]
+        funded = self.make_live_proposal(0, contributed="10")
+        running = self.make_live_proposal(1)
+        wip = self.make_live_proposal(0, stage=ProposalStage.WIP)
+        version = Proposal.query.get(unfunded[0]).row_version
+
+        with self.record_statements() as statements:
+            ids, results = run_due_tasks(now=datetime.now() + timedelta(seconds=1))
+        self.assertEqual(len(ids), 4)
+        self.assertEqual(results, [True] * 4)
+        updates = [s for s in statements if s.startswith("UPDATE proposal SET")]
+        self.assertEqual(len(updates), 1)
+
+        db.session.expire_all()
+        stages = {p.id: p.stage for p in Proposal.query.filter(Proposal.id.in_(unfunded + [funded, running, wip]))}
+        self.assertEqual(stages, {
+            unfunded[0]: ProposalStage.FAILED,
+            unfunded[1]: ProposalStage.FAILED,
+            funded: ProposalDeadline.FUNDING_REQUIRED,
+            running: ProposalDeadline.FUNDING_REQUIRED,
+            wip: ProposalStage.WIP,
+        })
+        self.assertEqual(Proposal.query.get(unfunded[0]).row_version, version + 1)
+        sent = [(r[0], c[0][0]) for c in mock_send_bulk_email.call_args_list for r in c[0][1]]
+        self.assertEqual(sorted(sent), sorted([
+            (self.user.email_address, "proposal_failed"),
+            (self.user.email_address, "proposal_failed"),
+            (self.other_user.email_address, "contribution_proposal_failed"),
+        ]))
+
+    def test_fail_expired_without_tasks(self):
+        expired = self.make_live_proposal(0)
+        self.make_live_proposal(1)
+        self.assertEqual(ProposalDeadline.fail_expired(datetime.now()), [expired])
+        db.session.commit()
+        self.assertEqual(ProposalDeadline.fail_expired(datetime.now()), [])
+
+
+class TestTaskDedupe(BaseProposalCreatorConfig):
+    def schedule(self, execute_after, key="reminder:1"):
+        task = Task.schedule(ProposalReminder.JOB_TYPE, {"proposal_id": self._proposal_id}, execute_after, key)
+        db.session.commit()
+        return task.id
+
+    def test_rescheduling_replaces_the_pending_task(self):
+        now = datetime.now()
+        first = self.schedule(now + timedelta(days=1))
+        second = self.schedule(now + timedelta(days=2))
+        self.assertEqual(first, second)
+        self.assertEqual(Task.query.count(), 1)
+        self.assertEqual(Task.query.get(first).execute_after, now + timedelta(days=2))
+
+        # other keys and keyless tasks are never merged
+        self.schedule(now, key="reminder:2")
+        self.schedule(now, key=None)
+        self.schedule(now, key=None)
+        self.assertEqual(Task.query.count(), 4)
+
+    def test_concurrent_schedule_reschedules_the_winner(self):
+        now = datetime.now()
+        first = self.schedule(now + timedelta(days=1))
+
+        # the lookup ran before the other schedule committed its task
+        with patch.object(Task, "pending_for_key", side_effect=[None, Task.pending_for_key("reminder:1")]):
+            second = self.schedule(now + timedelta(days=2))
+        self.assertEqual(first, second)
+        self.assertEqual(Task.query.count(), 1)
+        self.assertEqual(Task.query.get(first).execute_after, now + timedelta(days=2))
+
+    def test_running_task_gives_up_its_key(self):
+        now = datetime.now()
+        running = self.schedule(now - timedelta(minutes=1))
+        self.assertEqual(claim_tasks(now, 1, "worker-a"), [running])
+
+        rescheduled = self.schedule(now + timedelta(days=1))
+        self.assertNotEqual(running, rescheduled)
+        self.assertIsNone(Task.query.get(running).dedupe_key)
+        self.assertEqual(Task.query.get(rescheduled).dedupe_key, "reminder:1")
+
+    def test_finished_task_is_not_rescheduled(self):
+        done = self.schedule(datetime.now() - timedelta(minutes=1))
+        run_due_tasks()
+        self.assertNotEqual(self.schedule(datetime.now() + timedelta(days=1)), done)
+        self.assertEqual(Task.query.filter_by(dedupe_key="reminder:1").count(), 2)
+
+
+class TestTaskMetrics(BaseProposalCreatorConfig):
+    def test_runs_are_recorded_per_job_type(self):
+        due = datetime.now() - timedelta(minutes=1)
+        db.session.add(Task(ProposalReminder.JOB_TYPE, {"proposal_id": self._proposal_id}, due))
+        db.session.add(Task(ProposalReminder.JOB_TYPE, {}, due))
+        db.session.commit()
+        run_due_tasks()
+
+        runs = TaskRun.query.order_by(TaskRun.succeeded).all()
+        self.assertEqual([r.succeeded for r in runs], [False, True])
+        for run in runs:
+            self.assertEqual(run.job_type, ProposalReminder.JOB_TYPE)
+            self.assertGreaterEqual(run.lag_seconds, 60)
+        # the failing task raises before its first query
+        self.assertEqual([r.query_count > 0 for r in runs], [False, True])
+
+        text = prometheus_metrics(datetime.now())
+        labels = f'job_type="{ProposalReminder.JOB_TYPE}",name="ProposalReminder"'
+        self.assertIn(f'grant_task_runs_total{{{labels},result="succeeded"}} 1', text)
+        self.assertIn(f'grant_task_runs_total{{{labels},result="failed"}} 1', text)
+        self.assertIn(f'grant_task_duration_seconds_bucket{{{labels},le="+Inf"}} 2', text)
+        self.assertIn(f'grant_task_pending{{{labels}}} 1', text)
+
+        self.assertEqual(prune_runs(datetime.now() + timedelta(seconds=1)), 2)
+        self.assertEqual(TaskRun.query.count(), 0)
+
+
+class TestTaskBlob(BaseProposalCreatorConfig):
+    def test_pending_tasks_are_found_by_proposal(self):
+        now = datetime.now()
+        other = Proposal.create(status=ProposalStatus.DRAFT)
+        db.session.add(other)
+        db.session.flush()
+        done = Task(ProposalReminder.JOB_TYPE, {"proposal_id": self._proposal_id}, now)
+        done.completed = True
+        db.session.add_all([
+            Task(ProposalReminder.JOB_TYPE, {"proposal_id": self._proposal_id}, now),
+            Task(ProposalDeadline.JOB_TYPE, {"proposal_id": self._proposal_id, "extra": [1]}, now),
+            Task(ProposalReminder.JOB_TYPE, {"proposal_id": other.id}, now),
+            done,
+        ])
+        db.session.commit()
+
+        tasks = Task.query.filter(Task.pending(), Task.for_proposal(self._proposal_id)).order_by(Task.id).all()
+        self.assertEqual([t.job_type for t in tasks], [ProposalReminder.JOB_TYPE, ProposalDeadline.JOB_TYPE])
+        self.assertEqual(tasks[1].blob, {"proposal_id": self._proposal_id, "extra": [1]})
+
+        # in place changes are still tracked
+        tasks[0].blob["proposal_id"] = other.id
+        db.session.commit()
+        self.assertEqual(Task.query.filter(Task.pending(), Task.for_proposal(other.id)).count(), 2)
+
+
+class TestTaskCancel(BaseProposalCreatorConfig):
+    def make_task(self, job_type, **blob):
+        db.session.add(Task(job_type, dict(proposal_id=self._proposal_id, **blob), datetime.now()))
+        db.session.commit()
+
+    def pending_types(self):
+        tasks = Task.query.filter(Task.pending(), Task.for_proposal(self._proposal_id))
+        return sorted(t.job_type for t in tasks)
+
+    def test_deleting_a_proposal_cancels_its_tasks(self):
+        self.make_task(PruneDraft.JOB_TYPE)
+        self.make_task(ProposalReminder.JOB_TYPE)
+        self.make_task(PruneDraft.JOB_TYPE)
+        running = claim_tasks(datetime.now(), 1, "worker-a")
+
+        db.session.delete(self.proposal)
+        db.session.commit()
+        self.assertEqual(Task.query.count(), 1)
+        self.assertEqual(Task.query.first().id, running[0])
+
+    def test_publish_and_cancel_drop_irrelevant_tasks(self):
+        self.make_task(PruneDraft.JOB_TYPE)
+        self.make_task(ProposalReminder.JOB_TYPE)
+        self.proposal.status = ProposalStatus.APPROVED
+        self.proposal.publish()
+        db.session.commit()
+        self.assertEqual(self.pending_types(), [ProposalReminder.JOB_TYPE])
+
+        self.make_task(ProposalDeadline.JOB_TYPE)
+        self.make_task(MilestoneDeadline.JOB_TYPE, milestone_id=self.proposal.milestones[1].id)
+        self.proposal.cancel()
+        db.session.commit()
+        self.assertEqual(self.pending_types(), [ProposalReminder.JOB_TYPE])
+
+    def test_paying_a_milestone_cancels_its_deadline(self):
+        first, second = self.proposal.milestones[:2]
+        self.make_task(MilestoneDeadline.JOB_TYPE, milestone_id=first.id)
+        self.make_task(MilestoneDeadline.JOB_TYPE, milestone_id=second.id)
+
+        second.stage = MilestoneStage.ACCEPTED
+        second.mark_paid("tx")
+        db.session.commit()
+        tasks = Task.query.filter(Task.pending(), Task.for_proposal(self._proposal_id)).all()
+        self.assertEqual([t.blob["milestone_id"] for t in tasks], [first.id])
+
+
+class TestTaskScheduler(BaseProposalCreatorConfig):
+    def make_task(self, execute_after, blob=None):
+        task = Task(ProposalReminder.JOB_TYPE, blob if blob is not None else {"proposal_id": self._proposal_id},
+                    execute_after)
+        db.session.add(task)
+        db.session.commit()
+        return task
+
+    def test_next_due(self):
+        now = datetime.now()
+        self.assertIsNone(next_due(now))
+        self.make_task(now + timedelta(hours=2))
+        self.make_task(now + timedelta(hours=1))
+        self.assertEqual(next_due(now), now + timedelta(hours=1))
+
+        # a due task backing off counts from its retry
+        failing = self.make_task(now - timedelta(minutes=1))
+        failing.next_attempt_at = now + timedelta(minutes=5)
+        db.session.commit()
+        self.assertEqual(next_due(now), now + timedelta(minutes=5))
+
+    def test_run_once_runs_due_tasks_then_sleeps_until_the_next(self):
+        now = datetime.now()
+        self.make_task(now - timedelta(minutes=1))
+        self.make_task(now + timedelta(seconds=30))
+        scheduler = TaskScheduler(self.app.application)
+
+        delay = scheduler.run_once(now)
+        self.assertEqual(Task.query.filter_by(completed=True).count(), 1)
+        self.assertGreater(delay, 0)
+        self.assertLessEqual(delay, 30)
+
+        Task.query.delete()
+        db.session.commit()
+        self.assertEqual(scheduler.run_once(datetime.now()), TASK_SCHEDULER_MAX_SLEEP)
@@ -0,0 +1,118 @@
+import datetime
+
+from grant.proposal.models import Proposal, ProposalContribution, db
+from grant.rfp.models import RFP
+from grant.user.models import User
+from grant.utils.enums import ProposalStatus, RFPStatus
+from ..config import BaseProposalCreatorConfig
+
+
+class TestDetailEtags(BaseProposalCreatorConfig):
+    def setUp(self):
+        super().setUp()
+        proposal = self.proposal
+        proposal.status = ProposalStatus.LIVE
+        db.session.commit()
+
+    def get(self, url, etag=None):
+        headers = {"If-None-Match": f'"{etag}"'} if etag else {}
+        return self.app.get(url, headers=headers)
+
+    def assert_unchanged(self, url, etag):
+        with self.record_statements() as statements:
+            resp = self.get(url, etag)
+        self.assertStatus(resp, 304)
+        self.assertEqual(resp.data, b"")
+        self.assertEqual(resp.headers["ETag"], f'"{etag}"')
+        return statements
+
+    def assert_changed(self, url, etag):
+        resp = self.get(url, etag)
+        self.assert200(resp)
+        self.assertNotEqual(resp.headers["ETag"], f'"{etag}"')
+        return resp.get_etag()[0]
+
+    def test_proposal_etag(self):
+        url = f"/api/v1/proposals/{self._proposal_id}"
+        resp = self.get(url)
+        self.assert200(resp)
+        etag = resp.get_etag()[0]
+
+        statements = self.assert_unchanged(url, etag)
+        # the lookup itself, nothing from serialization
+        self.assertFalse([s for s in statements if "FROM milestone" in s or "FROM proposal_team" in s])
+
+        milestone = self.proposal.milestones[0]
+        milestone.title = "Renamed"
+        db.session.commit()
+        etag = self.assert_changed(url, etag)
+        self.assert_unchanged(url, etag)
+
+        user = User.query.get(self.user.id)
+        user.display_name = "Someone Else"
+        db.session.commit()
+        etag = self.assert_changed(url, etag)
+
+        contribution = ProposalContribution(proposal_id=self._proposal_id, user_id=self.user.id, amount="1")
+        db.session.add(contribution)
+        db.session.flush()
+        contribution.confirm(tx_id="tx", amount="1")
+        db.session.commit()
+        etag = self.assert_changed(url, etag)
+
+        # authed_* fields differ per viewer
+        self.login_default_user()
+        self.assert_changed(url, etag)
+
+    def test_proposal_etag_changes_when_deadline_passes(self):
+        url = f"/api/v1/proposals/{self._proposal_id}"
+        etag = self.get(url).get_etag()[0]
+        self.assert_unchanged(url, etag)
+
+        # only time passes, the row itself is untouched
+        past = datetime.datetime.now() - datetime.timedelta(seconds=self.proposal.deadline_duration + 60)
+        db.session.execute(Proposal.__table__.update()
+                           .where(Proposal.id == self._proposal_id)
+                           .values(date_published=past))
+        db.session.commit()
+        self.assert_changed(url, etag)
+
+    def test_rfp_etag_follows_its_proposals(self):
+        rfp = RFP(
+            title="title",
+            brief="brief",
+            content="content",
+            date_closes=datetime.datetime(2030, 1, 1),
+            bounty="10",
+            status=RFPStatus.LIVE,
+        )
+        db.session.add(rfp)
+        db.session.commit()
+        rfp_id = rfp.id
+        url = f"/api/v1/rfps/{rfp_id}"
+        etag = self.get(url).get_etag()[0]
+        self.assert_unchanged(url, etag)
+
+        proposal = self.proposal
+        proposal.rfp_id = rfp_id
+        db.session.commit()
+        etag = self.assert_changed(url, etag)
+
+        proposal = self.proposal
+        proposal.title = "New title"
+        db.session.commit()
+        self.assert_changed(url, etag)
+
+    def test_user_etag(self):
+        url = f"/api/v1/users/{self.user.id}"
+        etag = self.get(url).get_etag()[0]
+        self.assert_unchanged(url, etag)
+
+        user = User.query.get(self.user.id)
+        user.title = "New title"
+        db.session.commit()
+        etag = self.assert_changed(url, etag)
+
+        # expansions are always rendered
+        resp = self.app.get(url, query_string={"withProposals": "true"}, headers={"If-None-Match": f'"{etag}"'})
+        self.assert200(resp)
@@ -0,0 +1,164 @@
+import datetime
+
+from flask import current_app
+
+from grant.comment.models import Comment
+from grant.proposal.models import Proposal, ProposalContribution, proposals_schema, \
+    admin_proposal_contributions_schema, db
+from grant.utils import pagination
+from grant.utils.counts import estimable_table
+from grant.utils.enums import ProposalStatus
+from grant.utils.loading import eager
+from grant.utils.pagination import PaginationException, encode_cursor, decode_cursor
+from ..config import BaseProposalCreatorConfig
+
+
+class TestCursorPagination(BaseProposalCreatorConfig):
+    def walk_comments(self, cursor, direction='nextCursor'):
+        pages = []
+        while cursor is not None:
+            resp = self.app.get(f"/api/v1/proposals/{self._proposal_id}/comments", query_string={"cursor": cursor})
+            self.assert200(resp)
+            pages.append([c["id"] for c in resp.json["items"]])
+            cursor = resp.json[direction]
+        return pages
+
+    def test_cursor_round_trip(self):
+        now = datetime.datetime.now()
+        self.assertEqual(decode_cursor(encode_cursor(now, 5, 'next')), (now, 5, 'next'))
+        self.assertEqual(decode_cursor(encode_cursor("1.5", 2, 'prev')), ("1.5", 2, 'prev'))
+        self.assertEqual(decode_cursor(encode_cursor(None, 3, 'next')), (None, 3, 'next'))
+        with self.assertRaises(PaginationException):
+            decode_cursor("not a cursor")
+
+    def test_comment_cursor_walks_pages_both_ways(self):
+        same_time = datetime.datetime(2020, 1, 1)
+        comments = []
+        for i in range(23):
+            comment = Comment(proposal_id=self._proposal_id, user_id=self.user.id, parent_comment_id=None,
+                              content=str(i))
+            # plenty of ties so the id tiebreaker matters
+            comment.date_created = same_time + datetime.timedelta(minutes=i // 4)
+            comments.append(comment)
+        db.session.add_all(comments)
+        db.session.commit()
+        expected = [c.id for c in sorted(comments, key=lambda c: (c.date_created, c.id), reverse=True)]
+
+        resp = self.app.get(f"/api/v1/proposals/{self._proposal_id}/comments", query_string={"cursor": ""})
+        self.assert200(resp)
+        self.assertIsNone(resp.json["total"])
+        self.assertIsNone(resp.json["prevCursor"])
+
+        pages = self.walk_comments("")
+        self.assertEqual([len(p) for p in pages], [10, 10, 3])
+        self.assertEqual(sum(pages, []), expected)
+
+        # walk back from the last page
+        resp = self.app.get(f"/api/v1/proposals/{self._proposal_id}/comments", query_string={"cursor": ""})
+        resp = self.app.get(f"/api/v1/proposals/{self._proposal_id}/comments",
+                            query_string={"cursor": resp.json["nextCursor"]})
+        resp = self.app.get(f"/api/v1/proposals/{self._proposal_id}/comments",
+                            query_string={"cursor": resp.json["nextCursor"]})
+        self.assertIsNone(resp.json["nextCursor"])
+        back = self.walk_comments(resp.json["prevCursor"], 'prevCursor')
+        self.assertEqual(back, [pages[1], pages[0]])
+
+    def test_cursor_with_total_and_invalid_cursor(self):
+        for i in range(3):
+            db.session.add(Comment(proposal_id=self._proposal_id, user_id=self.user.id, parent_comment_id=None,
+                                   content=str(i)))
+        db.session.commit()
+
+        resp = self.app.get(f"/api/v1/proposals/{self._proposal_id}/comments",
+                            query_string={"cursor": "", "withTotal": "true"})
+        self.assert200(resp)
+        self.assertEqual(resp.json["total"], 3)
+        self.assertIsNone(resp.json["nextCursor"])
+
+        resp = self.app.get(f"/api/v1/proposals/{self._proposal_id}/comments", query_string={"cursor": "nope"})
+        self.assert400(resp)
+
+    def test_proposal_cursor_orders_null_sort_keys_last(self):
+        published = datetime.datetime(2020, 1, 1)
+        for i in range(12):
+            proposal = Proposal.create(status=ProposalStatus.LIVE, title=f"Proposal {i}")
+            # every third proposal is unpublished
+            proposal.date_published = None if i % 3 == 0 else published + datetime.timedelta(days=i // 2)
+            db.session.add(proposal)
+        db.session.commit()
+        proposals = Proposal.query.all()
+        expected = [p.id for p in sorted(
+            proposals,
+            key=lambda p: (p.date_published is not None, p.date_published or published, p.id),
+            reverse=True,
+        )]
+
+        with current_app.test_request_context():
+            pages = []
+            cursor = ""
+            while cursor is not None:
+                page = pagination.proposal(schema=proposals_schema, cursor=cursor)
+                pages.append(page)
+                cursor = page["next_cursor"]
+            ids = [[p["proposal_id"] for p in page["items"]] for page in pages]
+            self.assertEqual([len(p) for p in ids], [9, 5])
+            self.assertEqual(sum(ids, []), expected)
+
+            previous = pagination.proposal(schema=proposals_schema, cursor=pages[1]["prev_cursor"])
+            self.assertEqual([p["proposal_id"] for p in previous["items"]], ids[0])
+
+
+class TestPaginationTotals(BaseProposalCreatorConfig):
+    def add_comments(self, count):
+        for i in range(count):
+            db.session.add(Comment(proposal_id=self._proposal_id, user_id=self.user.id, parent_comment_id=None,
+                                   content=str(i)))
+        db.session.commit()
+
+    def get_comments(self, **query_string):
+        with self.record_statements() as statements:
+            resp = self.app.get(f"/api/v1/proposals/{self._proposal_id}/comments", query_string=query_string)
+        self.assert200(resp)
+        counts = [s for s in statements if s.startswith("SELECT count(*)")]
+        return resp.json, len(counts)
+
+    def test_total_is_cached_until_table_changes(self):
+        self.add_comments(12)
+
+        page, counts = self.get_comments()
+        self.assertEqual((page["total"], counts), (12, 1))
+        self.assertFalse(page["totalEstimated"])
+
+        page, counts = self.get_comments(page=2)
+        self.assertEqual((page["total"], counts), (12, 0))
+
+        self.add_comments(1)
+        page, counts = self.get_comments()
+        self.assertEqual((page["total"], counts), (13, 1))
+
+    def test_total_cache_is_keyed_by_query(self):
+        self.add_comments(12)
+        for i in range(15):
+            db.session.add(Comment(proposal_id=self._other_proposal_id, user_id=self.user.id, parent_comment_id=None,
+                                   content=str(i)))
+        db.session.commit()
+
+        page, counts = self.get_comments()
+        self.assertEqual((page["total"], counts), (12, 1))
+        with self.record_statements() as statements:
+            resp = self.app.get(f"/api/v1/proposals/{self._other_proposal_id}/comments")
+        self.assertEqual(resp.json["total"], 15)
+        self.assertEqual(len([s for s in statements if s.startswith("SELECT count(*)")]), 1)
+
+    def test_estimated_total_falls_back_to_count(self):
+        self.add_comments(12)
+        page, counts = self.get_comments(estimateTotal="true")
+        # planner estimates are postgres only and need a large table
+        self.assertEqual(page["total"], 12)
+        self.assertFalse(page["totalEstimated"])
+
+    def test_estimate_ignores_eager_loads(self):
+        query = eager(ProposalContribution.query, admin_proposal_contributions_schema, ProposalContribution)
+        self.assertIn("JOIN", str(query.statement))
+        self.assertEqual(estimable_table(query), "proposal_contribution")
+        self.assertIsNone(estimable_table(query.filter(ProposalContribution.amount == "1")))
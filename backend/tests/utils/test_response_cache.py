@@ -0,0 +1,72 @@
+import datetime
+
+from grant.proposal.models import Proposal, db
+from grant.rfp.models import RFP
+from grant.utils.enums import ProposalStatus, ProposalStage, RFPStatus
+from ..config import BaseProposalCreatorConfig
+
+
+class TestResponseCache(BaseProposalCreatorConfig):
+    def get(self, url):
+        with self.record_statements() as statements:
+            resp = self.app.get(url)
+        self.assert200(resp)
+        return resp.json, len(statements)
+
+    def live_rfp(self, title):
+        rfp = RFP(
+            title=title,
+            brief="brief",
+            content="content",
+            date_closes=datetime.datetime(2030, 1, 1),
+            bounty="10",
+            status=RFPStatus.LIVE,
+        )
+        db.session.add(rfp)
+        return rfp
+
+    def test_rfp_list_is_cached_until_an_rfp_changes(self):
+        self.live_rfp("first")
+        db.session.commit()
+
+        rfps, statements = self.get("/api/v1/rfps")
+        self.assertEqual([r["title"] for r in rfps], ["first"])
+        self.assertGreater(statements, 0)
+
+        rfps, statements = self.get("/api/v1/rfps")
+        self.assertEqual([r["title"] for r in rfps], ["first"])
+        self.assertEqual(statements, 0)
+
+        # commit in the client's app, as a request changing an RFP would
+        with self.app.application.app_context():
+            self.live_rfp("second")
+            db.session.commit()
+        rfps, statements = self.get("/api/v1/rfps")
+        self.assertEqual(sorted(r["title"] for r in rfps), ["first", "second"])
+
+    def test_home_is_invalidated_by_cancel(self):
+        proposal = Proposal.create(status=ProposalStatus.LIVE, title="Listed", stage=ProposalStage.WIP)
+        db.session.add(proposal)
+        db.session.commit()
+        proposal_id = proposal.id
+
+        home, _ = self.get("/api/v1/home/latest")
+        self.assertEqual([p["proposalId"] for p in home["latestProposals"]], [proposal_id])
+        _, statements = self.get("/api/v1/home/latest")
+        self.assertEqual(statements, 0)
+
+        with self.app.application.app_context():
+            Proposal.query.get(proposal_id).cancel()
+            db.session.commit()
+        home, _ = self.get("/api/v1/home/latest")
+        self.assertEqual(home["latestProposals"], [])
+
+    def test_authed_users_are_not_served_from_cache(self):
+        self.live_rfp("first")
+        db.session.commit()
+        self.get("/api/v1/rfps")
+
+        self.login_default_user()
+        rfps, statements = self.get("/api/v1/rfps")
+        self.assertGreater(statements, 0)
+        self.assertFalse(rfps[0]["authedLiked"])
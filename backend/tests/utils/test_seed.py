@@ -0,0 +1,44 @@
+from grant.comment.models import Comment
+from grant.proposal.models import Proposal, ProposalContribution, ProposalFunding
+from grant.search.models import SearchDocument
+from grant.user.models import User
+from grant.utils.enums import ProposalStage
+from grant.utils.seed import BulkSeeder, parse_weights
+
+from ..config import BaseTestConfig
+
+
+class TestBulkSeeder(BaseTestConfig):
+    def seed(self, **kwargs):
+        options = dict(users=5, proposals=7, stages=parse_weights("WIP:1,COMPLETED:1"), contributions=3,
+                       comments=6, comment_depth=2, reply_rate=0.8, followers=2, batch_size=3, password="loadtest")
+        options.update(kwargs)
+        return BulkSeeder(**options).run(log=lambda message: None)
+
+    def test_seeds_a_consistent_dataset(self):
+        totals = self.seed()
+        self.assertEqual(User.query.count(), 5)
+        self.assertEqual(Proposal.query.count(), 7)
+        self.assertEqual(Comment.query.count(), totals["comments"])
+        self.assertEqual(ProposalContribution.query.count(), totals["contributions"])
+        self.assertTrue(all(p.stage in (ProposalStage.WIP, ProposalStage.COMPLETED) for p in Proposal.query))
+        self.assertEqual(SearchDocument.query.count(), 5 + 7 + totals["comments"])
+
+        # the ledger agrees with the contributions it was written from
+        totals = ProposalFunding.calculate([p.id for p in Proposal.query])
+        for funding in ProposalFunding.query:
+            self.assertTrue(funding.matches(totals[funding.proposal_id]))
+
+        # replies stay within the depth limit
+        parents = {c.id: c.parent_comment_id for c in Comment.query}
+        for comment_id in parents:
+            depth, parent = 0, parents[comment_id]
+            while parent:
+                depth, parent = depth + 1, parents[parent]
+            self.assertLessEqual(depth, 2)
+
+    def test_seeding_again_allocates_new_ids(self):
+        self.seed()
+        self.seed(users=0)
+        self.assertEqual(User.query.count(), 5)
+        self.assertEqual(Proposal.query.count(), 14)